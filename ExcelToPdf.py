@@ -1,9 +1,31 @@
 import os
-import win32com.client as win32
 import sys
 import re
+import io
+import csv
 import time
 import json
+import errno
+import queue
+import bisect
+import math
+import random
+import shutil
+import signal
+import socket
+import string
+import hashlib
+import zipfile
+import argparse
+import tempfile
+import threading
+import subprocess
+import functools
+import contextvars
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
 
 # ==========================================
 # ЦВЕТА КОНСОЛИ (ANSI)
@@ -63,143 +85,3772 @@ def get_clean_path(prompt_text, saved_path=None):
     except EOFError:
         return ""
 
+class IntervalSet:
+    """
+    Множество номеров в виде объединённых отсортированных интервалов.
+    Проверка вхождения - бинарный поиск, без разворачивания диапазона
+    в список. Поддерживает открытые интервалы (конец - бесконечность),
+    интервалы с шагом и исключения.
+    """
+
+    def __init__(self, includes=(), excludes=()):
+        self._starts, self._ends, self._stepped = self._normalize(includes)
+        self._ex_starts, self._ex_ends, self._ex_stepped = self._normalize(excludes)
+
+    @staticmethod
+    def _normalize(items):
+        plain = sorted((start, end) for start, end, step in items if step == 1)
+        stepped = [(start, end, step) for start, end, step in items if step != 1]
+        starts, ends = [], []
+        for start, end in plain:
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        return starts, ends, stepped
+
+    @staticmethod
+    def _member(starts, ends, stepped, number):
+        i = bisect.bisect_right(starts, number) - 1
+        if i >= 0 and number <= ends[i]:
+            return True
+        return any(start <= number <= end and (number - start) % step == 0
+                   for start, end, step in stepped)
+
+    def __contains__(self, number):
+        return self._member(self._starts, self._ends, self._stepped, number) and \
+            not self._member(self._ex_starts, self._ex_ends, self._ex_stepped, number)
+
+    def _first(self, start, end, step):
+        """
+        Первый неисключённый номер прогрессии start, start + step, ... <= end
+        или None. Границы исключений делят прогрессию на отрезки: в каждом
+        отрезок либо целиком закрыт обычным исключением, либо его закрывают
+        только исключения с шагом. Пересечение прогрессий ищется по китайской
+        теореме об остатках, поэтому перебираются остатки по модулю их общего
+        периода, а не номера диапазона.
+        """
+        bounds = {start}
+        for ex_start, ex_end in zip(self._ex_starts, self._ex_ends):
+            bounds.update((ex_start, ex_end + 1))
+        for ex_start, ex_end, _ in self._ex_stepped:
+            bounds.update((ex_start, ex_end + 1))
+        bounds = sorted(b for b in bounds if start <= b <= end and b != float("inf"))
+        for i, low in enumerate(bounds):
+            high = bounds[i + 1] - 1 if i + 1 < len(bounds) else end
+            first = start + -(-(low - start) // step) * step
+            if first > high:
+                continue
+            j = bisect.bisect_right(self._ex_starts, first) - 1
+            if j >= 0 and first <= self._ex_ends[j]:
+                continue
+            # Исключение с шагом закрывает номера first + k * step с k = c (mod m)
+            classes = []
+            period = 1
+            for ex_start, ex_end, ex_step in self._ex_stepped:
+                if not ex_start <= first <= ex_end:
+                    continue
+                g = math.gcd(step, ex_step)
+                if (ex_start - first) % g:
+                    continue
+                m = ex_step // g
+                c = (ex_start - first) // g * pow(step // g, -1, m) % m if m > 1 else 0
+                classes.append((m, c))
+                period = period * m // math.gcd(period, m)
+            count = period if high == float("inf") else min(period, (high - first) // step + 1)
+            for k in range(count):
+                if all(k % m != c for m, c in classes):
+                    return first + k * step
+        return None
+
+    def _next(self, number):
+        """Наименьший номер множества не меньше number или None."""
+        found = []
+        for start, end, step in self._intervals():
+            first = start + max(0, -(-(number - start) // step)) * step
+            if first <= end:
+                found.append(self._first(first, end, step))
+        return min((n for n in found if n is not None), default=None)
+
+    def _intervals(self):
+        yield from ((start, end, 1) for start, end in zip(self._starts, self._ends))
+        yield from self._stepped
+
+    def __bool__(self):
+        return any(self._first(*interval) is not None for interval in self._intervals())
+
+    def is_finite(self):
+        return all(end != float("inf") for _, end, _ in self._intervals())
+
+    def __iter__(self):
+        """Номера по возрастанию (только для конечного множества)."""
+        if not self.is_finite():
+            raise ValueError("диапазон не ограничен сверху")
+        number = self._next(min(self._starts + [start for start, _, _ in self._stepped], default=0))
+        while number is not None:
+            yield number
+            number = self._next(number + 1)
+
+    def filter_sorted(self, numbers):
+        """
+        Выбирает из отсортированного списка существующих номеров входящие
+        в множество: для каждого интервала срез ищется бинарным поиском.
+        """
+        selected = []
+        for start, end, step in self._intervals():
+            lo = bisect.bisect_left(numbers, start)
+            hi = bisect.bisect_right(numbers, end) if end != float("inf") else len(numbers)
+            selected.extend(n for n in numbers[lo:hi] if (n - start) % step == 0 and n in self)
+        return sorted(set(selected)) if self._stepped else selected
+
+    def __str__(self):
+        def fmt(start, end, step):
+            text = str(start) if start == end else \
+                f"{start}-" if end == float("inf") else f"{start}-{end}"
+            return text + (f"/{step}" if step != 1 else "")
+
+        parts = [fmt(*interval) for interval in self._intervals()]
+        parts += ["!" + fmt(start, end, 1) for start, end in zip(self._ex_starts, self._ex_ends)]
+        parts += ["!" + fmt(*interval) for interval in self._ex_stepped]
+        return ",".join(parts)
+
+    def __repr__(self):
+        return f"IntervalSet('{self}')"
+
+
 def parse_range(range_str):
-    """Парсит строку диапазона (например, '1-3, 5') в список чисел."""
-    ranges = []
+    """
+    Парсит строку диапазона в IntervalSet. Элементы через запятую:
+    '3550' - номер, '3550-3553' - интервал, '3550-' - от номера и выше,
+    '3550-3600/2' - интервал с шагом, '!3555' или '!3555-3557' - исключение.
+    """
+    includes, excludes = [], []
     for part in range_str.split(','):
         part = part.strip()
         if not part:
             continue
-        if '-' in part:
+        target = includes
+        if part.startswith('!'):
+            target = excludes
+            part = part[1:].strip()
+        try:
+            body, _, step_str = part.partition('/')
+            step = int(step_str) if step_str else 1
+            if step < 1:
+                raise ValueError
+            if '-' in body:
+                start_str, end_str = (x.strip() for x in body.split('-', 1))
+                start = int(start_str)
+                end = int(end_str) if end_str else float("inf")
+                if start > end:
+                    print(f"⚠ Предупреждение: Неверный диапазон '{part}'.")
+                    continue
+            else:
+                start = end = int(body)
+            target.append((start, end, step))
+        except ValueError:
+            print(f"⚠ Предупреждение: Неверный формат диапазона '{part}'.")
+    return IntervalSet(includes, excludes)
+
+# ==========================================
+# ЗАМЕРЫ ЭТАПОВ
+# ==========================================
+
+_stages = threading.local()
+
+@contextmanager
+def collect_stages():
+    """
+    Собирает длительности этапов, выполненных в текущем потоке.
+    Время вложенного этапа не входит во время внешнего. При ошибке
+    собранные замеры прикрепляются к исключению (атрибут timings).
+    """
+    timings = {}
+    _stages.stack = []
+    _stages.timings = timings
+    try:
+        yield timings
+    except Exception as e:
+        try:
+            e.timings = timings
+        except Exception:
+            pass
+        raise
+    finally:
+        _stages.stack = None
+
+@contextmanager
+def stage(name):
+    """Замеряет этап name, если в потоке идёт сбор замеров."""
+    stack = getattr(_stages, "stack", None)
+    if stack is None:
+        yield
+        return
+    frame = [0.0]
+    stack.append(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        _stages.timings[name] = _stages.timings.get(name, 0.0) + elapsed - frame[0]
+
+def percentile(values, q):
+    """Перцентиль q (0-100) методом ближайшего ранга."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(-(-q * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+# ==========================================
+# КОНВЕРТЕРЫ (BACKEND)
+# ==========================================
+
+class ConversionError(Exception):
+    """Ошибка конвертации конкретного файла (файл пропускается)."""
+
+
+class MissingSheetsError(ConversionError):
+    """В книге нет листов, нужных профилю."""
+
+
+class InvalidWorkbookError(ConversionError):
+    """Файл повреждён или не является книгой Excel."""
+
+
+@dataclass
+class SheetInfo:
+    index: int
+    name: str
+    visible: bool
+
+
+class Backend:
+    """
+    Интерфейс движка конвертации. Каждый воркер пула владеет своим экземпляром.
+    Реализация предоставляет операции над книгой, а сценарий экспорта
+    (выбор листов, области печати) общий - convert_workbook.
+    """
+
+    name = "base"
+
+    def start(self):
+        """Запускает движок конвертации."""
+
+    def close(self):
+        """Останавливает движок конвертации."""
+
+    def pid(self):
+        """PID процесса движка или None, если движок работает внутри Python."""
+        return None
+
+    def kill(self):
+        """Принудительно завершает движок (вызывается из другого потока)."""
+        pid = self.pid()
+        if pid:
+            kill_process(pid)
+
+    def alive(self):
+        """Проверяет, что движок отвечает."""
+        return True
+
+    def memory_mb(self):
+        """Резидентная память процесса движка в МБ или None."""
+        pid = self.pid()
+        return process_memory_mb(pid) if pid else None
+
+    def open_workbook(self, file_path):
+        """Открывает книгу только для чтения и возвращает её дескриптор."""
+        raise NotImplementedError
+
+    def list_sheets(self, wb):
+        """Возвращает список SheetInfo в порядке листов книги."""
+        raise NotImplementedError
+
+    def read_cell(self, wb, sheet, cell):
+        """Возвращает значение ячейки листа."""
+        raise NotImplementedError
+
+    def read_named_range(self, wb, sheet, name):
+        """Возвращает адрес именованного диапазона (уровня листа или книги)."""
+        raise NotImplementedError
+
+    def get_print_area(self, wb, sheet):
+        """Текущая область печати листа; set_print_area с этим значением её восстанавливает."""
+        raise NotImplementedError
+
+    def set_print_area(self, wb, sheet, area):
+        """Задаёт область печати листа."""
+        raise NotImplementedError
+
+    def export_pdf(self, wb, sheets, pdf_path):
+        """Экспортирует выбранные листы в один PDF."""
+        raise NotImplementedError
+
+    def close_workbook(self, wb):
+        """Закрывает книгу без сохранения."""
+
+    def convert(self, file_path, outputs, plan=None):
+        """
+        Конвертирует книгу в PDF по списку outputs [(профиль, путь PDF), ...].
+        plan - WorkbookPlan предварительного анализа (листы и области печати
+        уже известны) или None. Возвращает словарь с экспортированными листами
+        и областями печати; при ошибке выбрасывает исключение.
+        """
+        return convert_workbook(self, file_path, outputs, plan)
+
+
+class ComBackend(Backend):
+    """Конвертация через установленный Excel (win32com)."""
+
+    name = "com"
+
+    XL_SHEET_VISIBLE = -1
+
+    def __init__(self):
+        self.excel = None
+        self._pid = None
+        self._com_initialized = False
+
+    def start(self):
+        import pythoncom
+        import win32com.client as win32
+
+        # Каждый поток-воркер работает со своим Excel в своём COM-апартаменте
+        pythoncom.CoInitialize()
+        self._com_initialized = True
+        self.excel = win32.DispatchEx('Excel.Application')
+        self.excel.Visible = False
+        self.excel.DisplayAlerts = False
+        try:
+            import win32process
+            self._pid = win32process.GetWindowThreadProcessId(self.excel.Hwnd)[1]
+        except Exception:
+            self._pid = None
+
+    def pid(self):
+        return self._pid
+
+    def alive(self):
+        try:
+            return bool(self.excel and self.excel.Version)
+        except Exception:
+            return False
+
+    def close(self):
+        if self.excel:
+            try:
+                self.excel.Quit()
+            except Exception:
+                pass
+            self.excel = None
+        if self._com_initialized:
+            import pythoncom
+            pythoncom.CoUninitialize()
+            self._com_initialized = False
+
+    def open_workbook(self, file_path):
+        return self.excel.Workbooks.Open(file_path, ReadOnly=True)
+
+    def list_sheets(self, wb):
+        return [
+            SheetInfo(i, sheet.Name, sheet.Visible == self.XL_SHEET_VISIBLE)
+            for i, sheet in enumerate(wb.Sheets, start=1)
+        ]
+
+    def read_cell(self, wb, sheet, cell):
+        return wb.Sheets(sheet.index).Range(cell).Value
+
+    def read_named_range(self, wb, sheet, name):
+        try:
+            refers_to = wb.Sheets(sheet.index).Names(name).RefersTo
+        except Exception:
+            refers_to = wb.Names(name).RefersTo
+        return refers_to.lstrip("=").split("!")[-1]
+
+    def get_print_area(self, wb, sheet):
+        return wb.Sheets(sheet.index).PageSetup.PrintArea
+
+    def set_print_area(self, wb, sheet, area):
+        # Пустая строка снимает область печати
+        wb.Sheets(sheet.index).PageSetup.PrintArea = area
+
+    def export_pdf(self, wb, sheets, pdf_path):
+        with stage("select"):
+            wb.Sheets(sheets[0].index).Select()
+            for sheet in sheets[1:]:
+                wb.Sheets(sheet.index).Select(False)
+        wb.ActiveSheet.ExportAsFixedFormat(0, pdf_path)
+
+    def close_workbook(self, wb):
+        try:
+            wb.Close(SaveChanges=False)
+        except Exception:
+            pass
+
+
+class _XlsxWorkbook:
+    """Открытая для LibreOffice книга: исходный zip и заданные области печати."""
+
+    def __init__(self, path, source_path):
+        self.path = path
+        self.source_path = source_path
+        self.sheets = xlsx_list_sheets(path)
+        self.defined_names = None
+        self.print_areas = {}
+
+
+class _XlsxReader:
+    """Чтение листов, ячеек, имён и областей печати _XlsxWorkbook без Excel."""
+
+    def list_sheets(self, wb):
+        return [
+            SheetInfo(i, entry["name"], entry["state"] == "visible")
+            for i, entry in enumerate(wb.sheets, start=1)
+        ]
+
+    def read_cell(self, wb, sheet, cell):
+        return xlsx_read_cell(wb.path, wb.sheets[sheet.index - 1]["path"], cell)
+
+    def read_named_range(self, wb, sheet, name):
+        if wb.defined_names is None:
+            wb.defined_names = xlsx_defined_names(wb.path)
+        local = [d for d in wb.defined_names
+                 if d["name"] == name and d["local_sheet"] == sheet.index - 1]
+        found = local or [d for d in wb.defined_names
+                          if d["name"] == name and d["local_sheet"] is None]
+        return found[0]["refers_to"].split("!")[-1] if found else None
+
+    def get_print_area(self, wb, sheet):
+        # None - область печати из файла (копия для экспорта её не меняет)
+        return wb.print_areas.get(sheet.index)
+
+    def set_print_area(self, wb, sheet, area):
+        if area is None:
+            wb.print_areas.pop(sheet.index, None)
+        else:
+            wb.print_areas[sheet.index] = area
+
+
+def free_port():
+    """Свободный TCP-порт на localhost: его выбирает ОС при bind на порт 0."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LibreOfficeBackend(_XlsxReader, Backend):
+    """
+    Безголовая конвертация через LibreOffice для Linux-серверов.
+    Листы и ячейки читаются прямо из xlsx, выбор листов и области печати
+    записываются в копию workbook.xml, затем копия экспортируется soffice.
+    Если установлен unoserver, держится один долгоживущий процесс
+    LibreOffice на воркер; иначе каждый вызов soffice использует
+    постоянный профиль воркера, чтобы не платить за его инициализацию.
+    """
+
+    name = "libreoffice"
+
+    def __init__(self, soffice="soffice", ready_timeout=60):
+        self.soffice = soffice
+        self.ready_timeout = ready_timeout
+        self.workdir = None
+        self.server = None
+        self.port = None
+        self._proc = None
+
+    def start(self):
+        if not shutil.which(self.soffice):
+            raise ConversionError(f"LibreOffice не найден: {self.soffice}")
+        self.workdir = tempfile.mkdtemp(prefix="excel2pdf_lo_")
+
+        if shutil.which("unoserver") and shutil.which("unoconvert"):
+            # Порт мог занять другой процесс между выбором и запуском: пробуем заново
+            for _ in range(3):
+                self.port, uno_port = free_port(), free_port()
+                self.server = subprocess.Popen(
+                    ["unoserver", "--executable", shutil.which(self.soffice),
+                     "--port", str(self.port), "--uno-port", str(uno_port)],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+                if self._wait_ready():
+                    return
+            self.close()
+            raise ConversionError("unoserver не запустился")
+
+    def _wait_ready(self):
+        """Ждёт, пока unoserver начнёт принимать соединения; False - процесс завершился."""
+        deadline = time.monotonic() + self.ready_timeout
+        while self.server.poll() is None:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                return True
+            except OSError:
+                if time.monotonic() > deadline:
+                    self.close()
+                    raise EngineTimeout(f"unoserver не ответил за {self.ready_timeout} с")
+                time.sleep(0.2)
+        self.server = None
+        return False
+
+    def close(self):
+        if self.server:
+            self.server.terminate()
+            try:
+                self.server.wait(timeout=10)
+            except Exception:
+                self.server.kill()
+            self.server = None
+        if self.workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+    def pid(self):
+        if self.server:
+            return self.server.pid
+        return self._proc.pid if self._proc else None
+
+    def kill(self):
+        for proc in (self._proc, self.server):
+            if proc:
+                try:
+                    proc.kill()
+                except OSError:
+                    pass
+
+    def alive(self):
+        return self.server is None or self.server.poll() is None
+
+    def _run(self, args):
+        self._proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        try:
+            output, _ = self._proc.communicate()
+        finally:
+            returncode = self._proc.returncode
+            self._proc = None
+        if returncode != 0:
+            output = output.decode(errors="replace").strip()
+            raise ConversionError(f"LibreOffice завершился с кодом {returncode}: {output}")
+
+    def _soffice_convert(self, src, fmt, outdir):
+        profile = "file://" + os.path.join(self.workdir, "profile").replace("\\", "/")
+        self._run([
+            self.soffice, f"-env:UserInstallation={profile}",
+            "--headless", "--convert-to", fmt, "--outdir", outdir, src
+        ])
+        return os.path.join(outdir, os.path.splitext(os.path.basename(src))[0] + "." + fmt)
+
+    def open_workbook(self, file_path):
+        path = file_path
+        if file_path.lower().endswith(".xls"):
+            # Старый двоичный формат сначала переводится в xlsx
+            path = self._soffice_convert(file_path, "xlsx", self.workdir)
+        return _XlsxWorkbook(path, file_path)
+
+    def export_pdf(self, wb, sheets, pdf_path):
+        stem = f"export_{threading.get_ident()}"
+        staged = os.path.join(self.workdir, stem + ".xlsx")
+        xlsx_write_export_copy(wb.path, staged, [s.index for s in sheets], wb.print_areas)
+
+        if self.server:
+            produced = os.path.join(self.workdir, stem + ".pdf")
+            self._run(["unoconvert", "--port", str(self.port), staged, produced])
+        else:
+            produced = self._soffice_convert(staged, "pdf", self.workdir)
+        shutil.move(produced, pdf_path)
+        os.remove(staged)
+
+    def close_workbook(self, wb):
+        if wb.path != wb.source_path:
+            try:
+                os.remove(wb.path)
+            except OSError:
+                pass
+
+
+class StubBackend(Backend):
+    """Заглушка для проверки пула без Excel: имитирует задержку и сбои."""
+
+    name = "stub"
+
+    def __init__(self, latency=0.05, jitter=0.5, failure_rate=0.0, seed=None,
+                 hang_rate=0.0, leak_mb_per_file=0.0, busy_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.busy_rate = busy_rate
+        self.leak_mb_per_file = leak_mb_per_file
+        self._random = random.Random(seed)
+        self._killed = threading.Event()
+        self._files = 0
+
+    def kill(self):
+        self._killed.set()
+
+    def alive(self):
+        return not self._killed.is_set()
+
+    def memory_mb(self):
+        return 50 + self._files * self.leak_mb_per_file
+
+    def convert(self, file_path, outputs, plan=None):
+        self._files += 1
+        with collect_stages() as timings:
+            if self._random.random() < self.hang_rate:
+                # Имитация зависшего движка: ждём, пока watchdog его не завершит
+                self._killed.wait(3600)
+                raise ConversionError("движок завершён")
+            with stage("export"):
+                delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+                time.sleep(max(delay, 0))
+                if self._random.random() < self.failure_rate:
+                    raise ConversionError("имитация сбоя конвертации")
+                if self._random.random() < self.busy_rate:
+                    raise ConversionError("Call was rejected by callee. (-2147418111)")
+                for mode, pdf_path in outputs:
+                    with open(pdf_path, "wb") as f:
+                        f.write(stub_pdf_bytes(f"{os.path.basename(file_path)} [{mode}]"))
+        return {"sheets": {}, "print_areas": {}, "sheet_count": 0, "timings": timings}
+
+
+def stub_pdf_bytes(text):
+    """Минимальный корректный одностраничный PDF с текстом (для заглушки)."""
+    text = text.encode("ascii", "replace").replace(b"\\", b"\\\\") \
+        .replace(b"(", b"\\(").replace(b")", b"\\)")
+    content = b"BT /F1 14 Tf 72 770 Td (" + text + b") Tj ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length " + str(len(content)).encode() + b" >>\nstream\n" + content + b"\nendstream",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += str(number).encode() + b" 0 obj\n" + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 " + str(len(objects) + 1).encode() + b"\n0000000000 65535 f \n"
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size " + str(len(objects) + 1).encode() + b" /Root 1 0 R >>\n"
+    out += b"startxref\n" + str(xref).encode() + b"\n%%EOF\n"
+    return bytes(out)
+
+# ==========================================
+# УПРАВЛЯЕМЫЙ ДВИЖОК (WATCHDOG И ПЕРЕЗАПУСК)
+# ==========================================
+
+ENGINE_LOG_FILE = "engine.log"
+
+def log_event(message, console=True):
+    """Выводит событие движка и дописывает его в engine.log."""
+    if console:
+        print(message)
+    try:
+        with open(ENGINE_LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} "
+                    f"[{threading.current_thread().name}] {message}\n")
+    except OSError:
+        pass
+
+def kill_process(pid):
+    """Принудительно завершает процесс по PID."""
+    try:
+        os.kill(pid, signal.SIGTERM if os.name == "nt" else signal.SIGKILL)
+    except OSError:
+        pass
+
+def process_memory_mb(pid):
+    """Резидентная память процесса в МБ (psutil или /proc), иначе None."""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class EngineTimeout(ConversionError):
+    """Движок не ответил за отведённое время."""
+
+
+class _EngineThread:
+    """
+    Поток, которому принадлежит движок: все вызовы движка выполняются в нём
+    (COM-объекты привязаны к своему потоку), а вызывающий ждёт с таймаутом.
+    """
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                request = self.requests.get()
+                if request is None:
+                    break
+                func, reply = request
+                try:
+                    reply.put((True, func()))
+                except BaseException as e:
+                    reply.put((False, e))
+        finally:
+            try:
+                self.backend.close()
+            except Exception:
+                pass
+
+    def call(self, func, timeout):
+        reply = queue.Queue(maxsize=1)
+        # Вызов выполняется в контексте вызывающего (например, с его профилями)
+        self.requests.put((functools.partial(contextvars.copy_context().run, func), reply))
+        try:
+            ok, value = reply.get(timeout=timeout)
+        except queue.Empty:
+            raise EngineTimeout(f"движок не ответил за {timeout} с")
+        if not ok:
+            raise value
+        return value
+
+    def stop(self, timeout):
+        self.requests.put(None)
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+
+class ManagedBackend(Backend):
+    """
+    Обёртка движка с таймаутом на файл и перезапуском. Зависший движок
+    принудительно завершается и заменяется новым, прерванный файл
+    повторяется на свежем движке. Движок также перезапускается после
+    recycle_after_files файлов или при превышении recycle_above_mb памяти.
+    attempts - число запусков файла на движке при последнем convert.
+    """
+
+    name = "managed"
+
+    def __init__(self, backend_factory, timeout=300, start_timeout=120, retries=1,
+                 recycle_after_files=0, recycle_above_mb=0):
+        self.backend_factory = backend_factory
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.retries = retries
+        self.recycle_after_files = recycle_after_files
+        self.recycle_above_mb = recycle_above_mb
+        self.engine = None
+        self.files = 0
+        self.generation = 0
+        self.attempts = 0
+
+    @property
+    def inner(self):
+        return self.engine.backend if self.engine else None
+
+    def start(self):
+        self._spawn()
+
+    def close(self):
+        if self.engine:
+            if not self.engine.stop(self.start_timeout):
+                self.engine.backend.kill()
+            self.engine = None
+
+    def pid(self):
+        return self.inner.pid() if self.engine else None
+
+    def memory_mb(self):
+        return self.inner.memory_mb() if self.engine else None
+
+    def _spawn(self):
+        self.generation += 1
+        name = f"{threading.current_thread().name}-engine-{self.generation}"
+        self.engine = _EngineThread(self.backend_factory(), name)
+        self.files = 0
+        try:
+            self.engine.call(self.engine.backend.start, self.start_timeout)
+        except BaseException:
+            self._kill()
+            raise
+
+    def _kill(self):
+        engine, self.engine = self.engine, None
+        if engine:
+            engine.backend.kill()
+            engine.requests.put(None)
+
+    def _recycle_if_needed(self):
+        reason = None
+        memory = self.memory_mb()
+        if memory is not None:
+            log_event(f"   📈 Память движка: {memory:.0f} МБ после {self.files} файлов", console=False)
+        if self.recycle_after_files and self.files >= self.recycle_after_files:
+            reason = f"обработано файлов: {self.files}"
+        elif self.recycle_above_mb and memory is not None and memory >= self.recycle_above_mb:
+            reason = f"память {memory:.0f} МБ >= {self.recycle_above_mb} МБ"
+        if reason:
+            log_event(f"   ♻ Перезапуск движка ({reason})")
+            self.close()
+
+    def convert(self, file_path, outputs, plan=None):
+        attempt = 0
+        while True:
+            self.attempts = attempt + 1
+            if self.engine is None:
+                self._spawn()
+            backend = self.engine.backend
+            try:
+                result = self.engine.call(
+                    lambda: backend.convert(file_path, outputs, plan), self.timeout
+                )
+            except EngineTimeout as e:
+                log_event(f"   ⏱ Таймаут {os.path.basename(file_path)}: {e}; движок завершён")
+                self._kill()
+                if attempt < self.retries:
+                    attempt += 1
+                    log_event(f"   🔁 Повтор {os.path.basename(file_path)} на новом движке")
+                    continue
+                raise
+            except Exception:
+                # Ошибка файла или падение движка: упавший движок заменяется
+                try:
+                    alive = self.engine.call(backend.alive, self.start_timeout)
+                except EngineTimeout:
+                    alive = False
+                if not alive:
+                    log_event("   💥 Движок не отвечает после ошибки, перезапуск")
+                    self._kill()
+                    if attempt < self.retries:
+                        attempt += 1
+                        continue
+                raise
+
+            self.files += 1
+            self._recycle_if_needed()
+            return result
+
+
+BACKENDS = {
+    ComBackend.name: ComBackend,
+    LibreOfficeBackend.name: LibreOfficeBackend,
+    StubBackend.name: StubBackend,
+}
+
+def create_backend_factory(config):
+    """
+    Возвращает фабрику движков по конфигурации:
+    "backend" - com / libreoffice / stub (по умолчанию com на Windows),
+    "backend_options" - параметры конструктора движка,
+    "engine" - параметры ManagedBackend (timeout, retries, recycle_after_files,
+    recycle_above_mb); "engine": false отключает watchdog.
+    """
+    default = ComBackend.name if os.name == "nt" else LibreOfficeBackend.name
+    name = config.get("backend", default)
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный движок конвертации: {name}")
+    backend_cls = BACKENDS[name]
+    options = config.get("backend_options", {})
+    factory = lambda: backend_cls(**options)
+
+    engine = config.get("engine", {})
+    if engine is False:
+        return factory
+    return lambda: ManagedBackend(factory, **engine)
+
+# ==========================================
+# ЧТЕНИЕ XLSX БЕЗ EXCEL
+# ==========================================
+
+XLSX_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+XLSX_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+XLSX_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+def _xlsx_part_path(target):
+    """Приводит Target из workbook.xml.rels к имени части в zip."""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return "xl/" + target
+
+def xlsx_list_sheets(path):
+    """Возвращает листы xlsx/xlsm: имя, состояние видимости и часть zip."""
+    with zipfile.ZipFile(path) as zf:
+        rels = {}
+        with zf.open("xl/_rels/workbook.xml.rels") as f:
+            for rel in ET.parse(f).getroot().iter(f"{{{XLSX_PKG_REL_NS}}}Relationship"):
+                rels[rel.get("Id")] = _xlsx_part_path(rel.get("Target"))
+
+        sheets = []
+        with zf.open("xl/workbook.xml") as f:
+            for _, elem in ET.iterparse(f):
+                if elem.tag == f"{{{XLSX_MAIN_NS}}}sheet":
+                    sheets.append({
+                        "name": elem.get("name"),
+                        "state": elem.get("state", "visible"),
+                        "path": rels.get(elem.get(f"{{{XLSX_REL_NS}}}id")),
+                    })
+                elif elem.tag == f"{{{XLSX_MAIN_NS}}}sheets":
+                    break
+        return sheets
+
+def xlsx_defined_names(path):
+    """Возвращает именованные диапазоны книги: имя, номер листа (или None), адрес."""
+    names = []
+    with zipfile.ZipFile(path) as zf:
+        with zf.open("xl/workbook.xml") as f:
+            for _, elem in ET.iterparse(f):
+                if elem.tag == f"{{{XLSX_MAIN_NS}}}definedName":
+                    local = elem.get("localSheetId")
+                    names.append({
+                        "name": elem.get("name"),
+                        "local_sheet": int(local) if local is not None else None,
+                        "refers_to": (elem.text or "").lstrip("="),
+                    })
+    return names
+
+def _xlsx_shared_string(zf, index):
+    """Потоково читает строку с номером index из sharedStrings.xml."""
+    position = 0
+    with zf.open("xl/sharedStrings.xml") as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag == f"{{{XLSX_MAIN_NS}}}si":
+                if position == index:
+                    return "".join(t.text or "" for t in elem.iter(f"{{{XLSX_MAIN_NS}}}t"))
+                position += 1
+                elem.clear()
+    return None
+
+def xlsx_read_cell(path, sheet_path, cell):
+    """Потоково читает значение одной ячейки листа xlsx."""
+    cell = cell.replace("$", "").upper()
+    row_number = re.sub(r"^[A-Z]+", "", cell)
+
+    with zipfile.ZipFile(path) as zf:
+        with zf.open(sheet_path) as f:
+            for _, elem in ET.iterparse(f):
+                if elem.tag == f"{{{XLSX_MAIN_NS}}}c" and elem.get("r") == cell:
+                    kind = elem.get("t")
+                    if kind == "inlineStr":
+                        return "".join(t.text or "" for t in elem.iter(f"{{{XLSX_MAIN_NS}}}t"))
+                    value = elem.find(f"{{{XLSX_MAIN_NS}}}v")
+                    if value is None or value.text is None:
+                        return None
+                    if kind == "s":
+                        return _xlsx_shared_string(zf, int(value.text))
+                    return value.text
+                if elem.tag == f"{{{XLSX_MAIN_NS}}}row":
+                    # Строки идут по возрастанию: дальше искомой ячейки нет
+                    if elem.get("r") and int(elem.get("r")) >= int(row_number):
+                        return None
+                    elem.clear()
+    return None
+
+def _absolute_area(area, sheet_name):
+    """'A1:H40' -> 'Лист'!$A$1:$H$40 для definedName _xlnm.Print_Area."""
+    parts = []
+    for part in str(area).split(","):
+        part = part.strip()
+        if "!" in part:
+            parts.append(part)
+            continue
+        ref = re.sub(r"\$?([A-Za-z]+)\$?(\d+)", lambda m: f"${m.group(1).upper()}${m.group(2)}", part)
+        quoted = sheet_name.replace("'", "''")
+        parts.append(f"'{quoted}'!{ref}")
+    return ",".join(parts)
+
+def xlsx_write_export_copy(src, dst, sheet_indexes, print_areas):
+    """
+    Пишет копию книги, в которой видимы только экспортируемые листы
+    и заданы их области печати. Остальные части zip копируются как есть.
+    """
+    with zipfile.ZipFile(src) as zin:
+        with zin.open("xl/workbook.xml") as f:
+            raw = f.read()
+
+        # Сохраняем исходные префиксы пространств имён
+        for _, (prefix, uri) in ET.iterparse(io.BytesIO(raw), events=("start-ns",)):
+            ET.register_namespace(prefix, uri)
+        root = ET.fromstring(raw)
+
+        m = f"{{{XLSX_MAIN_NS}}}"
+        sheets = root.find(m + "sheets").findall(m + "sheet")
+        selected = set(sheet_indexes)
+        for i, sheet in enumerate(sheets, start=1):
+            if i in selected:
+                sheet.attrib.pop("state", None)
+            else:
+                sheet.set("state", "hidden")
+
+        view = root.find(f"{m}bookViews/{m}workbookView")
+        if view is not None:
+            view.set("activeTab", str(min(sheet_indexes) - 1))
+            view.set("firstSheet", str(min(sheet_indexes) - 1))
+
+        defined = root.find(m + "definedNames")
+        if print_areas:
+            if defined is None:
+                defined = ET.Element(m + "definedNames")
+                root.insert(list(root).index(root.find(m + "sheets")) + 1, defined)
+            for name in list(defined):
+                if name.get("name") == "_xlnm.Print_Area" and \
+                        int(name.get("localSheetId", -1)) + 1 in print_areas:
+                    defined.remove(name)
+            for index, area in print_areas.items():
+                name = ET.SubElement(defined, m + "definedName")
+                name.set("name", "_xlnm.Print_Area")
+                name.set("localSheetId", str(index - 1))
+                name.text = _absolute_area(area, sheets[index - 1].get("name"))
+
+        with zipfile.ZipFile(dst, "w", zipfile.ZIP_DEFLATED) as zout:
+            for item in zin.infolist():
+                if item.filename == "xl/workbook.xml":
+                    zout.writestr(item, ET.tostring(root, xml_declaration=True, encoding="UTF-8"))
+                else:
+                    zout.writestr(item, zin.read(item.filename))
+
+# ==========================================
+# ПРОФИЛИ ВЫВОДА
+# ==========================================
+
+# Встроенные профили; в "profiles" config.json их можно переопределить
+# (целиком или отдельные поля, например суффикс) и добавить новые.
+# Суффикс добавляется к имени PDF, когда за проход запрошено несколько профилей.
+DEFAULT_PROFILES = {
+    "invoice": {
+        "title": "Инвойс",
+        "suffix": " invoice",
+        "sheets": [{"index": 1, "required": True}],
+    },
+    "1": {
+        "title": "Инвойс и спецификация",
+        "suffix": " spec",
+        "sheets": [{"index": 1, "required": True}, {"index": 2, "required": True}],
+    },
+    "2": {
+        "title": "Инвойс, спецификация и весовой сертификат",
+        "suffix": " weight",
+        "sheets": [
+            {"index": 1, "required": True},
+            {"index": 2, "required": True},
+            {"name": "Weight certificate (LI)", "visible": True},
+            {"name": "Weight certificate (Y)", "visible": True},
+        ],
+    },
+}
+
+DEFAULT_PRINT_AREA = [{"cell": "R1"}]
+
+
+class SheetRule:
+    """
+    Правило выбора листов: по номеру ("index", с конца - отрицательный),
+    точному имени ("name") или регулярному выражению ("regex"),
+    с условием видимости ("visible") и собственным источником области печати.
+    """
+
+    def __init__(self, spec, profile_name):
+        keys = [key for key in ("index", "name", "regex") if key in spec]
+        if len(keys) != 1:
+            raise ValueError(f"Профиль {profile_name}: в правиле листа нужен ровно один "
+                             f"из ключей index/name/regex: {spec}")
+        self.kind = keys[0]
+        self.value = spec[keys[0]]
+        if self.kind == "index":
+            self.value = int(self.value)
+        elif self.kind == "regex":
+            self.value = re.compile(self.value)
+        self.visible = spec.get("visible")
+        self.required = bool(spec.get("required", False))
+        self.print_area = compile_print_area(spec["print_area"], profile_name) \
+            if "print_area" in spec else None
+
+    def match(self, sheets):
+        if self.kind == "index":
+            position = self.value - 1 if self.value > 0 else len(sheets) + self.value
+            candidates = [sheets[position]] if 0 <= position < len(sheets) else []
+        elif self.kind == "name":
+            candidates = [sheet for sheet in sheets if sheet.name == self.value]
+        else:
+            candidates = [sheet for sheet in sheets if self.value.search(sheet.name)]
+
+        if self.visible is not None:
+            candidates = [sheet for sheet in candidates if sheet.visible == self.visible]
+
+        if not candidates and self.required:
+            if self.kind == "index" and self.value > 0:
+                raise MissingSheetsError(f"В файле меньше {self.value} листов.")
+            raise MissingSheetsError(f"Не найден обязательный лист ({self.kind}: {self.value}).")
+        return candidates
+
+
+def compile_print_area(spec, profile_name):
+    """
+    Источник области печати: {"cell": "R1"}, {"named": "Имя"}, {"fixed": "A1:H40"}
+    или список таких источников (берётся первый непустой); null - не менять.
+    """
+    if spec is None:
+        return []
+    specs = spec if isinstance(spec, list) else [spec]
+    sources = []
+    for item in specs:
+        if not isinstance(item, dict) or len(item) != 1 or \
+                next(iter(item)) not in ("cell", "named", "fixed"):
+            raise ValueError(f"Профиль {profile_name}: неверный источник области печати: {item}")
+        sources.append(next(iter(item.items())))
+    return sources
+
+
+class Profile:
+    """Скомпилированный профиль вывода: правила листов, области печати, порядок."""
+
+    def __init__(self, name, spec):
+        self.name = name
+        # Отпечаток правил: манифест перестраивает PDF при их изменении
+        self.fingerprint = hashlib.sha1(
+            json.dumps(spec, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:12]
+        self.title = spec.get("title", name)
+        self.suffix = spec.get("suffix", f" {name}")
+        if not spec.get("sheets"):
+            raise ValueError(f"Профиль {name}: не заданы правила листов 'sheets'")
+        self.rules = [SheetRule(rule, name) for rule in spec["sheets"]]
+        self.print_area = compile_print_area(spec.get("print_area", DEFAULT_PRINT_AREA), name)
+        self.order = spec.get("order", "workbook")
+        if self.order not in ("workbook", "rules"):
+            raise ValueError(f"Профиль {name}: order должен быть 'workbook' или 'rules'")
+
+    def select(self, sheets):
+        """Возвращает [(лист, источники области печати), ...] в порядке вывода."""
+        selected = {}
+        for rule in self.rules:
+            for sheet in rule.match(sheets):
+                if sheet.index not in selected:
+                    sources = rule.print_area if rule.print_area is not None else self.print_area
+                    selected[sheet.index] = (sheet, sources)
+        items = list(selected.values())
+        if self.order == "workbook":
+            items.sort(key=lambda item: item[0].index)
+        return items
+
+
+PROFILES = {name: Profile(name, spec) for name, spec in DEFAULT_PROFILES.items()}
+# Профили, заменяющие PROFILES в текущем контексте (свои у каждого Converter)
+_active_profiles = contextvars.ContextVar("profiles", default=None)
+
+def compile_profiles(config):
+    """Компилирует профили из встроенных и "profiles" config.json."""
+    specs = {name: dict(spec) for name, spec in DEFAULT_PROFILES.items()}
+    for name, options in config.get("profiles", {}).items():
+        specs.setdefault(name, {}).update(options)
+    return {name: Profile(name, spec) for name, spec in specs.items()}
+
+def load_profiles(config):
+    """Делает профили config.json профилями процесса (один раз на запуск из консоли)."""
+    compiled = compile_profiles(config)
+    PROFILES.clear()
+    PROFILES.update(compiled)
+    return PROFILES
+
+def active_profiles():
+    """Профили текущего контекста: заданные use_profiles или профили процесса."""
+    profiles = _active_profiles.get()
+    return PROFILES if profiles is None else profiles
+
+@contextmanager
+def use_profiles(profiles):
+    """Подменяет профили в текущем потоке (и в вызовах движка из него)."""
+    token = _active_profiles.set(profiles)
+    try:
+        yield profiles
+    finally:
+        _active_profiles.reset(token)
+
+def parse_modes(mode):
+    """'1' / '1,2,invoice' / список -> список профилей без повторов."""
+    names = mode.split(",") if isinstance(mode, str) else list(mode)
+    profiles = active_profiles()
+    modes = []
+    for name in (str(n).strip() for n in names):
+        if not name:
+            continue
+        if name not in profiles:
+            raise ValueError(f"Неизвестный профиль: {name} (доступны: {', '.join(profiles)})")
+        if name not in modes:
+            modes.append(name)
+    if not modes:
+        raise ValueError("не указан режим")
+    return modes
+
+def profile_output_paths(base_pdf_path, modes):
+    """Пути PDF для профилей: без суффикса для одного профиля, с суффиксами - для нескольких."""
+    if len(modes) == 1:
+        return [(modes[0], base_pdf_path)]
+    stem, ext = os.path.splitext(base_pdf_path)
+    profiles = active_profiles()
+    return [(mode, f"{stem}{profiles[mode].suffix}{ext}") for mode in modes]
+
+# ==========================================
+# ОШИБКИ, ПОВТОРЫ И КАРАНТИН
+# ==========================================
+
+# Категория ошибки -> подпись в отчёте
+ERROR_CATEGORIES = {
+    "locked": "файл занят другим пользователем",
+    "busy": "Excel занят (RPC_E_CALL_REJECTED)",
+    "engine": "движок недоступен",
+    "timeout": "таймаут",
+    "network": "сетевая ошибка",
+    "sheets": "нет нужных листов",
+    "invalid": "файл повреждён или не книга Excel",
+    "other": "прочие ошибки",
+}
+# Временные категории: повтор через паузу обычно помогает
+TRANSIENT_CATEGORIES = ("locked", "busy", "engine", "timeout", "network")
+# Таймауты и падения движка повторяет ManagedBackend на новом движке,
+# поэтому при включённом watchdog RetryPolicy их не повторяет
+WATCHDOG_CATEGORIES = ("engine", "timeout")
+
+# HRESULT ошибок COM
+BUSY_HRESULTS = {-2147418111, -2147417846}    # RPC_E_CALL_REJECTED, RPC_E_SERVERCALL_RETRYLATER
+ENGINE_HRESULTS = {-2147023174, -2147417848}  # RPC_S_SERVER_UNAVAILABLE, RPC_E_DISCONNECTED
+# Коды winerror: 32/33 - файл занят; 53, 59, 64, 67, 121, 1231 - сеть недоступна или оборвалась
+LOCKED_WINERRORS = {32, 33}
+NETWORK_WINERRORS = {53, 59, 64, 67, 121, 1231}
+
+
+def _error_codes(exc):
+    """Собирает числовые коды ошибки: hresult, scode из excepinfo COM и коды из текста."""
+    codes = set()
+    for value in (getattr(exc, "hresult", None), getattr(exc, "winerror", None)):
+        if isinstance(value, int):
+            codes.add(value)
+    args = getattr(exc, "args", ())
+    if args and isinstance(args[0], int):
+        codes.add(args[0])
+    if len(args) > 2 and isinstance(args[2], tuple) and len(args[2]) > 5 \
+            and isinstance(args[2][5], int):
+        codes.add(args[2][5])
+    codes.update(int(code) for code in re.findall(r"-2147\d{6}", str(exc)))
+    return codes
+
+
+def classify_error(exc):
+    """Определяет категорию ошибки конвертации (ключ ERROR_CATEGORIES)."""
+    codes = _error_codes(exc)
+    text = str(exc).lower()
+    # "timeout" - только зависание движка; таймаут сокета или сетевой папки
+    # (TimeoutError, ETIMEDOUT) относится к сети и повторяется RetryPolicy
+    if isinstance(exc, EngineTimeout):
+        return "timeout"
+    if codes & BUSY_HRESULTS:
+        return "busy"
+    if codes & ENGINE_HRESULTS:
+        return "engine"
+    if isinstance(exc, PermissionError) or getattr(exc, "winerror", None) in LOCKED_WINERRORS \
+            or "locked for editing" in text or "used by another" in text:
+        # Тексты ошибок Excel и Windows о заблокированном файле
+        return "locked"
+    if isinstance(exc, TimeoutError) or isinstance(exc, OSError) and (
+            getattr(exc, "winerror", None) in NETWORK_WINERRORS
+            or exc.errno in (errno.ETIMEDOUT, errno.EHOSTUNREACH, errno.ENETUNREACH,
+                             errno.ECONNRESET, getattr(errno, "ESTALE", -1))):
+        return "network"
+    if isinstance(exc, MissingSheetsError):
+        return "sheets"
+    if isinstance(exc, InvalidWorkbookError):
+        return "invalid"
+    return "other"
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Повтор временных ошибок с экспоненциальной паузой:
+    backoff, 2*backoff, 4*backoff... (не больше max_delay, со случайным разбросом).
+    """
+    retries: int = 2
+    backoff: float = 2.0
+    max_delay: float = 60.0
+    categories: tuple = TRANSIENT_CATEGORIES
+
+    def should_retry(self, category, attempt):
+        return category in self.categories and attempt < self.retries
+
+    def delay(self, attempt):
+        return min(self.max_delay, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+QUARANTINE_FILE = "quarantine.json"
+
+
+class Quarantine:
+    """
+    Карантин книг, которые не удалось сконвертировать after раз подряд:
+    следующие пакеты пропускают их сразу. Изменённая книга (mtime или размер)
+    получает новую попытку, успешная конвертация снимает её с карантина.
+    """
+
+    def __init__(self, path=QUARANTINE_FILE, after=3):
+        self.path = path
+        self.after = after
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except Exception:
+                self.entries = {}
+        return self
+
+    def save(self):
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠ Не удалось сохранить карантин: {e}")
+
+    def _unchanged(self, entry, source_path):
+        try:
+            st = os.stat(source_path)
+        except OSError:
+            return False
+        return (entry.get("mtime_ns"), entry.get("size")) == (st.st_mtime_ns, st.st_size)
+
+    def is_quarantined(self, source_path):
+        entry = self.entries.get(os.path.abspath(source_path))
+        return bool(entry) and entry["failures"] >= self.after and self._unchanged(entry, source_path)
+
+    def record(self, result):
+        key = os.path.abspath(result.job.file_path)
+        with self._lock:
+            if result.ok:
+                self.entries.pop(key, None)
+                return
+            entry = self.entries.get(key)
+            if not entry or not self._unchanged(entry, key):
+                try:
+                    st = os.stat(key)
+                    entry = {"failures": 0, "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+                except OSError:
+                    return
+            entry.update(failures=entry["failures"] + 1, category=result.category,
+                         error=result.error, last=round(time.time()))
+            self.entries[key] = entry
+            if entry["failures"] == self.after:
+                print(f"   🚫 В карантин: {os.path.basename(key)} (сбоев подряд: {entry['failures']})")
+
+# ==========================================
+# МОДЕЛЬ СТОИМОСТИ И ПРОГРЕСС
+# ==========================================
+
+COST_HISTORY_FILE = "cost_history.json"
+COST_HISTORY_LIMIT = 50000
+# Оценка для книги, когда истории ещё нет: секунды на файл и на МБ
+DEFAULT_COST = (2.0, 1.0)
+
+
+def _solve_linear(matrix, vector):
+    """Решает небольшую систему линейных уравнений методом Гаусса (None, если вырождена)."""
+    size = len(vector)
+    rows = [list(matrix[i]) + [vector[i]] for i in range(size)]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda r: abs(rows[r][col]))
+        if abs(rows[pivot][col]) < 1e-12:
+            return None
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for r in range(size):
+            if r != col:
+                factor = rows[r][col] / rows[col][col]
+                rows[r] = [a - factor * b for a, b in zip(rows[r], rows[col])]
+    return [rows[i][size] / rows[i][i] for i in range(size)]
+
+
+class CostModel:
+    """
+    История стоимости конвертации: для каждой книги хранятся размер, число
+    листов, профили и сглаженная длительность. Для известной неизменённой
+    книги прогноз - её прошлая длительность, для новой - линейная модель
+    "время = a + b * МБ + c * листов", подобранная по истории тех же профилей.
+    """
+
+    def __init__(self, path=COST_HISTORY_FILE, alpha=0.3):
+        self.path = path
+        self.alpha = alpha
+        self.files = {}
+        self._coefficients = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.files = json.load(f)
+            except Exception:
+                self.files = {}
+        return self
+
+    def save(self):
+        with self._lock:
+            if len(self.files) > COST_HISTORY_LIMIT:
+                newest = sorted(self.files.items(), key=lambda item: item[1]["time"])
+                self.files = dict(newest[-COST_HISTORY_LIMIT:])
+            data = json.dumps(self.files, ensure_ascii=False)
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠ Не удалось сохранить историю стоимости: {e}")
+
+    @staticmethod
+    def _modes(job):
+        return ",".join(sorted(profile for profile, _ in job.outputs))
+
+    def _fit(self):
+        """Подбирает коэффициенты по истории для каждого набора профилей (МНК с регуляризацией)."""
+        sums = {}
+        for entry in self.files.values():
+            x = (1.0, entry["size"] / 1048576, float(entry["sheets"] or 0))
+            matrix, vector, count = sums.setdefault(
+                entry["modes"], ([[0.0] * 3 for _ in range(3)], [0.0] * 3, [0]))
+            for i in range(3):
+                vector[i] += x[i] * entry["duration"]
+                for j in range(3):
+                    matrix[i][j] += x[i] * x[j]
+            count[0] += 1
+        coefficients = {}
+        for modes, (matrix, vector, count) in sums.items():
+            for i in (1, 2):
+                matrix[i][i] += 1e-3 * count[0]
+            solved = _solve_linear(matrix, vector)
+            if solved:
+                coefficients[modes] = solved
+        return coefficients
+
+    def predict(self, job):
+        """Ожидаемая длительность конвертации задания, секунд."""
+        try:
+            size = os.path.getsize(job.file_path)
+        except OSError:
+            size = 0
+        modes = self._modes(job)
+        with self._lock:
+            entry = self.files.get(os.path.abspath(job.file_path))
+            if entry and entry["size"] == size and entry["modes"] == modes:
+                return entry["duration"]
+            if self._coefficients is None:
+                self._coefficients = self._fit()
+            coefficients = self._coefficients.get(modes)
+        sheets = len(job.plan.sheets) if job.plan is not None else (entry or {}).get("sheets") or 0
+        if coefficients is None:
+            return DEFAULT_COST[0] + DEFAULT_COST[1] * size / 1048576
+        a, b, c = coefficients
+        return max(0.01, a + b * size / 1048576 + c * sheets)
+
+    def record(self, result):
+        """Учитывает длительность успешной конвертации (сглаживание по прошлым запускам)."""
+        if not result.ok:
+            return
+        job = result.job
+        try:
+            size = os.path.getsize(job.file_path)
+        except OSError:
+            return
+        key = os.path.abspath(job.file_path)
+        modes = self._modes(job)
+        with self._lock:
+            entry = self.files.get(key)
+            duration = result.duration
+            if entry and entry["size"] == size and entry["modes"] == modes:
+                duration = entry["duration"] + self.alpha * (duration - entry["duration"])
+            self.files[key] = {"size": size, "sheets": (result.info or {}).get("sheet_count"),
+                               "modes": modes, "duration": round(duration, 4),
+                               "time": round(time.time())}
+            self._coefficients = None
+
+    def order(self, jobs):
+        """Задания в порядке убывания ожидаемой длительности (сначала самые долгие)."""
+        costs = {job.index: self.predict(job) for job in jobs}
+        return sorted(jobs, key=lambda job: -costs[job.index]), costs
+
+
+class BatchProgress:
+    """
+    Прогресс пакета: число готовых книг, пропускная способность и оставшееся
+    время. Оставшееся время считается по прогнозу стоимости оставшихся книг
+    и фактическому темпу: сколько секунд пакета уходит на секунду прогноза.
+    """
+
+    def __init__(self, costs=None, total=None, every=10.0):
+        self.costs = dict(costs or {})
+        self.total = total if total is not None else (len(self.costs) or None)
+        self.every = every
+        self.done = 0
+        self.done_cost = 0.0
+        self.started = time.monotonic()
+        self._last = self.started
+
+    def update(self, result):
+        self.done += 1
+        self.done_cost += self.costs.pop(result.job.index, 0.0)
+        now = time.monotonic()
+        if now - self._last >= self.every or self.done == self.total:
+            self._last = now
+            print(f"   ⏳ {self.line(now)}")
+
+    def line(self, now=None):
+        elapsed = (now or time.monotonic()) - self.started
+        text = f"готово {self.done}" + (f" из {self.total}" if self.total else "")
+        if elapsed > 0:
+            text += f", {self.done / elapsed * 60:.1f} файлов/мин"
+        remaining = sum(self.costs.values())
+        if remaining and self.done_cost > 0:
+            eta = remaining * elapsed / self.done_cost
+            text += f", осталось ≈ {int(eta // 60):02d}:{int(eta % 60):02d}"
+        return text
+
+# ==========================================
+# ПУЛ ВОРКЕРОВ
+# ==========================================
+
+@dataclass
+class ConversionJob:
+    index: int
+    file_path: str
+    outputs: list  # [(профиль, путь PDF), ...]
+    plan: object = None      # WorkbookPlan предварительного анализа
+    rejected: Exception = None  # ошибка предварительного анализа: книга не конвертируется
+    checksums: tuple = ()    # что воркер хеширует после конвертации: "source" (манифест), "pdf" (журнал)
+
+    @property
+    def pdf_paths(self):
+        return [pdf_path for _, pdf_path in self.outputs]
+
+
+@dataclass
+class ConversionResult:
+    job: ConversionJob
+    ok: bool
+    error: str = ""
+    duration: float = 0.0
+    info: dict = None
+    timings: dict = field(default_factory=dict)
+    category: str = ""
+    attempts: int = 1
+    copy_of: str = ""
+    source_sha256: str = None  # SHA-256 книги, посчитанный воркером
+    pdf_sha256: dict = None    # {профиль: SHA-256 PDF}, посчитанные воркером
+
+    def to_dict(self):
+        """Результат в виде словаря для JSON (встраиваемый API, интеграции)."""
+        return {
+            "file": self.job.file_path,
+            "ok": self.ok,
+            "pdf": [{"profile": profile, "path": pdf_path} for profile, pdf_path in self.job.outputs],
+            "error": self.error,
+            "category": self.category,
+            "attempts": self.attempts,
+            "copy_of": self.copy_of,
+            "duration": round(self.duration, 3),
+            "sheets": (self.info or {}).get("sheets", {}),
+        }
+
+
+def temp_pdf_path(pdf_path):
+    """Временное имя PDF рядом с итоговым (расширение .pdf сохраняется для Excel)."""
+    root, ext = os.path.splitext(pdf_path)
+    return f"{root}.~{os.getpid()}_{threading.get_ident()}{ext}"
+
+def convert_job(backend, job, retry=None):
+    """
+    Конвертирует одно задание и возвращает ConversionResult.
+    PDF пишутся во временные файлы и переименовываются только после
+    успешной конвертации всей книги, поэтому недописанный PDF никогда
+    не оказывается под итоговым именем. Временные ошибки повторяются
+    по retry (RetryPolicy).
+    """
+    if job.rejected is not None:
+        return ConversionResult(job, False, str(job.rejected), category=classify_error(job.rejected))
+
+    started = time.perf_counter()
+    temp_outputs = [(profile, temp_pdf_path(pdf_path)) for profile, pdf_path in job.outputs]
+    attempt = attempts = 0
+    while True:
+        try:
+            info = backend.convert(job.file_path, temp_outputs, job.plan)
+            for (_, temp_path), pdf_path in zip(temp_outputs, job.pdf_paths):
+                os.replace(temp_path, pdf_path)
+            result = ConversionResult(job, True, info=info, timings=(info or {}).get("timings", {}))
+        except Exception as e:
+            category = classify_error(e)
+            if retry and retry.should_retry(category, attempt):
+                delay = retry.delay(attempt)
+                attempt += 1
+                log_event(f"   🔁 {os.path.basename(job.file_path)}: {ERROR_CATEGORIES[category]}, "
+                          f"повтор {attempt}/{retry.retries} через {delay:.1f} с")
+                time.sleep(delay)
+                continue
+            result = ConversionResult(job, False, str(e) or type(e).__name__,
+                                      timings=getattr(e, "timings", {}), category=category)
+        finally:
+            # ManagedBackend сам повторяет файл после таймаута: его попытки тоже считаются
+            attempts += getattr(backend, "attempts", 1) or 1
+            for _, temp_path in temp_outputs:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        break
+    result.attempts = attempts
+    result.duration = time.perf_counter() - started
+    if result.ok and job.checksums:
+        # Хеши для манифеста и журнала считает воркер, а не общий поток результатов
+        try:
+            if "source" in job.checksums:
+                result.source_sha256 = file_sha256(job.file_path)
+            if "pdf" in job.checksums:
+                result.pdf_sha256 = {profile: file_sha256(pdf_path)
+                                     for profile, pdf_path in job.outputs}
+        except OSError:
+            pass  # манифест и журнал досчитают хеши сами
+    return result
+
+def run_conversion_pool(jobs, backend_factory, workers=1, on_result=None, on_start=None,
+                        retry=None, writers=0, local_dir=None, on_complete=None):
+    """
+    Конвертирует задания пулом воркеров с общей очередью.
+    Каждый воркер создаёт свой backend и запускает его при первом задании;
+    движков запускается не больше, чем заданий, а отклонённые предварительным
+    анализом задания завершаются без движка. Результаты возвращаются
+    (и передаются в on_result) в исходном порядке заданий.
+    on_start вызывается из воркера перед конвертацией задания,
+    on_complete - сразу по готовности результата, не дожидаясь предыдущих.
+    При writers > 0 PDF сначала пишутся в локальную папку, а в места
+    назначения их копирует PdfWriterPool.
+    """
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+    if not jobs:
+        return results
+
+    lock = threading.Lock()
+    next_to_report = 0
+    start_errors = []
+    writer = scratch = None
+
+    def publish(result):
+        nonlocal next_to_report
+        with lock:
+            if on_complete:
+                on_complete(result)
+            results[result.job.index] = result
+            while next_to_report < len(results) and results[next_to_report] is not None:
+                if on_result:
+                    on_result(results[next_to_report])
+                next_to_report += 1
+
+    job_queue = queue.Queue()
+    for job in jobs:
+        if job.rejected is not None:
+            publish(convert_job(None, job))
+        else:
+            job_queue.put(job)
+    engines = min(workers, job_queue.qsize())
+    if not engines:
+        return results
+
+    def worker():
+        backend = None
+        try:
+            while True:
+                try:
+                    job = job_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if backend is None:
+                    backend = backend_factory()
+                    try:
+                        backend.start()
+                    except Exception as e:
+                        # Задание остаётся другим воркерам
+                        job_queue.put(job)
+                        with lock:
+                            start_errors.append(e)
+                        return
+
+                if on_start:
+                    on_start(job)
+                if writer is None:
+                    publish(convert_job(backend, job, retry))
+                    continue
+                local_job = ConversionJob(job.index, job.file_path, local_outputs(job, scratch),
+                                          plan=job.plan, checksums=job.checksums)
+                result = convert_job(backend, local_job, retry)
+                result.job = job
+                writer.submit(result, local_job.outputs)
+        finally:
+            if backend is not None:
+                backend.close()
+
+    if writers > 0:
+        scratch = tempfile.mkdtemp(prefix="excel2pdf_out_", dir=local_dir)
+        writer = PdfWriterPool(writers, on_written=publish)
+
+    threads = [
+        threading.Thread(target=worker, name=f"converter-{i + 1}", daemon=True)
+        for i in range(engines)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if writer is not None:
+        writer.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    # Если ни один движок не запустился, оставшиеся задания помечаются ошибкой
+    error = f"движок не запущен: {start_errors[0]}" if start_errors else "задание не обработано"
+    while True:
+        try:
+            job = job_queue.get_nowait()
+        except queue.Empty:
+            break
+        publish(ConversionResult(job, False, error, category="engine"))
+
+    return results
+
+# ==========================================
+# ЛОКАЛЬНЫЙ КЭШ КНИГ (СЕТЕВЫЕ ПАПКИ)
+# ==========================================
+
+STAGING_INDEX_FILE = "staging_index.json"
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+def copy_file_buffered(src, dst, digest=None):
+    """
+    Копирует файл крупными блоками во временный файл рядом с dst и
+    переименовывает его. При переданном digest (hashlib) попутно считает хеш.
+    """
+    tmp_path = f"{dst}.{threading.get_ident()}.part"
+    try:
+        with open(src, "rb") as fin, open(tmp_path, "wb") as fout:
+            for chunk in iter(lambda: fin.read(COPY_BUFFER_SIZE), b""):
+                if digest is not None:
+                    digest.update(chunk)
+                fout.write(chunk)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class StagingCache:
+    """
+    Локальный кэш книг, адресуемый по содержимому: файл с сетевой папки
+    копируется один раз в blobs/<sha256><расширение>, повторные запуски по
+    тем же инвойсам читают его с локального диска. Объём ограничен max_mb,
+    при переполнении удаляются давно не использованные книги (LRU). Книги,
+    которые сейчас конвертируются, не удаляются.
+    """
+
+    def __init__(self, directory, max_mb=2048):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.index_file = os.path.join(self.directory, STAGING_INDEX_FILE)
+        # Путь источника -> {mtime_ns, size, sha256}; хеш -> {file, size, used}
+        self.sources = {}
+        self.blobs = {}
+        self.hits = 0
+        self.misses = 0
+        self._pinned = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.directory, "blobs"), exist_ok=True)
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.sources = data.get("sources", {})
+                self.blobs = {digest: blob for digest, blob in data.get("blobs", {}).items()
+                              if os.path.exists(self._blob_path(blob["file"]))}
+            except Exception:
+                self.sources, self.blobs = {}, {}
+        return self
+
+    def save(self):
+        with self._lock:
+            data = {"sources": self.sources, "blobs": self.blobs}
+        try:
+            tmp_path = self.index_file + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.index_file)
+        except Exception as e:
+            print(f"⚠ Не удалось сохранить индекс локального кэша: {e}")
+
+    def _blob_path(self, file_name):
+        return os.path.join(self.directory, "blobs", file_name)
+
+    @property
+    def size(self):
+        return sum(blob["size"] for blob in self.blobs.values())
+
+    def fetch(self, source_path):
+        """
+        Возвращает локальную копию книги (и закрепляет её до release).
+        Книга копируется, только если изменились её mtime или размер.
+        """
+        key = os.path.abspath(source_path)
+        st = os.stat(source_path)
+        with self._lock:
+            entry = self.sources.get(key)
+            if (entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size
+                    and entry["sha256"] in self.blobs):
+                return self._pin(entry["sha256"], hit=True)
+
+        # Копирование идёт вне блокировки, чтобы потоки предзагрузки не ждали друг друга
+        digest = hashlib.sha256()
+        tmp_name = f"incoming_{threading.get_ident()}{os.path.splitext(source_path)[1]}"
+        tmp_path = self._blob_path(tmp_name)
+        copy_file_buffered(source_path, tmp_path, digest)
+        # Расширение входит в ключ: Excel определяет формат книги по нему
+        sha = digest.hexdigest() + os.path.splitext(source_path)[1].lower()
+
+        with self._lock:
+            if sha in self.blobs:
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, self._blob_path(sha))
+                self.blobs[sha] = {"file": sha, "size": st.st_size, "used": time.time()}
+            self.sources[key] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": sha}
+            local_path = self._pin(sha, hit=False)
+            self._evict()
+        return local_path
+
+    def _pin(self, sha, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self._pinned[sha] = self._pinned.get(sha, 0) + 1
+        self.blobs[sha]["used"] = time.time()
+        return self._blob_path(self.blobs[sha]["file"])
+
+    def release(self, local_path):
+        """Снимает закрепление книги после конвертации."""
+        sha = os.path.basename(local_path)
+        with self._lock:
+            if self._pinned.get(sha, 0) > 1:
+                self._pinned[sha] -= 1
+            else:
+                self._pinned.pop(sha, None)
+            self._evict()
+
+    def _evict(self):
+        """Удаляет давно не использованные книги, пока кэш больше лимита."""
+        total = self.size
+        for sha, blob in sorted(self.blobs.items(), key=lambda item: item[1]["used"]):
+            if total <= self.max_bytes:
+                break
+            if sha in self._pinned:
+                continue
+            try:
+                os.remove(self._blob_path(blob["file"]))
+            except OSError:
+                pass
+            total -= blob["size"]
+            del self.blobs[sha]
+        live = set(self.blobs)
+        self.sources = {k: v for k, v in self.sources.items() if v["sha256"] in live}
+
+# ==========================================
+# КОНВЕЙЕР (PIPELINE)
+# ==========================================
+
+class _Countdown:
+    """Счётчик завершившихся потоков стадии: последний закрывает следующую."""
+
+    def __init__(self, count):
+        self.count = count
+        self._lock = threading.Lock()
+
+    def done(self):
+        with self._lock:
+            self.count -= 1
+            return self.count == 0
+
+
+class PdfWriterPool:
+    """
+    Небольшой пул потоков записи: готовые PDF из локальной папки копируются
+    в места назначения в фоне, поэтому медленная сетевая папка не держит
+    движки. Очередь ограничена: если запись не успевает, воркеры конвертации ждут.
+    После записи (или ошибки) результат передаётся в on_written.
+    """
+
+    def __init__(self, writers=2, on_written=None, queue_size=16):
+        self.on_written = on_written
+        self._queue = queue.Queue(queue_size)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"writer-{i + 1}", daemon=True)
+            for i in range(max(1, writers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, result, local_outputs, cleanup=None):
+        """Ставит в очередь запись PDF задания: local_outputs - [(профиль, локальный PDF), ...]."""
+        self._queue.put((result, local_outputs, cleanup))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            result, local_outputs, cleanup = item
             try:
-                start, end = map(int, part.split('-'))
-                if start > end:
-                    print(f"⚠ Предупреждение: Неверный диапазон '{part}'.")
+                if result.ok:
+                    for (_, local_pdf), pdf_path in zip(local_outputs, result.job.pdf_paths):
+                        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+                        copy_file_buffered(local_pdf, pdf_path)
+            except Exception as e:
+                result.ok = False
+                result.error = f"выгрузка: {e}"
+                result.category = classify_error(e)
+            finally:
+                for _, local_pdf in local_outputs:
+                    if os.path.exists(local_pdf):
+                        os.remove(local_pdf)
+                if cleanup:
+                    cleanup()
+            if self.on_written:
+                self.on_written(result)
+
+    def close(self):
+        """Дожидается записи всех поставленных PDF."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+def local_outputs(job, scratch):
+    """Локальные пути PDF задания в папке scratch (для последующей выгрузки)."""
+    return [(profile, os.path.join(scratch, f"{job.index}_{number}.pdf"))
+            for number, (profile, _) in enumerate(job.outputs)]
+
+
+def run_pipeline(job_iter, backend_factory, workers=1, on_result=None,
+                 prefetch_workers=2, queue_size=8, local_dir=None, cache=None, on_start=None,
+                 retry=None, writers=2, on_complete=None):
+    """
+    Конвейер из стадий, связанных ограниченными очередями:
+    поиск (job_iter в отдельном потоке) -> копирование книги на локальный диск ->
+    конвертация воркерами (каждый со своим движком, запускаемым по первому
+    заданию) -> выгрузка PDF пулом записи (writers потоков) -> отчёт в исходном
+    порядке.
+    Очереди ограничены queue_size, поэтому медленная стадия притормаживает
+    предыдущие, и память и локальный диск не растут на больших пакетах.
+    cache - StagingCache: книги берутся из локального кэша вместо разового
+    копирования и остаются в нём для следующих запусков.
+    on_complete получает каждый результат сразу после выгрузки PDF.
+    """
+    stop = object()
+    fetch_q = queue.Queue(queue_size)
+    convert_q = queue.Queue(queue_size)
+    post_q = queue.Queue(queue_size)
+    scratch = tempfile.mkdtemp(prefix="excel2pdf_stage_", dir=local_dir)
+    producer_errors = []
+
+    def producer():
+        try:
+            for job in job_iter:
+                fetch_q.put(job)
+        except Exception as e:
+            producer_errors.append(e)
+        finally:
+            for _ in range(prefetch_workers):
+                fetch_q.put(stop)
+
+    prefetch_done = _Countdown(prefetch_workers)
+
+    def prefetcher():
+        while True:
+            job = fetch_q.get()
+            if job is stop:
+                break
+            if job.rejected is not None:
+                # Книга отклонена предварительным анализом: копировать и открывать нечего
+                post_q.put(convert_job(None, job))
+                continue
+            try:
+                if cache is not None:
+                    local_path = cache.fetch(job.file_path)
+                else:
+                    local_path = os.path.join(scratch, f"{job.index}_{os.path.basename(job.file_path)}")
+                    copy_file_buffered(job.file_path, local_path)
+                local_job = ConversionJob(job.index, local_path, local_outputs(job, scratch),
+                                          plan=job.plan, checksums=job.checksums)
+                convert_q.put((job, local_job))
+            except Exception as e:
+                post_q.put(ConversionResult(job, False, f"копирование: {e}",
+                                            category=classify_error(e)))
+        if prefetch_done.done():
+            for _ in range(workers):
+                convert_q.put(stop)
+
+    workers_done = _Countdown(workers)
+    writer = PdfWriterPool(writers, on_written=post_q.put, queue_size=queue_size)
+
+    def release(local_path):
+        if cache is not None:
+            cache.release(local_path)
+        else:
+            os.remove(local_path)
+
+    def worker():
+        backend = None
+        start_error = None
+        try:
+            while True:
+                item = convert_q.get()
+                if item is stop:
+                    break
+                job, local_job = item
+                if backend is None and start_error is None:
+                    backend = backend_factory()
+                    try:
+                        backend.start()
+                    except Exception as e:
+                        start_error = e
+                if start_error is not None:
+                    result = ConversionResult(job, False, f"движок не запущен: {start_error}",
+                                              category="engine")
+                else:
+                    if on_start:
+                        on_start(job)
+                    result = convert_job(backend, local_job, retry)
+                    result.job = job
+                writer.submit(result, local_job.outputs,
+                              cleanup=lambda path=local_job.file_path: release(path))
+        finally:
+            if backend is not None:
+                backend.close()
+            if workers_done.done():
+                writer.close()
+                post_q.put(stop)
+
+    threads = [threading.Thread(target=producer, name="discovery", daemon=True)]
+    threads += [threading.Thread(target=prefetcher, name=f"prefetch-{i + 1}", daemon=True)
+                for i in range(prefetch_workers)]
+    threads += [threading.Thread(target=worker, name=f"converter-{i + 1}", daemon=True)
+                for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    # Отчёт в исходном порядке - в вызывающем потоке
+    results = {}
+    next_to_report = 0
+    try:
+        while True:
+            result = post_q.get()
+            if result is stop:
+                break
+            if on_complete:
+                on_complete(result)
+            results[result.job.index] = result
+            while next_to_report in results:
+                if on_result:
+                    on_result(results[next_to_report])
+                next_to_report += 1
+    finally:
+        for thread in threads:
+            thread.join()
+        shutil.rmtree(scratch, ignore_errors=True)
+        if cache is not None:
+            cache.save()
+
+    if producer_errors:
+        raise producer_errors[0]
+    return [results[i] for i in sorted(results)]
+
+# ==========================================
+# МАНИФЕСТ (ИНКРЕМЕНТАЛЬНЫЙ РЕЖИМ)
+# ==========================================
+
+MANIFEST_FILE = "pdf_manifest.json"
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Считает SHA-256 файла блоками."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Манифест созданных PDF: для каждого PDF хранятся mtime, размер и хеш
+    исходной книги, режим конвертации и применённые области печати.
+    """
+
+    def __init__(self, manifest_file=MANIFEST_FILE):
+        self.manifest_file = manifest_file
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except Exception:
+                self.entries = {}
+        return self
+
+    def save(self):
+        try:
+            tmp_path = self.manifest_file + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.manifest_file)
+        except Exception as e:
+            print(f"⚠ Не удалось сохранить манифест: {e}")
+
+    def is_up_to_date(self, source_path, pdf_path, mode):
+        """Проверяет, что PDF создан из той же версии книги в том же режиме."""
+        entry = self.entries.get(os.path.abspath(pdf_path))
+        if not entry or entry.get("mode") != mode:
+            return False
+        profiles = active_profiles()
+        if mode in profiles and entry.get("rules") != profiles[mode].fingerprint:
+            return False
+        try:
+            src = os.stat(source_path)
+            pdf = os.stat(pdf_path)
+        except OSError:
+            return False
+        if pdf.st_size != entry.get("pdf_size") or src.st_size != entry.get("size"):
+            return False
+        if src.st_mtime_ns == entry.get("mtime_ns"):
+            return True
+
+        # Файл пересохранён: сравниваем содержимое
+        if file_sha256(source_path) != entry.get("sha256"):
+            return False
+        with self._lock:
+            entry["mtime_ns"] = src.st_mtime_ns
+        return True
+
+    def record(self, source_path, pdf_path, mode, info=None, sha256=None):
+        """Записывает PDF книги; sha256 - уже посчитанный хеш книги."""
+        src = os.stat(source_path)
+        profile = active_profiles().get(mode)
+        entry = {
+            "source": os.path.abspath(source_path),
+            "mtime_ns": src.st_mtime_ns,
+            "size": src.st_size,
+            "sha256": sha256 or file_sha256(source_path),
+            "mode": mode,
+            "rules": profile.fingerprint if profile else None,
+            "print_areas": (info or {}).get("print_areas", {}),
+            "pdf_size": os.path.getsize(pdf_path),
+        }
+        with self._lock:
+            self.entries[os.path.abspath(pdf_path)] = entry
+
+    def record_result(self, result):
+        """Записывает все PDF успешного результата; книга хешируется не больше одного раза."""
+        sha256 = result.source_sha256 or file_sha256(result.job.file_path)
+        for profile, pdf_path in result.job.outputs:
+            self.record(result.job.file_path, pdf_path, profile, result.info, sha256)
+
+# ==========================================
+# ЖУРНАЛ ПАКЕТА (ВОЗОБНОВЛЕНИЕ)
+# ==========================================
+
+JOURNAL_DIR = "journals"
+
+
+class BatchJournal:
+    """
+    Журнал пакета: строки JSON дописываются в конец файла при каждой смене
+    состояния книги (queued, in_progress, done, failed) и сразу сбрасываются
+    на диск. Для готовых книг хранятся mtime и размер исходника и SHA-256
+    каждого PDF, поэтому после сбоя (--resume) пропускаются только книги,
+    PDF которых на месте и не изменились.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.states = {}
+        # Последняя запись done по каждой книге (переживает новые queued/in_progress)
+        self.completed = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def batch_key(source_folder, file_numbers, mode, output_dir=None):
+        """Ключ пакета: один и тот же запуск всегда пишет в один журнал."""
+        raw = json.dumps([os.path.abspath(source_folder), str(file_numbers), str(mode),
+                          os.path.abspath(output_dir) if output_dir else None])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+    @classmethod
+    def for_batch(cls, source_folder, file_numbers, mode, output_dir=None, resume=False):
+        """Открывает журнал пакета: при resume продолжает его, иначе начинает заново."""
+        key = cls.batch_key(source_folder, file_numbers, mode, output_dir)
+        journal = cls(os.path.join(JOURNAL_DIR, f"{key}.jsonl"))
+        if resume:
+            journal.load()
+        journal.open(truncate=not resume)
+        return journal
+
+    def load(self):
+        """Восстанавливает последнее состояние каждой книги; оборванная строка пропускается."""
+        if not os.path.exists(self.path):
+            return self
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
                     continue
-                ranges.extend(range(start, end + 1))
-            except ValueError:
-                print(f"⚠ Предупреждение: Неверный формат диапазона '{part}'.")
+                self.states[entry["source"]] = entry
+                if entry["state"] == "done":
+                    self.completed[entry["source"]] = entry
+        return self
+
+    def open(self, truncate=False):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "w" if truncate else "a", encoding="utf-8")
+        return self
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def record(self, state, job, **fields):
+        entry = {"source": os.path.abspath(job.file_path), "state": state,
+                 "time": round(time.time(), 3), **fields}
+        with self._lock:
+            self.states[entry["source"]] = entry
+            if state == "done":
+                self.completed[entry["source"]] = entry
+            if self._file:
+                self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def record_result(self, result):
+        """Записывает итог задания: контрольные суммы PDF или ошибку."""
+        if not result.ok:
+            self.record("failed", result.job, error=result.error)
+            return
+        try:
+            st = os.stat(result.job.file_path)
+            # PDF, не требовавшие повторной конвертации, сохраняют свои контрольные суммы
+            previous = self.completed.get(os.path.abspath(result.job.file_path), {})
+            outputs = dict(previous.get("outputs", {}))
+            if (previous.get("mtime_ns"), previous.get("size")) != (st.st_mtime_ns, st.st_size):
+                outputs = {}
+            digests = result.pdf_sha256 or {}
+            outputs.update({os.path.abspath(pdf_path): digests.get(profile) or file_sha256(pdf_path)
+                            for profile, pdf_path in result.job.outputs})
+        except OSError as e:
+            self.record("failed", result.job, error=f"проверка PDF: {e}")
+            return
+        self.record("done", result.job, mtime_ns=st.st_mtime_ns, size=st.st_size, outputs=outputs)
+
+    def is_done(self, source_path, pdf_path):
+        """Проверяет, что PDF книги создан в прерванном пакете и не изменился."""
+        entry = self.completed.get(os.path.abspath(source_path))
+        if not entry:
+            return False
+        checksum = entry.get("outputs", {}).get(os.path.abspath(pdf_path))
+        try:
+            st = os.stat(source_path)
+            if (st.st_mtime_ns, st.st_size) != (entry.get("mtime_ns"), entry.get("size")):
+                return False
+            return checksum is not None and file_sha256(pdf_path) == checksum
+        except OSError:
+            return False
+
+# ==========================================
+# ПРЕДВАРИТЕЛЬНЫЙ АНАЛИЗ КНИГ (БЕЗ EXCEL)
+# ==========================================
+
+PRESCAN_FILE = "prescan_cache.json"
+PRESCAN_EXTENSIONS = (".xlsx", ".xlsm")
+
+
+@dataclass
+class WorkbookPlan:
+    """Листы книги и прочитанные источники областей печати для convert_workbook."""
+    sheets: list       # [SheetInfo, ...]
+    print_areas: dict  # {(номер листа, вид источника, значение): прочитанное значение}
+
+
+class PrescanCache:
+    """
+    Кэш предварительного анализа: листы и прочитанные ячейки/имена каждой
+    книги по её пути, mtime и размеру. Повторный запуск по тем же книгам
+    не открывает даже zip.
+    """
+
+    def __init__(self, path=PRESCAN_FILE):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except Exception:
+                self.entries = {}
+        return self
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.entries, ensure_ascii=False)
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠ Не удалось сохранить кэш анализа книг: {e}")
+
+    def get(self, file_path, st):
+        entry = self.entries.get(os.path.abspath(file_path))
+        if entry and (entry["mtime_ns"], entry["size"]) == (st.st_mtime_ns, st.st_size):
+            return entry
+        return None
+
+    def put(self, file_path, st, plan):
+        with self._lock:
+            self.entries[os.path.abspath(file_path)] = {
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
+                "sheets": [[sheet.index, sheet.name, sheet.visible] for sheet in plan.sheets],
+                "values": [[index, kind, value, result]
+                           for (index, kind, value), result in plan.print_areas.items()],
+            }
+
+
+def prescan_workbook(file_path, modes, cache=None):
+    """
+    Читает листы xlsx/xlsm и источники областей печати (R1, имена) прямо из
+    zip и проверяет правила профилей, не запуская Excel. Возвращает
+    WorkbookPlan; для .xls - None (книгу разберёт движок). Непригодная книга
+    (повреждена, нет нужных листов) вызывает ConversionError.
+    """
+    if not file_path.lower().endswith(PRESCAN_EXTENSIONS):
+        return None
+
+    st = os.stat(file_path)
+    entry = cache.get(file_path, st) if cache else None
+    reader = _XlsxReader()
+    wb = None
+    try:
+        if entry:
+            plan = WorkbookPlan([SheetInfo(*sheet) for sheet in entry["sheets"]],
+                                {(index, kind, value): result
+                                 for index, kind, value, result in entry["values"]})
         else:
+            wb = _XlsxWorkbook(file_path, file_path)
+            plan = WorkbookPlan(reader.list_sheets(wb), {})
+        if not plan.sheets:
+            raise MissingSheetsError("В файле нет листов.")
+
+        known = len(plan.print_areas)
+        for mode in modes:
+            for sheet, sources in active_profiles()[mode].select(plan.sheets):
+                if any((sheet.index, kind, value) not in plan.print_areas for kind, value in sources):
+                    wb = wb or _XlsxWorkbook(file_path, file_path)
+                resolve_print_area(reader, wb, sheet, sources, plan.print_areas)
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        raise InvalidWorkbookError(f"Файл повреждён или не является книгой Excel: {e}")
+
+    if cache is not None and (entry is None or len(plan.print_areas) != known):
+        cache.put(file_path, st, plan)
+    return plan
+
+# ==========================================
+# ИМЕНА И ПАПКИ PDF (МАРШРУТИЗАЦИЯ)
+# ==========================================
+
+COLLISION_POLICIES = ("overwrite", "suffix", "skip", "error")
+
+
+class OutputRouter:
+    """
+    Пути PDF по шаблонам "output" из config.json:
+    root - корневая папка (по умолчанию - рядом с исходником),
+    path - шаблон подпапки, name - шаблон имени файла без расширения.
+    Подстановки: {number}, {stem} (имя книги), {mode}, {suffix} (суффикс
+    профиля, если профилей несколько), {subdir} (подпапка книги относительно
+    источника), {date}, {year}, {month}, {shard} (диапазон номеров по shard_size).
+    collision - что делать, если две книги пакета получают одно имя PDF:
+    overwrite, suffix (добавить " (2)"), skip (не конвертировать повтор), error.
+    writers - потоков фоновой записи PDF (0 - писать из воркера напрямую).
+    """
+
+    FIELDS = ("number", "stem", "mode", "suffix", "subdir", "date", "year", "month", "shard")
+
+    def __init__(self, root=None, path="{subdir}", name="{stem}{suffix}", date_format="%Y-%m-%d",
+                 shard_size=1000, collision="overwrite", writers=0):
+        for template in (path, name):
+            self._check_template(template)
+        if collision not in COLLISION_POLICIES:
+            raise ValueError(f"Неизвестная политика совпадения имён: {collision} "
+                             f"(допустимо: {', '.join(COLLISION_POLICIES)})")
+        self.root = root
+        self.path = path
+        self.name = name
+        self.shard_size = max(1, int(shard_size))
+        self.collision = collision
+        self.writers = int(writers)
+        now = datetime.now()
+        self._date = {"date": now.strftime(date_format), "year": f"{now.year:04d}",
+                      "month": f"{now.month:02d}"}
+        self._claimed = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _check_template(cls, template):
+        """Проверяет подстановки шаблона до поиска файлов (опечатка - ValueError)."""
+        if not isinstance(template, str):
+            raise ValueError(f"шаблон должен быть строкой: {template!r}")
+        for _, field_name, _, _ in string.Formatter().parse(template):
+            if field_name is None:
+                continue
+            if field_name not in cls.FIELDS:
+                raise ValueError(f"неизвестная подстановка {{{field_name}}} в шаблоне {template!r} "
+                                 f"(допустимо: {', '.join(cls.FIELDS)})")
+
+    def fields(self, source_folder, file_path):
+        number = invoice_number(os.path.basename(file_path))
+        subdir = os.path.relpath(os.path.dirname(file_path), source_folder)
+        shard = ""
+        if number is not None:
+            low = number // self.shard_size * self.shard_size
+            shard = f"{low}-{low + self.shard_size - 1}"
+        return {
+            "number": number if number is not None else "",
+            "stem": os.path.splitext(os.path.basename(file_path))[0],
+            "subdir": "" if subdir == os.curdir else subdir,
+            "shard": shard,
+            **self._date,
+        }
+
+    def route(self, source_folder, file_path, modes):
+        """
+        Возвращает [(профиль, путь PDF), ...] книги. При политике skip повторное
+        имя выпадает из списка, при error - выбрасывается ConversionError.
+        """
+        values = self.fields(source_folder, file_path)
+        outputs = []
+        for mode in modes:
+            fields = dict(values, mode=mode,
+                          suffix=active_profiles()[mode].suffix if len(modes) > 1 else "")
+            # Без корня шаблон папки отсчитывается от источника: {subdir} - рядом с книгой
+            directory = os.path.join(self.root or source_folder, self.path.format(**fields))
+            pdf_path = os.path.normpath(os.path.join(directory, self.name.format(**fields) + ".pdf"))
+            pdf_path = self._claim(pdf_path, file_path)
+            if pdf_path:
+                outputs.append((mode, pdf_path))
+        return outputs
+
+    def _claim(self, pdf_path, file_path):
+        """Закрепляет имя PDF за книгой с учётом политики совпадений."""
+        with self._lock:
+            key = os.path.normcase(pdf_path)
+            owner = self._claimed.get(key)
+            if owner is None or owner == file_path or self.collision == "overwrite":
+                self._claimed[key] = file_path
+                return pdf_path
+            if self.collision == "skip":
+                print(f"   ⚠ {os.path.basename(file_path)}: {pdf_path} уже создаётся из "
+                      f"{os.path.basename(owner)}, пропуск")
+                return None
+            if self.collision == "error":
+                raise ConversionError(f"Имя PDF совпадает с книгой {owner}: {pdf_path}")
+            stem, ext = os.path.splitext(pdf_path)
+            number = 2
+            while os.path.normcase(f"{stem} ({number}){ext}") in self._claimed:
+                number += 1
+            pdf_path = f"{stem} ({number}){ext}"
+            self._claimed[os.path.normcase(pdf_path)] = file_path
+            return pdf_path
+
+# ==========================================
+# ОДИНАКОВЫЕ КНИГИ (ДЕДУПЛИКАЦИЯ)
+# ==========================================
+
+def dedupe_jobs(jobs):
+    """
+    Находит книги с одинаковым содержимым (SHA-256; хешируются только
+    файлы совпадающего размера). Каждая уникальная книга конвертируется
+    один раз на профиль, копии получают готовые PDF (см. copy_result).
+    Возвращает (unique, copies, conflicts): задания уникальных книг с новыми
+    индексами, {индекс уникального задания: [задания копий]} и
+    {номер: [файлы]} для файлов одного номера с разным содержимым.
+    """
+    sizes = {}
+    for job in jobs:
+        try:
+            sizes[job.index] = os.path.getsize(job.file_path)
+        except OSError:
+            sizes[job.index] = None
+    same_size = {}
+    for size in sizes.values():
+        same_size[size] = same_size.get(size, 0) + 1
+
+    content = {}
+    for job in jobs:
+        size = sizes[job.index]
+        content[job.index] = ("file", job.index)
+        if size is not None and same_size[size] > 1:
             try:
-                ranges.append(int(part))
-            except ValueError:
-                print(f"⚠ Предупреждение: Неверный формат числа '{part}'.")
-    return sorted(set(ranges))
+                content[job.index] = file_sha256(job.file_path)
+            except OSError:
+                pass
+        elif size is not None:
+            content[job.index] = ("size", size)
+
+    by_number = {}
+    for job in jobs:
+        number = invoice_number(os.path.basename(job.file_path))
+        if number is not None:
+            by_number.setdefault(number, []).append(job)
+    conflicts = {
+        number: [job.file_path for job in group]
+        for number, group in by_number.items()
+        if len({content[job.index] for job in group}) > 1
+    }
+
+    groups = {}
+    for job in jobs:
+        key = content[job.index] if job.rejected is None else ("rejected", job.index)
+        groups.setdefault(key, []).append(job)
+    unique, copies = [], {}
+    for group in groups.values():
+        primary = group[0]
+        outputs = list(primary.outputs)
+        profiles = {profile for profile, _ in outputs}
+        for copy in group[1:]:
+            # Профиль, уже готовый у первой книги, но нужный копии, рисуется в PDF копии
+            for profile, pdf_path in copy.outputs:
+                if profile not in profiles:
+                    outputs.append((profile, pdf_path))
+                    profiles.add(profile)
+        job = ConversionJob(len(unique), primary.file_path, outputs, plan=primary.plan,
+                            rejected=primary.rejected, checksums=primary.checksums)
+        unique.append(job)
+        if len(group) > 1:
+            copies[job.index] = group[1:]
+    return unique, copies, conflicts
+
+
+def link_pdf(src, dst, hardlink=True):
+    """Кладёт готовый PDF в dst: жёсткой ссылкой, если файловая система позволяет, иначе копией."""
+    if os.path.normcase(os.path.abspath(src)) == os.path.normcase(os.path.abspath(dst)):
+        return
+    if hardlink:
+        tmp_path = temp_pdf_path(dst)
+        try:
+            os.link(src, tmp_path)
+            os.replace(tmp_path, dst)
+            return
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    copy_file_buffered(src, dst)
+
+
+def copy_result(result, copy, hardlink=True):
+    """Результат книги-копии: PDF уникальной книги раскладываются по путям копии."""
+    source = result.job.file_path
+    if not result.ok:
+        return ConversionResult(copy, False, result.error, category=result.category,
+                                attempts=result.attempts, copy_of=source)
+    started = time.perf_counter()
+    rendered = dict(result.job.outputs)
+    try:
+        for profile, pdf_path in copy.outputs:
+            link_pdf(rendered[profile], pdf_path, hardlink)
+    except OSError as e:
+        return ConversionResult(copy, False, str(e), category=classify_error(e), copy_of=source)
+    # Копия совпадает с книгой побайтно, её PDF - с PDF книги
+    return ConversionResult(copy, True, duration=time.perf_counter() - started,
+                            info=result.info, copy_of=source, source_sha256=result.source_sha256,
+                            pdf_sha256=result.pdf_sha256)
 
 # ==========================================
 # ОСНОВНАЯ ЛОГИКА EXCEL
 # ==========================================
 
-def process_excel_files(source_folder, file_numbers, mode):
-    excel = None
-    try:
-        print("\n🚀 Запуск Excel... Пожалуйста, подождите.")
-        excel = win32.DispatchEx('Excel.Application')
-        excel.Visible = False
-        excel.DisplayAlerts = False
+EXCEL_EXTENSIONS = ('.xlsx', '.xls', '.xlsm')
+INVOICE_NAME_RE = re.compile(r'invoice\s+(\d+)', re.IGNORECASE)
+INDEX_FILE = "invoice_index.json"
 
-        count_success = 0
+def invoice_number(file_name):
+    """Возвращает номер инвойса из имени файла 'invoice NNNN.xlsx' или None."""
+    if not file_name.lower().endswith(EXCEL_EXTENSIONS):
+        return None
+    match = INVOICE_NAME_RE.fullmatch(os.path.splitext(file_name)[0])
+    return int(match.group(1)) if match else None
 
-        for root, _, files in os.walk(source_folder):
-            for file in files:
 
-                if not file.lower().endswith(('.xlsx', '.xls', '.xlsm')):
-                    continue
+class InvoiceIndex:
+    """
+    Постоянный индекс 'номер инвойса -> пути' для папки с инвойсами.
+    Для каждой подпапки хранится её mtime: при обновлении заново читаются
+    только папки, в которых добавились, удалились или переименовались файлы.
+    Если ни одна папка не изменилась, файл индекса не перезаписывается, а полные
+    пути строятся только для найденных номеров.
+    """
 
-                name_body = os.path.splitext(file)[0]
+    def __init__(self, source_folder, index_file=INDEX_FILE):
+        self.source_folder = os.path.abspath(source_folder)
+        self.index_file = index_file
+        self.dirs = {}
+        self.numbers = {}
+        self.sorted_numbers = []
+        self.scanned = 0
+        self.cached = 0
+        self.changed = []
+        self.dirty = False
 
-                if not re.fullmatch(r'invoice\s+\d+', name_body, re.IGNORECASE):
-                    continue
+    def load(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.dirs = data.get("roots", {}).get(self.source_folder, {})
+            except Exception:
+                self.dirs = {}
+        return self
 
-                file_num_str = ''.join(filter(str.isdigit, file))
-                if not file_num_str:
-                    continue
+    def save(self):
+        if not self.dirty:
+            return
+        data = {}
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except Exception:
+                data = {}
+        data.setdefault("roots", {})[self.source_folder] = self.dirs
+        try:
+            tmp_path = self.index_file + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_file)
+            self.dirty = False
+        except Exception as e:
+            print(f"⚠ Не удалось сохранить индекс: {e}")
+
+    def _scan_dir(self, path):
+        subdirs, files = [], {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    num = invoice_number(entry.name)
+                    if num is not None:
+                        files.setdefault(str(num), []).append(entry.name)
+        return {"subdirs": sorted(subdirs), "files": files}
+
+    def refresh(self, force=False):
+        """Обновляет индекс, перечитывая только изменившиеся папки."""
+        fresh = {}
+        self.scanned = self.cached = 0
+        self.changed = []
+        pending = ["."]
+        while pending:
+            rel = pending.pop()
+            path = os.path.normpath(os.path.join(self.source_folder, rel))
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
 
+            entry = self.dirs.get(rel)
+            if force or entry is None or entry.get("mtime") != mtime:
                 try:
-                    file_num = int(file_num_str)
-                except ValueError:
+                    entry = self._scan_dir(path)
+                except OSError:
                     continue
+                entry["mtime"] = mtime
+                self.scanned += 1
+                self.changed.append(rel)
+            else:
+                self.cached += 1
 
-                if file_num in file_numbers:
-                    full_path = os.path.join(root, file)
-                    pdf_name = os.path.splitext(file)[0] + ".pdf"
-                    save_path = os.path.join(root, pdf_name)
+            fresh[rel] = entry
+            pending.extend(os.path.join(rel, name) if rel != "." else name
+                           for name in entry["subdirs"])
 
-                    print(f"➡️ Обработка: {file}")
+        if self.changed or len(fresh) != len(self.dirs):
+            self.dirty = True
+        self.dirs = fresh
+        # Номер -> папки с ним; полные пути собираются только в lookup
+        self.numbers = {}
+        for rel, entry in fresh.items():
+            for num in entry["files"]:
+                self.numbers.setdefault(int(num), []).append(rel)
+        self.sorted_numbers = sorted(self.numbers)
+        return self
 
-                    if convert_workbook(excel, full_path, save_path, mode):
-                        count_success += 1
-                        print(f"   ✅ Готово: {save_path}")
-                    else:
-                        print(f"   ❌ Ошибка конвертации")
+    def _paths(self, num):
+        key = str(num)
+        return sorted(os.path.normpath(os.path.join(self.source_folder, rel, name))
+                      for rel in self.numbers[num] for name in self.dirs[rel]["files"][key])
+
+    def paths(self):
+        """Все файлы индекса."""
+        return [path for num in self.sorted_numbers for path in self._paths(num)]
+
+    def lookup(self, file_numbers):
+        """Возвращает пути файлов с номерами из file_numbers."""
+        if isinstance(file_numbers, IntervalSet):
+            numbers = file_numbers.filter_sorted(self.sorted_numbers)
+        else:
+            numbers = [num for num in self.sorted_numbers if num in file_numbers]
+        matched = []
+        for num in numbers:
+            matched.extend(self._paths(num))
+        return matched
+
+
+def find_invoice_files(source_folder, file_numbers, reindex=False):
+    """Находит файлы 'invoice NNNN' с номерами из диапазона через индекс."""
+    index = InvoiceIndex(source_folder)
+    if not reindex:
+        index.load()
+    index.refresh(force=reindex)
+    index.save()
+    print(f"🔎 Индекс: прочитано папок {index.scanned}, без изменений {index.cached}")
+    return index.lookup(file_numbers)
+
+@dataclass
+class BatchSummary:
+    matched: int = 0
+    converted: int = 0
+    skipped: int = 0
+    failed: int = 0
+    quarantined: int = 0
+    # Все PDF диапазона, включая пропущенные: [(исходный файл, профиль, путь PDF), ...]
+    pdf_files: list = field(default_factory=list)
+
+
+def iter_jobs(source_folder, file_numbers, mode, reindex=False, manifest=None, output_dir=None,
+              summary=None, journal=None, quarantine=None, prescan=None, router=None):
+    """
+    Находит файлы диапазона и по одному выдаёт задания. Счётчики
+    matched/skipped и список PDF диапазона накапливаются в summary.
+    С journal пропускаются PDF, готовые в прерванном пакете,
+    с quarantine - книги из карантина. С prescan (PrescanCache) книги
+    разбираются без Excel: задание получает готовый план или ошибку.
+    router (OutputRouter) задаёт пути PDF; по умолчанию - рядом с книгой или в output_dir.
+    """
+    modes = parse_modes(mode)
+    router = router or OutputRouter(root=output_dir)
+    summary = summary if summary is not None else BatchSummary()
+    checksums = (("source",) if manifest else ()) + (("pdf",) if journal else ())
+    index = 0
+    for full_path in find_invoice_files(source_folder, file_numbers, reindex):
+        summary.matched += 1
+        if quarantine and quarantine.is_quarantined(full_path):
+            summary.quarantined += 1
+            continue
+        try:
+            routed = router.route(source_folder, full_path, modes)
+        except ConversionError as e:
+            yield ConversionJob(index, full_path, [], rejected=e)
+            index += 1
+            continue
+        summary.pdf_files.extend((full_path, profile, pdf_path) for profile, pdf_path in routed)
+        outputs = [
+            (profile, pdf_path) for profile, pdf_path in routed
+            if not (manifest and manifest.is_up_to_date(full_path, pdf_path, profile))
+            and not (journal and journal.is_done(full_path, pdf_path))
+        ]
+        if not outputs:
+            summary.skipped += 1
+            continue
+        job = ConversionJob(index, full_path, outputs, checksums=checksums)
+        if prescan is not None:
+            try:
+                job.plan = prescan_workbook(full_path, [profile for profile, _ in outputs], prescan)
+            except ConversionError as e:
+                job.rejected = e
+        if journal:
+            journal.record("queued", job)
+        yield job
+        index += 1
+
+def collect_jobs(source_folder, file_numbers, mode, reindex=False, manifest=None, output_dir=None,
+                 journal=None, quarantine=None, prescan=None, router=None):
+    """Находит файлы диапазона и возвращает (задания, BatchSummary с matched/skipped)."""
+    summary = BatchSummary()
+    jobs = list(iter_jobs(source_folder, file_numbers, mode, reindex, manifest, output_dir,
+                          summary, journal, quarantine, prescan, router))
+    return jobs, summary
+
+def process_excel_files(source_folder, file_numbers, mode, workers=1, backend_factory=None,
+                        reindex=False, incremental=False, output_dir=None, dry_run=False,
+                        bundle=None, report_path=None, pipeline=None, resume=False,
+                        retry=None, quarantine=None, prescan=True, output=None,
+                        shared_queue=None, cost_model=True, dedup="link"):
+    """
+    Конвертирует найденные инвойсы диапазона.
+    bundle - параметры склейки PDF в пакеты (см. bundle_pdfs) или None,
+    report_path - файл отчёта о запуске (.json или .csv),
+    pipeline - параметры конвейерного режима (см. run_pipeline) или None,
+    resume - продолжить прерванный пакет по его журналу,
+    retry - RetryPolicy для временных ошибок, quarantine - Quarantine или None,
+    prescan - разбирать xlsx/xlsm без Excel до запуска движков,
+    output - шаблоны путей и запись PDF (параметры OutputRouter),
+    shared_queue - SharedQueue: задания публикуются в общую очередь и
+    конвертируются воркерами на других машинах (режим координатора),
+    cost_model - учитывать историю длительностей: самые долгие книги
+    запускаются первыми, а во время пакета выводится оставшееся время,
+    dedup - одинаковые по содержимому книги конвертируются один раз, PDF
+    раскладываются по копиям: "link" - жёсткими ссылками, "copy" - копиями,
+    None - без дедупликации.
+    Возвращает BatchSummary или None при критической ошибке.
+    """
+    if backend_factory is None:
+        backend_factory = create_backend_factory({})
+    journal = None
+    try:
+        report = RunReport()
+        manifest = Manifest().load() if incremental else None
+        prescan_cache = PrescanCache().load() if prescan else None
+        costs = CostModel().load() if cost_model else None
+        progress = None
+        copies, linked = {}, {}
+        output = dict(output or {})
+        if output_dir:
+            output["root"] = output_dir
+        router = OutputRouter(**output)
+        if not dry_run:
+            journal = BatchJournal.for_batch(source_folder, file_numbers, mode, output_dir, resume)
+            if resume and journal.states:
+                print(f"↩️ Продолжение пакета: в журнале {len(journal.states)} книг")
+
+        def on_start(job):
+            journal.record("in_progress", job)
+
+        def finish(result):
+            journal.record_result(result)
+            report.add(result)
+            if result.ok and manifest:
+                manifest.record_result(result)
+            if quarantine:
+                quarantine.record(result)
+
+        def on_complete(result):
+            # Итог учитывается сразу: долгая книга не задерживает журнал,
+            # манифест и прогресс книг, готовых после неё
+            finish(result)
+            if costs:
+                costs.record(result)
+            if progress:
+                progress.update(result)
+            for copy in copies.get(result.job.index, ()):
+                copied = copy_result(result, copy, hardlink=dedup != "copy")
+                finish(copied)
+                linked[copy.index] = copied
+
+        def print_result(result):
+            print(f"➡️ Обработка: {os.path.basename(result.job.file_path)}")
+            if result.ok:
+                for _, pdf_path in result.job.outputs:
+                    print(f"   ✅ Готово: {pdf_path}")
+                for warning in (result.info or {}).get("warnings") or []:
+                    print(f"   ⚠ {warning}")
+            else:
+                print(f"   ❌ Ошибка конвертации: {result.error}")
+
+        def on_result(result):
+            # В консоль - в исходном порядке
+            print_result(result)
+            for copy in copies.get(result.job.index, ()):
+                print_result(linked[copy.index])
+
+        if pipeline is not None and not dry_run:
+            # Поиск, копирование, конвертация и выгрузка идут одновременно
+            summary = BatchSummary()
+            job_iter = iter_jobs(source_folder, file_numbers, mode, reindex, manifest,
+                                 output_dir, summary, journal, quarantine, prescan_cache, router)
+            print(f"\n🚀 Конвейер: воркеров {workers}, "
+                  f"предзагрузка {pipeline.get('prefetch_workers', 2)}... Пожалуйста, подождите.")
+            # Задания появляются по ходу поиска: без прогноза, только темп
+            progress = BatchProgress()
+            results = run_pipeline(job_iter, backend_factory, workers, on_result,
+                                   on_start=on_start, retry=retry, on_complete=on_complete,
+                                   **{"writers": router.writers or 2, **pipeline})
+            cache = pipeline.get("cache")
+            if cache is not None:
+                print(f"💾 Локальный кэш: из кэша {cache.hits}, скопировано {cache.misses}, "
+                      f"занято {cache.size / 1024 / 1024:.1f} МБ")
+            jobs = [r.job for r in results]
+        else:
+            started = time.perf_counter()
+            jobs, summary = collect_jobs(source_folder, file_numbers, mode,
+                                         reindex, manifest, output_dir, journal, quarantine,
+                                         prescan_cache, router)
+            report.discovery = time.perf_counter() - started
+            results = []
+
+        if summary.skipped:
+            print(f"⏭ Без изменений (пропущено): {summary.skipped}")
+        if summary.quarantined:
+            print(f"🚫 В карантине (пропущено): {summary.quarantined}")
+
+        if prescan_cache:
+            prescan_cache.save()
+            rejected = sum(1 for job in jobs if job.rejected is not None)
+            if rejected:
+                print(f"⛔ Отклонено без открытия в Excel: {rejected}")
 
-        print(f"\n🏁 ИТОГ: Успешно создано файлов: {count_success}")
+        schedule, predicted = jobs, {}
+        if dedup and not results:
+            schedule, copies, report.conflicts = dedupe_jobs(jobs)
+            if copies:
+                print(f"♊ Копий одинаковых книг: {sum(len(group) for group in copies.values())}, "
+                      f"PDF для них не конвертируются повторно")
+        copy_sources = {copy.index: job.file_path
+                        for job in schedule for copy in copies.get(job.index, ())}
+        convertible = sum(1 for job in schedule if job.rejected is None)
+        if costs and not results:
+            # Сначала самые долгие книги: короткие заполняют хвост пакета
+            ordered, predicted = costs.order([job for job in schedule if job.rejected is None])
+            schedule = ordered + [job for job in schedule if job.rejected is not None]
+        if dry_run:
+            for job in jobs:
+                if job.rejected is not None:
+                    print(f"⛔ {job.file_path}: {job.rejected}")
+                    continue
+                if job.index in copy_sources:
+                    print(f"♊ {job.file_path} = {copy_sources[job.index]}")
+                    continue
+                print(f"📝 {job.file_path}")
+                for profile, pdf_path in job.outputs:
+                    sheets = ""
+                    if job.plan is not None:
+                        selected = active_profiles()[profile].select(job.plan.sheets)
+                        names = [sheet.name for sheet, _ in selected]
+                        sheets = f"  [{', '.join(names)}]"
+                    print(f"   -> {pdf_path}{sheets}")
+            print(f"\n🏁 ПРОБНЫЙ ЗАПУСК: к конвертации {convertible}, пропущено: {summary.skipped}, "
+                  f"движков понадобится: {min(workers, convertible)}")
+            if predicted:
+                expected = sum(predicted.values()) / max(1, min(workers, convertible))
+                print(f"⏱ Ожидаемое время конвертации: ≈ {int(expected // 60):02d}:{int(expected % 60):02d}")
+            print("-" * 30)
+            return summary
+
+        if jobs and not results:
+            progress = BatchProgress(predicted, total=len(schedule))
+
+        if jobs and not results and shared_queue is not None:
+            batch_id = shared_queue.publish(schedule)
+            print(f"\n📤 Опубликовано в общую очередь: {len(schedule)} (пакет {batch_id}). "
+                  f"Ожидание воркеров...")
+            results = shared_queue.wait(batch_id, schedule, on_result,
+                                        on_complete=on_complete) + list(linked.values())
+
+        if jobs and not results:
+            for job in jobs:
+                for pdf_path in job.pdf_paths:
+                    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+
+            if convertible:
+                print(f"\n🚀 Запуск конвертера (процессов: {max(1, min(workers, convertible))})... "
+                      f"Пожалуйста, подождите.")
+            results = run_conversion_pool(schedule, backend_factory, workers,
+                                          on_result=on_result, on_start=on_start, retry=retry,
+                                          writers=router.writers,
+                                          on_complete=on_complete) + list(linked.values())
+
+        if results:
+            summary.converted = sum(1 for r in results if r.ok)
+            summary.failed = len(results) - summary.converted
+
+            failed_files = {r.job.file_path for r in results if not r.ok}
+            summary.pdf_files = [item for item in summary.pdf_files if item[0] not in failed_files]
+
+        if manifest:
+            manifest.save()
+        if costs and not dry_run:
+            costs.save()
+        if quarantine and not dry_run:
+            quarantine.save()
+
+        if bundle is not None and summary.pdf_files:
+            bundle_pdfs(summary.pdf_files, source_folder,
+                        bundle.get("dir") or router.root or source_folder, **bundle.get("options", {}))
+
+        report.finish()
+        print(f"\n🏁 ИТОГ: Успешно создано файлов: {summary.converted}, "
+              f"пропущено: {summary.skipped}, ошибок: {summary.failed}")
+        report.print_summary()
+        if report_path:
+            report.write(report_path)
         print("-" * 30)
+        return summary
 
     except Exception as e:
         print(f"🔥 Критическая ошибка Excel: {e}")
+        return None
     finally:
-        if excel:
+        if journal:
+            journal.close()
+
+def resolve_print_area(backend, wb, sheet, sources, cache, warnings=None):
+    """
+    Возвращает область печати листа из первого непустого источника.
+    Если ни один источник не дал области, ошибки чтения добавляются в
+    warnings. Без warnings (предварительный анализ) неудачное чтение не
+    кэшируется, и при конвертации источник читается движком заново.
+    """
+    failures = []
+    for kind, value in sources:
+        key = (sheet.index, kind, value)
+        if key not in cache:
             try:
-                excel.Quit()
-                print("Excel процесс закрыт.")
-            except:
-                pass
+                if kind == "cell":
+                    cache[key] = backend.read_cell(wb, sheet, value)
+                elif kind == "named":
+                    cache[key] = backend.read_named_range(wb, sheet, value)
+                else:
+                    cache[key] = value
+            except Exception as e:
+                failures.append(f"{sheet.name}: не прочитана область печати ({kind} {value}): {e}")
+                if warnings is None:
+                    continue
+                cache[key] = None
+        if cache[key]:
+            return str(cache[key])
+    if warnings is not None:
+        warnings.extend(failures)
+    return None
 
-def convert_workbook(excel_app, file_path, pdf_path, mode):
-    wb = None
+def convert_workbook(backend, file_path, outputs, plan=None):
+    """
+    Экспортирует книгу во все PDF из outputs за одно открытие:
+    метаданные листов читаются один раз, правила профилей вычисляются
+    по ним, а каждая область печати читается один раз. Перед каждым PDF
+    листам, область которых изменил предыдущий профиль, а этот профиль
+    её не задаёт, возвращается исходная область: PDF профиля не зависит
+    от того, какие ещё профили запрошены. С plan (предварительный анализ) листы и области печати уже известны
+    и из открытой книги не читаются. Ошибки чтения и установки областей
+    печати не прерывают экспорт: они попадают в info["warnings"] и engine.log.
+    """
+    warnings = []
+    with collect_stages() as timings:
+        with stage("open"):
+            wb = backend.open_workbook(file_path)
+        try:
+            if plan is not None:
+                sheets = plan.sheets
+            else:
+                with stage("metadata"):
+                    sheets = backend.list_sheets(wb)
+            if not sheets:
+                raise MissingSheetsError("В файле нет листов.")
+
+            selections = [(active_profiles()[mode].select(sheets), pdf_path) for mode, pdf_path in outputs]
+
+            cache = dict(plan.print_areas) if plan is not None else {}
+            applied = {}
+            # Исходные области изменённых листов и области, заданные сейчас
+            originals, current = {}, {}
+            for selected, pdf_path in selections:
+                with stage("print_area"):
+                    for sheet, sources in selected:
+                        area = resolve_print_area(backend, wb, sheet, sources, cache, warnings)
+                        if area and current.get(sheet.index) != area:
+                            try:
+                                if sheet.index not in originals:
+                                    originals[sheet.index] = backend.get_print_area(wb, sheet)
+                                backend.set_print_area(wb, sheet, area)
+                                current[sheet.index] = applied[sheet.index] = area
+                            except Exception as e:
+                                # Лист печатается без области: PDF создаётся, но с предупреждением
+                                warnings.append(f"{sheet.name}: не задана область печати {area}: {e}")
+                        elif not area and sheet.index in current:
+                            try:
+                                backend.set_print_area(wb, sheet, originals[sheet.index])
+                                del current[sheet.index]
+                            except Exception as e:
+                                warnings.append(f"{sheet.name}: не восстановлена исходная "
+                                                f"область печати: {e}")
+
+                export_sheets = [sheet for sheet, _ in selected]
+                with stage("export"):
+                    if [s.index for s in export_sheets] == sorted(s.index for s in export_sheets):
+                        backend.export_pdf(wb, export_sheets, pdf_path)
+                    else:
+                        # Движки печатают выбранные листы в порядке книги:
+                        # для другого порядка листы экспортируются по одному и склеиваются
+                        parts = []
+                        try:
+                            for number, sheet in enumerate(export_sheets):
+                                part = f"{pdf_path}.part{number}.pdf"
+                                backend.export_pdf(wb, [sheet], part)
+                                parts.append(part)
+                            merge_pdfs(parts, pdf_path)
+                        finally:
+                            for part in parts:
+                                if os.path.exists(part):
+                                    os.remove(part)
+
+            info = {
+                "sheets": {mode: [sheet.name for sheet, _ in selected]
+                           for (mode, _), (selected, _) in zip(outputs, selections)},
+                "print_areas": {sheet.name: applied[sheet.index]
+                                for sheet in sheets if sheet.index in applied},
+                "sheet_count": len(sheets),
+                "warnings": warnings,
+            }
+
+        finally:
+            with stage("close"):
+                backend.close_workbook(wb)
+
+    for warning in warnings:
+        log_event(f"   ⚠ {os.path.basename(file_path)}: {warning}", console=False)
+    info["timings"] = timings
+    return info
+
+def merge_pdfs(paths, pdf_path):
+    """Склеивает PDF-файлы в указанном порядке (pypdf)."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
     try:
-        wb = excel_app.Workbooks.Open(file_path, ReadOnly=True)
+        for path in paths:
+            writer.append(path)
+        writer.write(pdf_path)
+    finally:
+        writer.close()
 
-        if wb.Sheets.Count < 2:
-            print("   ⚠ В файле меньше 2 листов.")
-            return False
+# ==========================================
+# ОТЧЁТ О ЗАПУСКЕ
+# ==========================================
+
+REPORT_STAGES = ["open", "metadata", "print_area", "select", "export", "close"]
 
-        sheets_to_export = [wb.Sheets(1), wb.Sheets(2)]
-        sheet_names = [wb.Sheets(1).Name, wb.Sheets(2).Name]
 
-        if mode == '2':
-            target_names = ["Weight certificate (LI)", "Weight certificate (Y)"]
-            XL_SHEET_VISIBLE = -1
+class RunReport:
+    """
+    Отчёт о запуске: длительности этапов по каждому файлу, размеры,
+    число листов и причины ошибок. Пишется в JSON или CSV (по расширению),
+    в консоль выводятся перцентили этапов и пропускная способность.
+    """
 
-            for sheet in wb.Sheets:
-                if sheet.Name in target_names and sheet.Visible == XL_SHEET_VISIBLE:
-                    if sheet.Name not in sheet_names:
-                        sheets_to_export.append(sheet)
-                        sheet_names.append(sheet.Name)
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.discovery = 0.0
+        self.files = []
+        self.conflicts = {}
 
-        for sheet in sheets_to_export:
+    def add(self, result):
+        def size(path):
             try:
-                print_area = sheet.Range("R1").Value
-                if print_area:
-                    sheet.PageSetup.PrintArea = str(print_area)
-            except:
-                pass
+                return os.path.getsize(path)
+            except OSError:
+                return None
 
-        wb.Sheets(sheet_names[0]).Select()
-        for i in range(1, len(sheet_names)):
-            wb.Sheets(sheet_names[i]).Select(False)
+        info = result.info or {}
+        self.files.append({
+            "file": result.job.file_path,
+            "ok": result.ok,
+            "error": result.error,
+            "category": result.category,
+            "attempts": result.attempts,
+            "duration": round(result.duration, 4),
+            "source_size": size(result.job.file_path),
+            "pdf_size": sum(size(p) or 0 for p in result.job.pdf_paths) if result.ok else None,
+            "sheet_count": info.get("sheet_count"),
+            "outputs": len(result.job.outputs),
+            "copy_of": result.copy_of,
+            "warnings": list(info.get("warnings") or []),
+            "stages": {name: round(value, 4) for name, value in result.timings.items()},
+        })
 
-        wb.ActiveSheet.ExportAsFixedFormat(0, pdf_path)
-        return True
+    def finish(self):
+        self.finished = time.time()
+        return self
 
-    except Exception as e:
-        print(f"   Ошибка внутри файла: {e}")
-        return False
-    finally:
-        if wb:
+    def summary(self):
+        wall = (self.finished or time.time()) - self.started
+        stages = {}
+        names = REPORT_STAGES + sorted({n for f in self.files for n in f["stages"]} - set(REPORT_STAGES))
+        for name in names:
+            values = [f["stages"][name] for f in self.files if name in f["stages"]]
+            if values:
+                stages[name] = {
+                    "total": round(sum(values), 4),
+                    "p50": round(percentile(values, 50), 4),
+                    "p90": round(percentile(values, 90), 4),
+                    "p99": round(percentile(values, 99), 4),
+                    "max": round(max(values), 4),
+                }
+        # Копии одинаковых книг не конвертировались: в перцентили не входят
+        durations = [f["duration"] for f in self.files if not f["copy_of"]]
+        source_bytes = sum(f["source_size"] or 0 for f in self.files)
+        errors = {}
+        causes = {}
+        for f in self.files:
+            if not f["ok"]:
+                errors[f["error"]] = errors.get(f["error"], 0) + 1
+                cause = causes.setdefault(f["category"] or "other", {"count": 0, "files": []})
+                cause["count"] += 1
+                cause["files"].append(f["file"])
+        return {
+            "started": self.started,
+            "wall_time": round(wall, 3),
+            "discovery": round(self.discovery, 4),
+            "files": len(self.files),
+            "failed": sum(1 for f in self.files if not f["ok"]),
+            "files_per_minute": round(len(self.files) / wall * 60, 2) if wall > 0 else None,
+            "mb_per_minute": round(source_bytes / (1024 * 1024) / wall * 60, 2) if wall > 0 else None,
+            "duration": {
+                "p50": round(percentile(durations, 50), 4),
+                "p90": round(percentile(durations, 90), 4),
+                "p99": round(percentile(durations, 99), 4),
+            },
+            "stages": stages,
+            "errors": errors,
+            "causes": causes,
+            "retried": sum(1 for f in self.files if f["attempts"] > 1),
+            "copies": sum(1 for f in self.files if f["copy_of"] and f["ok"]),
+            "warnings": {f["file"]: f["warnings"] for f in self.files if f["warnings"]},
+            "conflicts": {str(number): files for number, files in self.conflicts.items()},
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        if not self.files:
+            return
+        print(f"⏱ Поиск файлов: {summary['discovery']:.2f} с; время файла p50/p90/p99: "
+              f"{summary['duration']['p50']:.2f}/{summary['duration']['p90']:.2f}/"
+              f"{summary['duration']['p99']:.2f} с")
+        for name, values in summary["stages"].items():
+            print(f"   {name:<11} всего {values['total']:8.2f} с   p50 {values['p50']:.3f}   "
+                  f"p90 {values['p90']:.3f}   max {values['max']:.3f}")
+        print(f"⚡ Пропускная способность: {summary['files_per_minute']} файлов/мин, "
+              f"{summary['mb_per_minute']} МБ/мин")
+        if summary["retried"]:
+            print(f"🔁 Файлов с повторами: {summary['retried']}")
+        if summary["copies"]:
+            print(f"♊ Одинаковые книги: PDF разложены без конвертации для {summary['copies']} копий")
+        if summary["warnings"]:
+            print(f"⚠ Файлов с ошибками областей печати (PDF созданы без этих областей): "
+                  f"{len(summary['warnings'])}")
+            for path in list(summary["warnings"])[:5]:
+                print(f"     {path}")
+            if len(summary["warnings"]) > 5:
+                print(f"     ... и ещё {len(summary['warnings']) - 5}")
+        for number, files in summary["conflicts"].items():
+            print(f"⚠ Номер {number}: файлы с разным содержимым")
+            for path in files:
+                print(f"     {path}")
+        for category, cause in sorted(summary["causes"].items(), key=lambda item: -item[1]["count"]):
+            print(f"❌ {ERROR_CATEGORIES.get(category, category)}: {cause['count']}")
+            for path in cause["files"][:5]:
+                print(f"     {path}")
+            if cause["count"] > 5:
+                print(f"     ... и ещё {cause['count'] - 5}")
+
+    def write(self, path):
+        """Сохраняет отчёт: .csv - строка на файл, иначе JSON с итогами."""
+        try:
+            if path.lower().endswith(".csv"):
+                stage_names = REPORT_STAGES + sorted(
+                    {n for f in self.files for n in f["stages"]} - set(REPORT_STAGES))
+                with open(path, "w", encoding="utf-8-sig", newline="") as f:
+                    writer = csv.writer(f, delimiter=";")
+                    writer.writerow(["file", "ok", "duration", "source_size", "pdf_size",
+                                     "sheet_count", "outputs", "attempts", "copy_of"] + stage_names
+                                    + ["category", "error", "warnings"])
+                    for item in self.files:
+                        writer.writerow(
+                            [item["file"], int(item["ok"]), item["duration"], item["source_size"],
+                             item["pdf_size"], item["sheet_count"], item["outputs"], item["attempts"],
+                             item["copy_of"]]
+                            + [item["stages"].get(name, "") for name in stage_names]
+                            + [item["category"], item["error"], " | ".join(item["warnings"])]
+                        )
+            else:
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump({"summary": self.summary(), "files": self.files},
+                              f, ensure_ascii=False, indent=2)
+            print(f"📊 Отчёт сохранён: {path}")
+        except OSError as e:
+            print(f"⚠ Не удалось сохранить отчёт: {e}")
+
+# ==========================================
+# ПОСТОБРАБОТКА PDF (ПАКЕТЫ)
+# ==========================================
+
+def write_bundle(entries, bundle_path, compress=True):
+    """
+    Склеивает PDF [(закладка, путь), ...] в один файл с закладками.
+    Страницы всех документов копируются в PdfWriter и остаются в памяти
+    до записи файла, поэтому расход памяти растёт с размером пакета;
+    ограничивает его деление на части по max_mb (см. bundle_pdfs).
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    for title, path in entries:
+        with open(path, "rb") as f:
+            reader = PdfReader(f)
+            start = len(writer.pages)
+            for page in reader.pages:
+                writer.add_page(page)
+        if len(writer.pages) > start:
+            writer.add_outline_item(title, start)
+
+    if compress:
+        for page in writer.pages:
+            page.compress_content_streams()
+        # Одинаковые шрифты и изображения разных инвойсов хранятся в пакете один раз
+        writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+
+    tmp_path = bundle_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        writer.write(f)
+    os.replace(tmp_path, bundle_path)
+
+def bundle_pdfs(pdf_files, source_folder, bundle_dir, group_by="range",
+                compress=True, max_mb=0, name="bundle {first}-{last}"):
+    """
+    Собирает PDF диапазона в пакеты: один на профиль и диапазон
+    (group_by="range") или на подпапку-отгрузку (group_by="folder").
+    Закладки ставятся по номерам инвойсов. При max_mb пакет делится
+    на части, чтобы вложение проходило ограничение почтового шлюза;
+    часть собирается в памяти целиком, так что max_mb ограничивает и память.
+    Возвращает пути созданных пакетов.
+    """
+    groups = {}
+    for file_path, profile, pdf_path in pdf_files:
+        if not os.path.exists(pdf_path):
+            continue
+        folder = os.path.relpath(os.path.dirname(file_path), source_folder) \
+            if group_by == "folder" else "."
+        number = invoice_number(os.path.basename(file_path))
+        groups.setdefault((folder, profile), []).append((number, pdf_path))
+
+    profiles = {profile for _, profile in groups}
+    created = []
+    for (folder, profile), items in sorted(groups.items()):
+        items.sort(key=lambda item: (item[0] is None, item[0] or 0, item[1]))
+        numbers = [n for n, _ in items if n is not None]
+        stem = name.format(first=min(numbers, default=""), last=max(numbers, default=""),
+                           profile=profile)
+        if len(profiles) > 1:
+            known = active_profiles()
+            stem += known[profile].suffix if profile in known else f" {profile}"
+
+        # Деление на части по суммарному размеру входных файлов
+        parts = [[]]
+        size = 0
+        for number, pdf_path in items:
+            file_size = os.path.getsize(pdf_path)
+            if max_mb and parts[-1] and size + file_size > max_mb * 1024 * 1024:
+                parts.append([])
+                size = 0
+            parts[-1].append((f"Invoice {number}" if number is not None
+                              else os.path.basename(pdf_path), pdf_path))
+            size += file_size
+
+        target_dir = os.path.normpath(os.path.join(bundle_dir, folder))
+        os.makedirs(target_dir, exist_ok=True)
+        for part_number, entries in enumerate(parts, start=1):
+            part_stem = stem if len(parts) == 1 else f"{stem} ({part_number})"
+            bundle_path = os.path.join(target_dir, part_stem + ".pdf")
             try:
-                wb.Close(SaveChanges=False)
-            except:
-                pass
+                write_bundle(entries, bundle_path, compress)
+            except Exception as e:
+                print(f"   ❌ Ошибка склейки пакета {part_stem}: {e}")
+                continue
+            created.append(bundle_path)
+            print(f"📦 Пакет: {bundle_path} (документов: {len(entries)}, "
+                  f"{os.path.getsize(bundle_path) / (1024 * 1024):.1f} МБ)")
+    return created
+
+# ==========================================
+# КОМАНДНАЯ СТРОКА И ПАКЕТНЫЕ ЗАДАНИЯ
+# ==========================================
+
+EXIT_OK = 0
+EXIT_FAILURES = 1
+EXIT_USAGE = 2
+EXIT_NO_FILES = 3
+EXIT_CRITICAL = 4
+EXIT_INTERRUPTED = 130
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Экспорт инвойсов Excel в PDF. Без параметров запускается интерактивное меню."
+    )
+    parser.add_argument("--mode",
+                        help="профили через запятую: invoice - инвойс, 1 - инвойс и спецификация, "
+                             "2 - плюс весовой сертификат (например 1,2)")
+    parser.add_argument("--source", help="папка с инвойсами (по умолчанию source_path из config.json)")
+    parser.add_argument("--range", dest="range_str", help="диапазон номеров, например 3550-3553,3560")
+    parser.add_argument("--output-dir", help="папка для PDF (по умолчанию рядом с исходными файлами)")
+    parser.add_argument("--workers", type=int, help="число процессов конвертации")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), help="движок конвертации")
+    parser.add_argument("--job", action="append", default=[],
+                        help="файл заданий JSON/YAML (можно указать несколько раз)")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что будет сконвертировано")
+    parser.add_argument("--reindex", action="store_true", help="полностью перестроить индекс файлов")
+    parser.add_argument("--incremental", action="store_true", default=None,
+                        help="пропускать книги, PDF которых актуальны")
+    parser.add_argument("--bundle", action="store_true",
+                        help="склеить PDF диапазона в пакет с закладками (параметры - \"bundle\" в config.json)")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить прерванный пакет: пропустить книги, уже готовые по журналу")
+    parser.add_argument("--ignore-quarantine", action="store_true",
+                        help="конвертировать и книги из карантина (повторно сбоящие)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="конвейерный режим: поиск, копирование на локальный диск и конвертация "
+                             "идут одновременно (параметры - \"pipeline\" в config.json)")
+    parser.add_argument("--stage-dir", metavar="ПАПКА",
+                        help="локальный кэш книг с сетевой папки (включает конвейерный режим; "
+                             "лимит - \"staging\": {\"max_mb\": ...} в config.json)")
+    parser.add_argument("--report",
+                        help="файл отчёта о запуске (.json или .csv); {n} - номер задания в пакете")
+    parser.add_argument("--coordinator", metavar="ОЧЕРЕДЬ",
+                        help="опубликовать задания в общую очередь SQLite и дождаться воркеров")
+    parser.add_argument("--worker", metavar="ОЧЕРЕДЬ",
+                        help="конвертировать задания из общей очереди SQLite (воркер)")
+    parser.add_argument("--lease", type=int, default=120,
+                        help="аренда задания воркером, секунд (продлевается, пока идёт конвертация)")
+    parser.add_argument("--idle-exit", type=int, default=0,
+                        help="завершить воркер после стольких секунд без заданий (0 - не завершать)")
+    parser.add_argument("--watch", action="store_true",
+                        help="наблюдать за папкой и конвертировать новые и изменённые инвойсы")
+    parser.add_argument("--interval", type=float, default=2.0, help="период опроса папки, секунд")
+    parser.add_argument("--debounce", type=float, default=3.0,
+                        help="сколько секунд файл не должен меняться, чтобы считаться сохранённым")
+    parser.add_argument("--serve", action="store_true", help="запустить сервис конвертации с HTTP API")
+    parser.add_argument("--host", default="127.0.0.1", help="адрес HTTP API сервиса")
+    parser.add_argument("--port", type=int, default=8765, help="порт HTTP API сервиса")
+    return parser
+
+def is_batch_run(args):
+    """Пакетный режим включается любым из параметров задания."""
+    return bool(args.mode or args.source or args.range_str or args.job or args.dry_run or args.serve
+                or args.worker or args.watch)
+
+def load_job_file(path):
+    """
+    Читает файл заданий. Формат (JSON или YAML):
+    {"mode": "1", "workers": 2, "jobs": [{"source": "...", "range": "3550-3553"}, ...]}
+    Параметры верхнего уровня служат значениями по умолчанию для заданий.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("для YAML-файлов заданий установите PyYAML")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+
+    if isinstance(data, list):
+        data = {"jobs": data}
+    if not isinstance(data, dict) or not isinstance(data.get("jobs"), list):
+        raise ValueError(f"{path}: ожидается список заданий 'jobs'")
+
+    defaults = {k: v for k, v in data.items() if k != "jobs"}
+    return [{**defaults, **job} for job in data["jobs"]]
+
+def bundle_settings(config, enabled=None):
+    """
+    Параметры склейки из "bundle" в config.json:
+    {"enabled": true, "dir": "...", "group_by": "range" | "folder",
+     "compress": true, "max_mb": 10, "name": "bundle {first}-{last}"}.
+    """
+    options = dict(config.get("bundle", {}))
+    if not (enabled or (enabled is None and options.pop("enabled", False))):
+        return None
+    options.pop("enabled", None)
+    return {"dir": options.pop("dir", None), "options": options}
+
+def retry_settings(config):
+    """
+    Политика повторов из "retry" в config.json:
+    {"retries": 2, "backoff": 2.0, "max_delay": 60, "categories": ["locked", "busy", ...]}.
+    "retries": 0 отключает повторы. При включённом watchdog ("engine") таймауты
+    и падения движка повторяет только он ("engine": {"retries": N}).
+    """
+    options = dict(config.get("retry", {}))
+    categories = tuple(options.pop("categories", TRANSIENT_CATEGORIES))
+    if config.get("engine", {}) is not False:
+        categories = tuple(c for c in categories if c not in WATCHDOG_CATEGORIES)
+    return RetryPolicy(categories=categories, **options)
+
+def dedup_settings(config):
+    """
+    Дедупликация из "dedup" в config.json: "link" (по умолчанию) - PDF копий
+    жёсткими ссылками, "copy" - копиями файлов, false - отключить.
+    """
+    value = config.get("dedup", "link")
+    if not value:
+        return None
+    return "copy" if value == "copy" else "link"
+
+def quarantine_settings(config, ignore=False):
+    """
+    Карантин из "quarantine" в config.json: {"after": 3, "file": "quarantine.json"}.
+    "after": 0 или ignore отключают пропуск книг из карантина.
+    """
+    options = config.get("quarantine", {})
+    after = int(options.get("after", 3))
+    if ignore or after <= 0:
+        return None
+    return Quarantine(options.get("file", QUARANTINE_FILE), after).load()
+
+def pipeline_settings(config, enabled=False, stage_dir=None):
+    """
+    Параметры конвейера из "pipeline" в config.json:
+    {"enabled": true, "prefetch_workers": 2, "queue_size": 8, "local_dir": null}.
+    Локальный кэш книг ("staging": {"dir": "C:\\PdfCache", "max_mb": 2048}
+    или stage_dir) включает конвейер автоматически.
+    """
+    options = dict(config.get("pipeline", {}))
+    staging = dict(config.get("staging", {}))
+    if stage_dir:
+        staging["dir"] = stage_dir
+    if not (enabled or options.pop("enabled", False) or staging.get("dir")):
+        return None
+    options.pop("enabled", None)
+    if staging.get("dir"):
+        options["cache"] = StagingCache(staging["dir"], staging.get("max_mb", 2048))
+    return options
+
+def run_batch(args):
+    """Выполняет задания из командной строки и файлов заданий. Возвращает код выхода."""
+    config = load_config()
+    try:
+        load_profiles(config)
+    except (ValueError, re.error) as e:
+        print(f"❌ Ошибка профилей в config.json: {e}")
+        return EXIT_USAGE
+
+    cli_job = {}
+    for key, value in (("mode", args.mode), ("source", args.source), ("range", args.range_str),
+                       ("output_dir", args.output_dir), ("workers", args.workers)):
+        if value is not None:
+            cli_job[key] = value
+
+    try:
+        jobs = []
+        for path in args.job:
+            jobs.extend({**job, **cli_job} for job in load_job_file(path))
+    except Exception as e:
+        print(f"❌ Ошибка файла заданий: {e}")
+        return EXIT_USAGE
+    if not args.job:
+        jobs.append(cli_job)
+
+    if args.backend:
+        config["backend"] = args.backend
+    try:
+        backend_factory = create_backend_factory(config)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return EXIT_USAGE
+
+    incremental = args.incremental if args.incremental is not None else bool(config.get("incremental"))
+    bundle = bundle_settings(config, args.bundle)
+    pipeline = pipeline_settings(config, args.pipeline, args.stage_dir)
+    retry = retry_settings(config)
+    quarantine = quarantine_settings(config, args.ignore_quarantine)
+
+    # Сервис, общая очередь и наблюдение за папкой - в модулях etp_*.py
+    if args.serve:
+        from etp_service import run_service
+
+        service = config.get("service", {})
+        return run_service(backend_factory, args.workers or int(config.get("workers", 1)),
+                           args.host, args.port, incremental,
+                           job_ttl=float(service.get("job_ttl", 3600)),
+                           max_jobs=int(service.get("max_jobs", 1000)))
+    if args.worker:
+        from etp_queue import run_worker
+
+        counters = run_worker(args.worker, backend_factory,
+                              args.workers or int(config.get("workers", 1)),
+                              lease=args.lease, idle_exit=args.idle_exit, retry=retry,
+                              prescan=bool(config.get("prescan", True)))
+        if counters["engine_errors"] and not counters["engines"]:
+            # Ни один движок не запустился: супервизор должен отличить это от пустой очереди
+            return EXIT_CRITICAL
+        return EXIT_FAILURES if counters["failed"] else EXIT_OK
+    if args.watch:
+        source = args.source or config.get("source_path")
+        try:
+            mode = ",".join(parse_modes(args.mode or "1"))
+        except ValueError as e:
+            print(f"❌ {e} (--mode 1, 2, invoice или их список).")
+            return EXIT_USAGE
+        if not source or not os.path.isdir(source):
+            print(f"❌ Папка не существует: {source}")
+            return EXIT_USAGE
+        output = dict(config.get("output", {}))
+        if args.output_dir:
+            output["root"] = args.output_dir
+        from etp_watch import run_watch
+
+        return run_watch(source, mode, backend_factory, args.workers or int(config.get("workers", 1)),
+                         incremental, output, args.interval, args.debounce)
+    shared_queue = None
+    if args.coordinator:
+        from etp_queue import SharedQueue
+
+        shared_queue = SharedQueue(args.coordinator)
+
+    # Сначала проверяются все задания, чтобы не прерывать пакет на середине
+    prepared = []
+    for number, job in enumerate(jobs, start=1):
+        source = job.get("source") or config.get("source_path")
+        file_numbers = parse_range(str(job.get("range", "")))
+        try:
+            mode = ",".join(parse_modes(str(job.get("mode", ""))))
+        except ValueError as e:
+            print(f"❌ Задание {number}: {e} (--mode 1, 2, invoice или их список).")
+            return EXIT_USAGE
+        if not source or not os.path.isdir(source):
+            print(f"❌ Задание {number}: папка не существует: {source}")
+            return EXIT_USAGE
+        if not file_numbers:
+            print(f"❌ Задание {number}: не указан корректный диапазон.")
+            return EXIT_USAGE
+        output = {**config.get("output", {}), **job.get("output", {})}
+        try:
+            OutputRouter(**output)
+        except (ValueError, TypeError) as e:
+            print(f"❌ Задание {number}: неверные параметры \"output\": {e}")
+            return EXIT_USAGE
+        prepared.append((job, source, mode, file_numbers, output))
+
+    totals = BatchSummary()
+    reindex = args.reindex
+    for number, (job, source, mode, file_numbers, output) in enumerate(prepared, start=1):
+        print(f"\n📂 {source} [{job.get('range')}], режим {mode}")
+        summary = process_excel_files(
+            source, file_numbers, mode,
+            workers=int(job.get("workers") or config.get("workers", 1)),
+            backend_factory=backend_factory,
+            reindex=reindex,
+            incremental=incremental,
+            output_dir=job.get("output_dir"),
+            dry_run=args.dry_run,
+            bundle=bundle_settings(config, job.get("bundle")) if "bundle" in job else bundle,
+            report_path=(job.get("report") or args.report or "").replace("{n}", str(number)) or None,
+            pipeline=pipeline,
+            resume=bool(job.get("resume", args.resume)),
+            retry=retry,
+            quarantine=quarantine,
+            prescan=bool(config.get("prescan", True)),
+            output=output,
+            shared_queue=shared_queue,
+            cost_model=bool(config.get("cost_model", True)),
+            dedup=dedup_settings(config)
+        )
+        reindex = False
+        if summary is None:
+            return EXIT_CRITICAL
+        for field in ("matched", "converted", "skipped", "failed", "quarantined"):
+            setattr(totals, field, getattr(totals, field) + getattr(summary, field))
+
+    if totals.failed:
+        return EXIT_FAILURES
+    if not totals.matched:
+        print("⚠ Не найдено ни одного файла из диапазона.")
+        return EXIT_NO_FILES
+    return EXIT_OK
 
 # ==========================================
 # ГЛАВНОЕ МЕНЮ
 # ==========================================
 
-def main():
+def main(args=None):
     config = load_config()
+    try:
+        load_profiles(config)
+    except (ValueError, re.error) as e:
+        print(f"❌ Ошибка профилей в config.json: {e}")
+        return
     last_path = config.get("source_path")
+    # --reindex: полная перестройка индекса файлов при первом запуске обработки
+    reindex = bool(args and args.reindex)
+    # --incremental (или "incremental" в конфиге): пропуск актуальных PDF
+    incremental = bool(args and args.incremental) or bool(config.get("incremental"))
+    if args and args.backend:
+        config["backend"] = args.backend
+    workers = args.workers if args and args.workers else int(config.get("workers", 1))
+    # --output-dir, --report и --coordinator действуют на каждый запуск из меню
+    output_dir = args.output_dir if args else None
+    report = args.report if args else None
+    shared_queue = None
+    if args and args.coordinator:
+        from etp_queue import SharedQueue
+
+        shared_queue = SharedQueue(args.coordinator)
+        print(f"📤 Задания публикуются в общую очередь: {args.coordinator}")
+    if output_dir:
+        print(f"📁 PDF сохраняются в {output_dir}")
+    runs = 0
 
     while True:
         print("\n" + "=" * 50)
@@ -209,18 +3860,22 @@ def main():
         print("Выберите действие:")
         print("1. Инвойс и спецификация")
         print("2. Инвойс, спецификация и весовой сертификат")
+        print("3. Все варианты за один проход (отдельные PDF)")
         print("0. Выход из программы")
 
-        mode_choice = input("\nВаш выбор (0-2): ").strip()
+        mode_choice = input("\nВаш выбор (0-3): ").strip()
 
         if mode_choice == '0':
             print("Всего доброго!")
             break
 
-        if mode_choice not in ['1', '2']:
+        if mode_choice not in ['1', '2', '3']:
             print("❌ Ошибка: Неверный выбор.")
             continue
 
+        if mode_choice == '3':
+            mode_choice = "invoice,1,2"
+
         print()
         source_path = get_clean_path(
             "Укажите путь к директории (или 'menu' для отмены):",
@@ -239,26 +3894,60 @@ def main():
         save_config(config)
         last_path = source_path
 
-        range_input = input("Укажите диапазон номеров (например: 3550-3553,3560): ").strip()
+        range_input = input("Укажите диапазон номеров (например: 3550-3553,3560 или 3550-,!3555): ").strip()
         file_numbers = parse_range(range_input)
 
         if not file_numbers:
             print("❌ Не указан корректный диапазон.")
             continue
 
-        process_excel_files(source_path, file_numbers, mode_choice)
+        runs += 1
+        process_excel_files(
+            source_path, file_numbers, mode_choice,
+            workers=workers,
+            backend_factory=create_backend_factory(config),
+            reindex=reindex,
+            incremental=incremental,
+            output_dir=output_dir,
+            report_path=(report or "").replace("{n}", str(runs)) or None,
+            bundle=bundle_settings(config, args and args.bundle or None),
+            pipeline=pipeline_settings(config, bool(args and args.pipeline),
+                                       args and args.stage_dir or None),
+            resume=bool(args and args.resume),
+            retry=retry_settings(config),
+            quarantine=quarantine_settings(config, bool(args and args.ignore_quarantine)),
+            prescan=bool(config.get("prescan", True)),
+            output=config.get("output"),
+            shared_queue=shared_queue,
+            cost_model=bool(config.get("cost_model", True)),
+            dedup=dedup_settings(config)
+        )
+        reindex = False
 
 if __name__ == "__main__":
+    # Модули etp_*.py импортируют ExcelToPdf: запущенный скрипт должен быть
+    # этим же модулем, иначе появится вторая копия с собственными PROFILES
+    sys.modules.setdefault("ExcelToPdf", sys.modules[__name__])
+    args = build_arg_parser().parse_args()
+    interactive = not is_batch_run(args)
+    exit_code = EXIT_OK
     try:
-        main()
+        if interactive:
+            main(args)
+        else:
+            exit_code = run_batch(args)
     except KeyboardInterrupt:
         print("\nПрограмма остановлена пользователем.")
+        exit_code = EXIT_INTERRUPTED
     except Exception as e:
         print("\n" + "!"*50)
         print(f"КРИТИЧЕСКАЯ ОШИБКА: {e}")
         print("!"*50)
         import traceback
         traceback.print_exc()
+        exit_code = EXIT_CRITICAL
     finally:
         print("\nРабота завершена.")
-        input("Нажмите Enter, чтобы закрыть окно...")
+        if interactive:
+            input("Нажмите Enter, чтобы закрыть окно...")
+    sys.exit(exit_code)
@@ -0,0 +1,333 @@
+"""
+Бенчмарк ExcelToPdf без Excel: генерирует синтетическое дерево инвойсов,
+замеряет поиск файлов, выбор листов и конвертацию через движок-имитацию
+с настраиваемой задержкой, записывает пропускную способность и память.
+
+Пример:
+    python benchmark.py --files 5000 --latency 0.02 --workers 1,2,4
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import threading
+import zipfile
+import tracemalloc
+
+import ExcelToPdf as etp
+
+
+# ==========================================
+# СИНТЕТИЧЕСКИЕ КНИГИ
+# ==========================================
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '</Types>'
+)
+
+def write_workbook(path, sheets):
+    """
+    Пишет минимальный xlsx. sheets - список (имя, состояние, область печати в R1).
+    """
+    workbook = [
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<workbook xmlns="{etp.XLSX_MAIN_NS}" xmlns:r="{etp.XLSX_REL_NS}">'
+        '<bookViews><workbookView activeTab="0"/></bookViews><sheets>'
+    ]
+    rels = [f'<?xml version="1.0" encoding="UTF-8"?><Relationships xmlns="{etp.XLSX_PKG_REL_NS}">']
+    strings = []
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", CONTENT_TYPES)
+        for number, (name, state, area) in enumerate(sheets, start=1):
+            state_attr = f' state="{state}"' if state != "visible" else ""
+            workbook.append(f'<sheet name="{name}" sheetId="{number}"{state_attr} r:id="rId{number}"/>')
+            rels.append(f'<Relationship Id="rId{number}" Type="{etp.XLSX_REL_NS}/worksheet" '
+                        f'Target="worksheets/sheet{number}.xml"/>')
+            r1 = ""
+            if area:
+                r1 = f'<c r="R1" t="s"><v>{len(strings)}</v></c>'
+                strings.append(area)
+            rows = "".join(
+                f'<row r="{row}"><c r="A{row}"><v>{row * number}</v></c></row>' for row in range(2, 40)
+            )
+            zf.writestr(
+                f"xl/worksheets/sheet{number}.xml",
+                f'<worksheet xmlns="{etp.XLSX_MAIN_NS}"><sheetData>'
+                f'<row r="1"><c r="A1" t="inlineStr"><is><t>{name}</t></is></c>{r1}</row>{rows}'
+                f'</sheetData></worksheet>'
+            )
+        workbook.append("</sheets></workbook>")
+        rels.append("</Relationships>")
+        zf.writestr("xl/workbook.xml", "".join(workbook))
+        zf.writestr("xl/_rels/workbook.xml.rels", "".join(rels))
+        zf.writestr(
+            "xl/sharedStrings.xml",
+            f'<sst xmlns="{etp.XLSX_MAIN_NS}">' + "".join(f"<si><t>{s}</t></si>" for s in strings) + "</sst>"
+        )
+
+def generate_tree(root, files, first_number=1000, depth=3, fanout=6, seed=1):
+    """
+    Создаёт дерево 'год/месяц/отгрузка/invoice NNNN.xlsx' с разным числом
+    листов, скрытыми и видимыми весовыми сертификатами и посторонними файлами.
+    Возвращает список номеров созданных инвойсов.
+    """
+    rnd = random.Random(seed)
+    folders = [root]
+    for level in range(depth):
+        folders = [os.path.join(folder, f"{level}-{i}") for folder in folders for i in range(fanout)]
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+
+    numbers = []
+    for offset in range(files):
+        number = first_number + offset
+        folder = rnd.choice(folders)
+        sheets = [("Invoice", "visible", "A1:H40"), ("Specification", "visible", "A1:J60")]
+        sheets += [(f"Calc {i}", rnd.choice(["visible", "hidden"]), None)
+                   for i in range(rnd.randint(0, 6))]
+        for name in etp.DEFAULT_PROFILES["2"]["sheets"][2:]:
+            if rnd.random() < 0.5:
+                sheets.append((name["name"], rnd.choice(["visible", "hidden"]), "A1:F30"))
+        if rnd.random() < 0.02:
+            sheets = sheets[:1]
+        write_workbook(os.path.join(folder, f"invoice {number}.xlsx"), sheets)
+        numbers.append(number)
+
+        if rnd.random() < 0.3:
+            with open(os.path.join(folder, f"packing {number}.txt"), "w") as f:
+                f.write("x")
+    return numbers
+
+
+# ==========================================
+# ДВИЖОК-ИМИТАЦИЯ
+# ==========================================
+
+class BenchBackend(etp._XlsxReader, etp.Backend):
+    """
+    Читает листы и области печати из xlsx как LibreOfficeBackend
+    (общий _XlsxReader), а экспорт имитирует задержкой и записью заглушки PDF.
+    """
+
+    name = "bench"
+
+    def __init__(self, latency=0.02, per_sheet=0.005, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.per_sheet = per_sheet
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def open_workbook(self, file_path):
+        return etp._XlsxWorkbook(file_path, file_path)
+
+    def export_pdf(self, wb, sheets, pdf_path):
+        time.sleep(self.latency + self.per_sheet * len(sheets))
+        if self._random.random() < self.failure_rate:
+            raise etp.ConversionError("имитация сбоя экспорта")
+        with open(pdf_path, "wb") as f:
+            f.write(etp.stub_pdf_bytes(os.path.basename(pdf_path)))
+
+
+# ==========================================
+# ЗАМЕРЫ
+# ==========================================
+
+class MemorySampler:
+    """Фоновый поток: пишет RSS процесса и память tracemalloc по времени."""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def __enter__(self):
+        tracemalloc.start()
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        tracemalloc.stop()
+
+    def _sample(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.samples.append({
+            "t": round(time.perf_counter() - self._started, 3),
+            "rss_mb": etp.process_memory_mb(os.getpid()),
+            "python_mb": round(current / (1024 * 1024), 3),
+            "python_peak_mb": round(peak / (1024 * 1024), 3),
+        })
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def peak(self):
+        return max((s["python_peak_mb"] for s in self.samples), default=0.0)
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    value = func(*args, **kwargs)
+    return value, time.perf_counter() - started
+
+def walk_baseline(source_folder, file_numbers):
+    """Поиск прежним способом: полный os.walk и проверка имени каждого файла."""
+    matched = []
+    for root, _, files in os.walk(source_folder):
+        for file in files:
+            number = etp.invoice_number(file)
+            if number is not None and number in file_numbers:
+                matched.append(os.path.join(root, file))
+    return matched
+
+def bench_discovery(tree, workdir, range_str):
+    file_numbers = etp.parse_range(range_str)
+    index_file = os.path.join(workdir, "bench_index.json")
+
+    walk, walk_time = timed(walk_baseline, tree, file_numbers)
+
+    def indexed(force):
+        index = etp.InvoiceIndex(tree, index_file)
+        if not force:
+            index.load()
+        index.refresh(force=force)
+        index.save()
+        return index.lookup(file_numbers)
+
+    cold, cold_time = timed(indexed, True)
+    warm, warm_time = timed(indexed, False)
+    _, parse_time = timed(etp.parse_range, range_str)
+    assert len(walk) == len(cold) == len(warm), "индекс и os.walk нашли разное число файлов"
+    return {
+        "range": range_str,
+        "matched": len(warm),
+        "parse_range_s": round(parse_time, 5),
+        "os_walk_s": round(walk_time, 4),
+        "index_cold_s": round(cold_time, 4),
+        "index_warm_s": round(warm_time, 4),
+    }, warm
+
+def bench_selection(paths, modes):
+    backend = BenchBackend()
+    started = time.perf_counter()
+    selected = invalid = 0
+    for path in paths:
+        wb = backend.open_workbook(path)
+        sheets = backend.list_sheets(wb)
+        for mode in modes:
+            try:
+                selected += len(etp.PROFILES[mode].select(sheets))
+            except etp.ConversionError:
+                invalid += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "files": len(paths),
+        "modes": modes,
+        "seconds": round(elapsed, 4),
+        "files_per_s": round(len(paths) / elapsed, 1) if elapsed else None,
+        "selected_sheets": selected,
+        "invalid": invalid,
+    }
+
+def bench_conversion(paths, outdir, modes, workers, latency, failure_rate):
+    jobs = []
+    for number, path in enumerate(paths):
+        base = os.path.join(outdir, f"w{workers}", os.path.splitext(os.path.basename(path))[0] + ".pdf")
+        jobs.append(etp.ConversionJob(number, path, etp.profile_output_paths(base, modes)))
+    os.makedirs(os.path.join(outdir, f"w{workers}"), exist_ok=True)
+
+    report = etp.RunReport()
+    factory = lambda: BenchBackend(latency=latency, failure_rate=failure_rate, seed=workers)
+    with MemorySampler() as memory:
+        results = etp.run_conversion_pool(jobs, factory, workers, on_result=report.add)
+    summary = report.finish().summary()
+    return {
+        "workers": workers,
+        "files": len(results),
+        "failed": sum(1 for r in results if not r.ok),
+        "wall_s": summary["wall_time"],
+        "files_per_minute": summary["files_per_minute"],
+        "duration": summary["duration"],
+        "stages": summary["stages"],
+        "python_peak_mb": memory.peak(),
+        "memory": memory.samples,
+    }
+
+
+# ==========================================
+# ЗАПУСК
+# ==========================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк ExcelToPdf на синтетических книгах")
+    parser.add_argument("--files", type=int, default=2000, help="число книг в дереве")
+    parser.add_argument("--depth", type=int, default=3, help="глубина вложенности папок")
+    parser.add_argument("--range", dest="range_str", help="диапазон для поиска (по умолчанию 1/10 дерева)")
+    parser.add_argument("--convert", type=int, default=200, help="сколько книг конвертировать")
+    parser.add_argument("--mode", default="1,2", help="профили конвертации")
+    parser.add_argument("--latency", type=float, default=0.02, help="задержка экспорта, с")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="доля имитируемых сбоев")
+    parser.add_argument("--workers", default="1,2,4", help="числа воркеров через запятую")
+    parser.add_argument("--dir", help="папка для дерева (по умолчанию временная)")
+    parser.add_argument("--keep", action="store_true", help="не удалять сгенерированное дерево")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_output.txt", help="файл результатов (JSON)")
+    args = parser.parse_args(argv)
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="excel2pdf_bench_")
+    tree = os.path.join(workdir, "invoices")
+    results = {"python": sys.version.split()[0], "files": args.files, "latency": args.latency}
+    try:
+        print(f"🧪 Генерация {args.files} книг в {tree}...")
+        numbers, generate_time = timed(generate_tree, tree, args.files, depth=args.depth, seed=args.seed)
+        results["generate_s"] = round(generate_time, 2)
+
+        range_str = args.range_str or f"{numbers[0]}-{numbers[0] + max(1, len(numbers) // 10) - 1}"
+        discovery, matched = bench_discovery(tree, workdir, range_str)
+        results["discovery"] = discovery
+        print(f"🔎 Поиск {discovery['matched']} файлов: os.walk {discovery['os_walk_s']} с, "
+              f"индекс холодный {discovery['index_cold_s']} с, тёплый {discovery['index_warm_s']} с")
+
+        modes = etp.parse_modes(args.mode)
+        results["selection"] = bench_selection(matched, modes)
+        print(f"📑 Выбор листов: {results['selection']['files_per_s']} книг/с")
+
+        sample = matched[:args.convert]
+        results["conversion"] = []
+        for workers in (int(w) for w in args.workers.split(",")):
+            run = bench_conversion(sample, os.path.join(workdir, "pdf"), modes, workers,
+                                   args.latency, args.failure_rate)
+            results["conversion"].append(run)
+            print(f"🚀 Воркеров {workers}: {run['files_per_minute']} файлов/мин, "
+                  f"p90 {run['duration']['p90']:.3f} с, пик памяти Python {run['python_peak_mb']:.1f} МБ")
+    finally:
+        if not args.keep and not args.dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"📊 Результаты: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+Встраиваемый API ExcelToPdf для других программ на Python:
+
+    from etp_api import Converter
+"""
+
+import os
+import queue
+import asyncio
+import threading
+
+from ExcelToPdf import (
+    OutputRouter, PrescanCache, compile_profiles, convert_job, create_backend_factory, iter_jobs,
+    parse_modes, parse_range, retry_settings, use_profiles,
+)
+
+
+# ==========================================
+# ВСТРАИВАЕМЫЙ API
+# ==========================================
+
+class Converter:
+    """
+    Конвертер для использования из других программ на Python:
+
+        with Converter(workers=2) as converter:
+            for result in converter.convert_range(r"D:\\Invoices", "3550-3560", "1"):
+                print(result.to_dict())
+
+    Запущенные движки остаются в пуле между вызовами и переиспользуются,
+    результаты выдаются по мере готовности файлов (ConversionResult).
+    Прерывание цикла, cancel() или событие cancel останавливают
+    выдачу новых файлов; начатые файлы дописываются.
+    Профили из "profiles" в config свои у каждого конвертера и не меняют
+    профили процесса. close() дожидается начатых файлов, закрывает движки
+    и сохраняет кэш предварительного анализа.
+    """
+
+    def __init__(self, config=None, workers=1, backend_factory=None, prescan=True, output=None):
+        config = config or {}
+        self.profiles = compile_profiles(config)
+        self.backend_factory = backend_factory or create_backend_factory(config)
+        self.workers = max(1, workers)
+        self.retry = retry_settings(config)
+        self.prescan = PrescanCache().load() if prescan else None
+        self.output = output if output is not None else config.get("output")
+        self._idle = []
+        # Событие остановки каждого convert_range -> его потоки
+        self._active = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _acquire(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("конвертер закрыт")
+            if self._idle:
+                return self._idle.pop()
+        backend = self.backend_factory()
+        try:
+            backend.start()
+        except Exception:
+            backend.close()
+            raise
+        return backend
+
+    def _release(self, backend):
+        with self._lock:
+            if not self._closed:
+                self._idle.append(backend)
+                return
+        backend.close()
+
+    def cancel(self):
+        """Отменяет все выполняемые convert_range."""
+        with self._lock:
+            for stop in self._active:
+                stop.set()
+
+    def close(self):
+        """
+        Отменяет конвертации и дожидается начатых файлов, закрывает движки
+        пула и сохраняет кэш анализа. Движки, которые освободятся позже
+        (например, брошенный aconvert_range), закрываются сразу.
+        """
+        with self._lock:
+            self._closed = True
+            running = [thread for threads in self._active.values() for thread in threads]
+        self.cancel()
+        for thread in running:
+            if thread is not threading.current_thread():
+                thread.join()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for backend in idle:
+            backend.close()
+        if self.prescan is not None:
+            self.prescan.save()
+
+    def convert_range(self, source, numbers, mode="1", output=None, cancel=None):
+        """
+        Конвертирует инвойсы диапазона numbers (строка "3550-3553,3560"
+        или набор номеров) и выдаёт ConversionResult по мере готовности.
+        Книги ищутся и разбираются в отдельном потоке, одновременно с конвертацией.
+        Если движок не запускается, исключение передаётся вызывающему.
+        """
+        if self._closed:
+            raise RuntimeError("конвертер закрыт")
+        if isinstance(numbers, str):
+            numbers = parse_range(numbers)
+        if not numbers:
+            raise ValueError("не указан корректный диапазон")
+        if not os.path.isdir(source):
+            raise ValueError(f"папка не существует: {source}")
+        with use_profiles(self.profiles):
+            modes = parse_modes(mode)
+        router = OutputRouter(**(output if output is not None else self.output or {}))
+
+        stop = threading.Event()
+        end = object()
+        jobs = queue.Queue()
+        results = queue.Queue()
+
+        def stopped():
+            return stop.is_set() or (cancel is not None and cancel.is_set())
+
+        def in_context(target):
+            # Потоки конвертера (и вызовы движков из них) видят профили конвертера
+            def run():
+                with use_profiles(self.profiles):
+                    target()
+            return run
+
+        def producer():
+            try:
+                for job in iter_jobs(source, numbers, ",".join(modes), prescan=self.prescan,
+                                     router=router):
+                    if stopped():
+                        break
+                    jobs.put(job)
+            except Exception as e:
+                results.put(e)
+            finally:
+                for _ in range(self.workers):
+                    jobs.put(end)
+
+        def worker():
+            backend = None
+            try:
+                while True:
+                    job = jobs.get()
+                    if job is end or stopped():
+                        break
+                    if job.rejected is None and backend is None:
+                        backend = self._acquire()
+                    for pdf_path in job.pdf_paths:
+                        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+                    results.put(convert_job(backend, job, self.retry))
+            except Exception as e:
+                results.put(e)
+            finally:
+                if backend is not None:
+                    self._release(backend)
+                results.put(end)
+
+        threads = [threading.Thread(target=in_context(producer), name="converter-discovery",
+                                    daemon=True)]
+        threads += [threading.Thread(target=in_context(worker), name=f"converter-{i + 1}", daemon=True)
+                    for i in range(self.workers)]
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("конвертер закрыт")
+            self._active[stop] = threads
+        for thread in threads:
+            thread.start()
+        try:
+            running = self.workers
+            while running:
+                item = results.get()
+                if item is end:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                elif not stopped():
+                    yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            with self._lock:
+                self._active.pop(stop, None)
+
+    async def aconvert_range(self, source, numbers, mode="1", output=None):
+        """
+        Асинхронный вариант convert_range для asyncio:
+
+            async for result in converter.aconvert_range(source, "3550-3560", "1"):
+                ...
+
+        Конвертация идёт в отдельном потоке; отмена задачи или выход из цикла
+        останавливают выдачу новых файлов, а закрытие генератора ждёт,
+        пока поток вернёт движки в пул.
+        """
+        loop = asyncio.get_running_loop()
+        results = asyncio.Queue()
+        cancel = threading.Event()
+        end = object()
+
+        def deliver(item):
+            try:
+                loop.call_soon_threadsafe(results.put_nowait, item)
+            except RuntimeError:
+                # Цикл событий уже закрыт
+                cancel.set()
+
+        def pump():
+            try:
+                for result in self.convert_range(source, numbers, mode, output, cancel):
+                    deliver(result)
+            except Exception as e:
+                deliver(e)
+            finally:
+                deliver(end)
+
+        pumping = threading.Thread(target=pump, name="converter-async", daemon=True)
+        pumping.start()
+        try:
+            while True:
+                item = await results.get()
+                if item is end:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancel.set()
+            await loop.run_in_executor(None, pumping.join)
@@ -0,0 +1,287 @@
+"""
+Распределённая конвертация ExcelToPdf: общая очередь заданий в SQLite
+и воркер, который забирает из неё задания с арендой.
+
+Запускается из ExcelToPdf.py ключами --coordinator и --worker.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from ExcelToPdf import (
+    ConversionError, ConversionJob, ConversionResult, classify_error, convert_job,
+    log_event, prescan_workbook,
+)
+
+
+# ==========================================
+# РАСПРЕДЕЛЁННАЯ КОНВЕРТАЦИЯ (ОБЩАЯ ОЧЕРЕДЬ)
+# ==========================================
+
+class SharedQueue:
+    """
+    Общая очередь заданий в файле SQLite (например, на сетевой папке).
+    Координатор публикует задания пакета, воркеры на разных машинах
+    забирают их с арендой (lease): пока задание конвертируется, воркер
+    продлевает аренду, а задание упавшего воркера после истечения аренды
+    забирает другой. После max_attempts аренд задание считается неудачным.
+    Пути книг и PDF должны быть одинаково доступны со всех машин (UNC).
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        with self._connect() as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    batch TEXT NOT NULL,
+                    job_index INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    outputs TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    worker TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    ok INTEGER,
+                    error TEXT,
+                    category TEXT,
+                    duration REAL,
+                    info TEXT,
+                    finished REAL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+                CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch, state);
+            """)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def publish(self, jobs):
+        """Публикует задания пакета и возвращает его идентификатор."""
+        batch_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        rows = []
+        for job in jobs:
+            row = (batch_id, job.index, os.path.abspath(job.file_path),
+                   json.dumps(job.outputs, ensure_ascii=False))
+            if job.rejected is not None:
+                # Отклонённые предварительным анализом книги воркерам не передаются
+                rows.append(row + ("failed", 0, str(job.rejected), classify_error(job.rejected), now))
+            else:
+                rows.append(row + ("queued", None, None, None, None))
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany(
+                "INSERT INTO jobs (batch, job_index, source, outputs, state, ok, error, category,"
+                " finished) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            db.execute("COMMIT")
+        return batch_id
+
+    def claim(self, worker, lease):
+        """Забирает следующее свободное задание (или с истёкшей арендой). Возвращает (id, задание) или None."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                # Задания, арендованные слишком много раз, не перезапускаются бесконечно
+                db.execute(
+                    "UPDATE jobs SET state = 'failed', ok = 0, category = 'engine', finished = ?,"
+                    " error = 'аренда истекла ' || attempts || ' раз: воркер не завершил задание'"
+                    " WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                    (now, now, self.max_attempts))
+                row = db.execute(
+                    "SELECT id, job_index, source, outputs FROM jobs"
+                    " WHERE state = 'queued' OR (state = 'leased' AND lease_until < ?)"
+                    " ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?,"
+                        " attempts = attempts + 1 WHERE id = ?", (worker, now + lease, row[0]))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job_id, index, source, outputs = row
+        return job_id, ConversionJob(index, source, [tuple(item) for item in json.loads(outputs)])
+
+    def renew(self, job_id, worker, lease):
+        """Продлевает аренду задания, пока воркер его конвертирует."""
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                       (time.time() + lease, job_id, worker))
+
+    def release(self, job_id, worker):
+        """Возвращает задание в очередь без учёта попытки."""
+        with self._connect() as db:
+            db.execute("UPDATE jobs SET state = 'queued', worker = NULL, lease_until = NULL,"
+                       " attempts = attempts - 1 WHERE id = ? AND worker = ? AND state = 'leased'",
+                       (job_id, worker))
+
+    def complete(self, job_id, worker, result):
+        """Записывает результат; чужой (перехваченный после истечения аренды) результат не пишется."""
+        info = dict(result.info or {}, timings=result.timings)
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET state = ?, ok = ?, error = ?, category = ?, duration = ?, info = ?,"
+                " finished = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                ("done" if result.ok else "failed", int(result.ok), result.error, result.category,
+                 result.duration, json.dumps(info, ensure_ascii=False), time.time(), job_id, worker))
+
+    def counts(self, batch_id):
+        with self._connect() as db:
+            return dict(db.execute("SELECT state, COUNT(*) FROM jobs WHERE batch = ? GROUP BY state",
+                                   (batch_id,)).fetchall())
+
+    def wait(self, batch_id, jobs, on_result=None, poll=2.0, status_every=30.0, on_complete=None):
+        """
+        Ждёт завершения пакета воркерами и передаёт результаты в on_result
+        в исходном порядке заданий, а в on_complete - сразу по появлении.
+        Возвращает список ConversionResult.
+        """
+        jobs = {job.index: job for job in jobs}
+        results = {}
+        next_to_report = 0
+        last_status = time.monotonic()
+        while len(results) < len(jobs):
+            with self._connect() as db:
+                rows = db.execute(
+                    "SELECT job_index, ok, error, category, duration, info, attempts FROM jobs"
+                    " WHERE batch = ? AND state IN ('done', 'failed')", (batch_id,)).fetchall()
+            for index, ok, error, category, duration, info, attempts in rows:
+                if index in results:
+                    continue
+                info = json.loads(info) if info else None
+                results[index] = ConversionResult(
+                    jobs[index], bool(ok), error or "", duration or 0.0, info,
+                    timings=info.pop("timings", {}) if info else {},
+                    category=category or "", attempts=max(1, attempts or 1))
+                if on_complete:
+                    on_complete(results[index])
+            while next_to_report in results:
+                if on_result:
+                    on_result(results[next_to_report])
+                next_to_report += 1
+            if len(results) < len(jobs):
+                if time.monotonic() - last_status >= status_every:
+                    counts = self.counts(batch_id)
+                    print(f"⏳ Общая очередь: ждут {counts.get('queued', 0)}, "
+                          f"в работе {counts.get('leased', 0)}, готово {len(results)} из {len(jobs)}")
+                    last_status = time.monotonic()
+                time.sleep(poll)
+        return [results[i] for i in sorted(results)]
+
+
+def run_worker(queue_path, backend_factory, workers=1, lease=120, idle_exit=0, retry=None,
+               prescan=True, poll=2.0):
+    """
+    Воркер общей очереди: workers потоков, каждый со своим движком
+    (запускается при первом задании), забирают задания с арендой,
+    конвертируют и записывают результат. idle_exit - завершиться после
+    стольких секунд без заданий (0 - работать до Ctrl+C).
+    Возвращает счётчики: done, failed, engines - запущено движков,
+    engine_errors - неудачных запусков.
+    """
+    shared = SharedQueue(queue_path)
+    stop = threading.Event()
+    active = {}
+    lock = threading.Lock()
+    counters = {"done": 0, "failed": 0, "engines": 0, "engine_errors": 0}
+
+    def heartbeat():
+        while not stop.wait(max(1.0, lease / 3)):
+            with lock:
+                leased = list(active.items())
+            for job_id, name in leased:
+                try:
+                    shared.renew(job_id, name, lease)
+                except Exception as e:
+                    log_event(f"⚠ Не удалось продлить аренду задания {job_id}: {e}")
+
+    def worker(number):
+        name = f"{socket.gethostname()}:{os.getpid()}:{number}"
+        backend = None
+        idle_since = time.monotonic()
+        try:
+            while not stop.is_set():
+                claimed = shared.claim(name, lease)
+                if claimed is None:
+                    if idle_exit and time.monotonic() - idle_since >= idle_exit:
+                        break
+                    stop.wait(poll)
+                    continue
+                job_id, job = claimed
+                if backend is None:
+                    backend = backend_factory()
+                    try:
+                        backend.start()
+                    except Exception as e:
+                        # Задание возвращается в очередь для других воркеров
+                        shared.release(job_id, name)
+                        print(f"❌ Поток {number}: движок не запущен: {e}")
+                        with lock:
+                            counters["engine_errors"] += 1
+                        break
+                    with lock:
+                        counters["engines"] += 1
+                with lock:
+                    active[job_id] = name
+                try:
+                    # Координатор не создаёт папки PDF: на его машине они могут быть другими
+                    try:
+                        for pdf_path in job.pdf_paths:
+                            os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+                    except OSError as e:
+                        job.rejected = e
+                    if prescan and job.rejected is None:
+                        try:
+                            job.plan = prescan_workbook(job.file_path, [p for p, _ in job.outputs])
+                        except ConversionError as e:
+                            job.rejected = e
+                    result = convert_job(backend, job, retry)
+                finally:
+                    with lock:
+                        active.pop(job_id, None)
+                shared.complete(job_id, name, result)
+                with lock:
+                    counters["done" if result.ok else "failed"] += 1
+                mark = "✅" if result.ok else f"❌ {result.error}"
+                print(f"➡️ {os.path.basename(job.file_path)}: {mark}")
+                idle_since = time.monotonic()
+        finally:
+            if backend is not None:
+                backend.close()
+
+    print(f"🛰 Воркер общей очереди {queue_path}: потоков {workers}. Остановка - Ctrl+C.")
+    threading.Thread(target=heartbeat, name="lease-heartbeat", daemon=True).start()
+    threads = [threading.Thread(target=worker, args=(i + 1,), name=f"converter-{i + 1}", daemon=True)
+               for i in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        # Незавершённые задания вернутся в очередь по истечении аренды
+        print("\n⏹ Остановка воркера...")
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        stop.set()
+    print(f"🏁 Воркер завершён: готово {counters['done']}, ошибок {counters['failed']}")
+    return counters
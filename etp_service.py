@@ -0,0 +1,286 @@
+"""
+Сервис конвертации ExcelToPdf: воркеры держат движки запущенными
+между заданиями, задания принимаются через HTTP/JSON API.
+
+Запускается из ExcelToPdf.py ключом --serve.
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ExcelToPdf import (
+    EXIT_OK, BatchSummary, ConversionError, ConversionJob, Manifest, OutputRouter,
+    collect_jobs, convert_job, parse_modes, parse_range,
+)
+
+
+# ==========================================
+# СЕРВИС КОНВЕРТАЦИИ (HTTP API)
+# ==========================================
+
+class ConversionService:
+    """
+    Долгоживущий сервис: воркеры держат движки запущенными между заданиями,
+    задания (папка, диапазон, режим) ставятся в очередь с приоритетом.
+    Чем больше priority, тем раньше обрабатываются файлы задания.
+    Задания принимаются, пока запускаются движки; завершённые задания
+    хранятся job_ttl секунд и не больше max_jobs (старые удаляются первыми).
+    """
+
+    def __init__(self, backend_factory, workers=1, incremental=False, on_result=None,
+                 job_ttl=3600.0, max_jobs=1000):
+        self.backend_factory = backend_factory
+        self.on_result = on_result
+        self.workers = max(1, workers)
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self.manifest = Manifest().load() if incremental else None
+        self.tasks = queue.PriorityQueue()
+        self.jobs = {}
+        self.live_workers = 0
+        self.starting_workers = 0
+        self._lock = threading.Lock()
+        self._discovery_lock = threading.Lock()
+        self._sequence = 0
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def start(self):
+        with self._lock:
+            self.starting_workers += self.workers
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"service-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        for _ in self._threads:
+            self.tasks.put((float("inf"), 0, 0, None))
+        for thread in self._threads:
+            thread.join()
+        if self.manifest:
+            self.manifest.save()
+
+    def submit(self, source, range_str, mode, priority=0, output_dir=None):
+        """Ставит задание в очередь и возвращает его описание."""
+        mode = ",".join(parse_modes(mode))
+        if not source or not os.path.isdir(source):
+            raise ValueError(f"папка не существует: {source}")
+        file_numbers = parse_range(range_str)
+        if not file_numbers:
+            raise ValueError("не указан корректный диапазон")
+
+        with self._discovery_lock:
+            jobs, summary = collect_jobs(source, file_numbers, mode,
+                                         manifest=self.manifest, output_dir=output_dir)
+        return self._enqueue(source, range_str, mode, priority, jobs, summary)
+
+    def submit_files(self, source, files, mode, priority=0, output=None):
+        """Ставит в очередь заданные книги (режим наблюдения за папкой)."""
+        mode = ",".join(parse_modes(mode))
+        router = OutputRouter(**(output or {}))
+        modes = parse_modes(mode)
+        checksums = ("source",) if self.manifest else ()
+        jobs = []
+        for path in files:
+            try:
+                jobs.append(ConversionJob(len(jobs), path, router.route(source, path, modes),
+                                          checksums=checksums))
+            except ConversionError as e:
+                jobs.append(ConversionJob(len(jobs), path, [], rejected=e))
+        summary = BatchSummary(matched=len(files))
+        return self._enqueue(source, f"{len(files)} файл(ов)", mode, priority, jobs, summary)
+
+    def _enqueue(self, source, range_str, mode, priority, jobs, summary):
+        now = time.time()
+        with self._lock:
+            self._evict(now, incoming=1)
+            self._sequence += 1
+            job_id = str(self._sequence)
+            record = {
+                "id": job_id,
+                "source": source,
+                "range": range_str,
+                "mode": mode,
+                "priority": priority,
+                "status": "queued" if jobs else "done",
+                "submitted": now,
+                "matched": summary.matched,
+                "skipped": summary.skipped,
+                "files": [
+                    {"file": job.file_path, "pdf": job.pdf_paths, "status": "queued"}
+                    for job in jobs
+                ],
+            }
+            if not jobs:
+                record["finished"] = now
+            self.jobs[job_id] = record
+            for job in jobs:
+                for pdf_path in job.pdf_paths:
+                    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+                self.tasks.put((-priority, self._sequence, job.index, (job_id, job)))
+        return self.status(job_id)
+
+    def _evict(self, now, incoming=0):
+        """
+        Удаляет завершённые задания старше job_ttl и самые старые сверх max_jobs
+        с учётом incoming новых (под self._lock). Незавершённые задания не удаляются.
+        """
+        finished = sorted((record["finished"], job_id)
+                          for job_id, record in self.jobs.items() if "finished" in record)
+        excess = len(self.jobs) + incoming - self.max_jobs
+        for number, (finished_at, job_id) in enumerate(finished):
+            if number < excess or now - finished_at >= self.job_ttl:
+                del self.jobs[job_id]
+
+    def status(self, job_id):
+        with self._lock:
+            record = self.jobs.get(job_id)
+            return json.loads(json.dumps(record)) if record else None
+
+    def list_jobs(self):
+        with self._lock:
+            self._evict(time.time())
+            return [
+                {k: v for k, v in record.items() if k != "files"}
+                for record in self.jobs.values()
+            ]
+
+    def _finish_file(self, job_id, result):
+        with self._lock:
+            record = self.jobs[job_id]
+            entry = record["files"][result.job.index]
+            entry["status"] = "done" if result.ok else "failed"
+            entry["duration"] = round(result.duration, 3)
+            if result.error:
+                entry["error"] = result.error
+            if all(f["status"] in ("done", "failed") for f in record["files"]):
+                failed = sum(1 for f in record["files"] if f["status"] == "failed")
+                record["status"] = "failed" if failed else "done"
+                record["finished"] = time.time()
+            else:
+                record["status"] = "running"
+        if self.on_result:
+            self.on_result(result)
+        if result.ok and self.manifest:
+            self.manifest.record_result(result)
+
+    def _worker(self):
+        backend = self.backend_factory()
+        try:
+            backend.start()
+        except Exception as e:
+            print(f"🔥 Не удалось запустить движок ({threading.current_thread().name}): {e}")
+            backend.close()
+            with self._lock:
+                self.starting_workers -= 1
+            return
+
+        with self._lock:
+            self.starting_workers -= 1
+            self.live_workers += 1
+        try:
+            while not self._stopping.is_set():
+                _, _, _, task = self.tasks.get()
+                if task is None:
+                    break
+                job_id, job = task
+                with self._lock:
+                    self.jobs[job_id]["status"] = "running"
+                    self.jobs[job_id]["files"][job.index]["status"] = "running"
+                self._finish_file(job_id, convert_job(backend, job))
+                if self.manifest and self.tasks.empty():
+                    self.manifest.save()
+        finally:
+            with self._lock:
+                self.live_workers -= 1
+            backend.close()
+
+    def health(self):
+        with self._lock:
+            return {"workers": self.live_workers, "starting": self.starting_workers,
+                    "queued_files": self.tasks.qsize(), "jobs": len(self.jobs)}
+
+    def accepting(self):
+        """Задания принимаются, пока есть работающий или ещё запускающийся движок."""
+        with self._lock:
+            return bool(self.live_workers or self.starting_workers)
+
+
+def make_http_handler(service):
+    """Создаёт обработчик HTTP/JSON API для сервиса."""
+    class Handler(BaseHTTPRequestHandler):
+
+        def _send(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.rstrip("/")
+            if path == "/health":
+                self._send(200 if service.accepting() else 503, service.health())
+            elif path == "/jobs":
+                self._send(200, service.list_jobs())
+            elif path.startswith("/jobs/"):
+                record = service.status(path[len("/jobs/"):])
+                if record:
+                    self._send(200, record)
+                else:
+                    self._send(404, {"error": "задание не найдено"})
+            else:
+                self._send(404, {"error": "неизвестный адрес"})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/jobs":
+                self._send(404, {"error": "неизвестный адрес"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                data = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(data, dict):
+                    raise ValueError("тело запроса должно быть JSON-объектом")
+                if not service.accepting():
+                    self._send(503, {"error": "ни один движок конвертации не запустился"})
+                    return
+                record = service.submit(
+                    data.get("source"), str(data.get("range", "")), str(data.get("mode", "")),
+                    priority=int(data.get("priority", 0)), output_dir=data.get("output_dir")
+                )
+            except (ValueError, TypeError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            except Exception as e:
+                # Например, сетевая папка недоступна при поиске файлов
+                print(f"⚠ Ошибка приёма задания: {e}")
+                self._send(500, {"error": str(e) or type(e).__name__})
+                return
+            self._send(202, record)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def run_service(backend_factory, workers=1, host="127.0.0.1", port=8765, incremental=False,
+                job_ttl=3600.0, max_jobs=1000):
+    """Запускает сервис конвертации и обслуживает HTTP API до Ctrl+C."""
+    service = ConversionService(backend_factory, workers, incremental,
+                                job_ttl=job_ttl, max_jobs=max_jobs)
+    service.start()
+    server = ThreadingHTTPServer((host, port), make_http_handler(service))
+    print(f"🌐 Сервис конвертации: http://{host}:{server.server_port} (воркеров: {workers})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.stop()
+    return EXIT_OK
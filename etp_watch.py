@@ -0,0 +1,174 @@
+"""
+Наблюдение за папкой с инвойсами: новые и пересохранённые книги
+конвертируются через сервис, движки которого остаются запущенными.
+
+Запускается из ExcelToPdf.py ключом --watch.
+"""
+
+import os
+import time
+import zipfile
+
+from ExcelToPdf import (
+    EXIT_OK, PRESCAN_EXTENSIONS, ConversionError, InvoiceIndex, OutputRouter, parse_modes,
+)
+from etp_service import ConversionService
+
+
+# ==========================================
+# НАБЛЮДЕНИЕ ЗА ПАПКОЙ
+# ==========================================
+
+class FolderWatcher:
+    """
+    Опрос папки с инвойсами: новые книги находит InvoiceIndex (перечитываются
+    только папки с изменившимся mtime), и mtime и размер при опросе сравниваются
+    только у книг этих папок и у книг, ожидающих debounce. Перезапись файла
+    на месте не меняет mtime папки, поэтому раз в rescan секунд сравниваются все книги.
+    stale - функция "книгу нужно сконвертировать": такие из уже существующих
+    книг (например, устаревшие по манифесту) берутся в работу сразу после запуска.
+    Книга считается готовой, когда её размер и mtime не меняются debounce
+    секунд и xlsx читается как zip, - недописанные файлы не берутся.
+    Готовые книги копятся, пока идёт поток сохранений, и отдаются одной пачкой.
+    """
+
+    def __init__(self, source_folder, debounce=3.0, max_delay=None, stale=None, rescan=60.0):
+        self.source_folder = source_folder
+        self.debounce = debounce
+        self.max_delay = max_delay if max_delay is not None else debounce * 3
+        self.rescan = rescan
+        self.index = InvoiceIndex(source_folder).load().refresh()
+        # Уже существующие книги не конвертируются, кроме устаревших (stale):
+        # отслеживаются изменения после запуска
+        self.seen = {}
+        self.catch_up = 0
+        for path in self._all_files():
+            if stale is not None and stale(path):
+                self.catch_up += 1
+            else:
+                self.seen[path] = self._signature(path)
+        self.pending = {}
+        self.ready = []
+        self._ready_since = None
+        self._rescanned = time.monotonic()
+
+    def _all_files(self):
+        return self.index.paths()
+
+    def _dir_files(self, rel):
+        """Книги одной папки индекса."""
+        entry = self.index.dirs.get(rel)
+        if entry is None:
+            return []
+        folder = os.path.join(self.index.source_folder, rel)
+        return [os.path.normpath(os.path.join(folder, name))
+                for names in entry["files"].values() for name in names]
+
+    @staticmethod
+    def _signature(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _complete(self, path):
+        """Проверяет, что файл дописан: открывается на чтение, а xlsx/xlsm - целый zip."""
+        try:
+            with open(path, "rb"):
+                pass
+            if path.lower().endswith(PRESCAN_EXTENSIONS):
+                with zipfile.ZipFile(path) as zf:
+                    zf.getinfo("xl/workbook.xml")
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return False
+        return True
+
+    def poll(self):
+        """Один опрос: возвращает пачку готовых книг или пустой список."""
+        now = time.monotonic()
+        self.index.refresh()
+        if now - self._rescanned >= self.rescan:
+            candidates = self._all_files()
+            self._rescanned = now
+            # Удалённые книги забываются: вернувшаяся книга снова будет сконвертирована
+            current = set(candidates)
+            self.seen = {path: sig for path, sig in self.seen.items() if path in current}
+        else:
+            candidates = [path for rel in self.index.changed for path in self._dir_files(rel)]
+        for path in candidates:
+            if path in self.pending:
+                continue
+            signature = self._signature(path)
+            if signature is not None and signature != self.seen.get(path):
+                self.pending[path] = (signature, now)
+
+        for path, (signature, since) in list(self.pending.items()):
+            current = self._signature(path)
+            if current is None:
+                del self.pending[path]
+            elif current != signature:
+                self.pending[path] = (current, now)
+            elif now - since >= self.debounce:
+                # Недописанный zip ждёт дольше; совсем битый файл уходит в конвертацию и в отчёт об ошибках
+                if self._complete(path) or now - since >= self.debounce * 10:
+                    del self.pending[path]
+                    self.seen[path] = current
+                    self.ready.append(path)
+                    self._ready_since = self._ready_since or now
+
+        if self.ready and (not self.pending or now - self._ready_since >= self.max_delay):
+            batch, self.ready, self._ready_since = sorted(self.ready), [], None
+            return batch
+        return []
+
+
+def run_watch(source_folder, mode, backend_factory, workers=1, incremental=False, output=None,
+              interval=2.0, debounce=3.0):
+    """
+    Режим наблюдения: движки запускаются один раз и держатся тёплыми,
+    новые и изменённые инвойсы конвертируются пачками по мере сохранения.
+    """
+    def on_result(result):
+        if result.ok:
+            for pdf_path in result.job.pdf_paths:
+                print(f"   ✅ Готово: {pdf_path}")
+        else:
+            print(f"   ❌ {os.path.basename(result.job.file_path)}: {result.error}")
+
+    service = ConversionService(backend_factory, workers, incremental, on_result=on_result)
+    service.start()
+    stale = None
+    if service.manifest:
+        # Книги, сохранённые, пока наблюдение было остановлено, догоняются по манифесту
+        router = OutputRouter(**(output or {}))
+        modes = parse_modes(mode)
+
+        def stale(path):
+            try:
+                outputs = router.route(source_folder, path, modes)
+            except ConversionError:
+                return False
+            return any(not service.manifest.is_up_to_date(path, pdf_path, profile)
+                       for profile, pdf_path in outputs)
+
+    watcher = FolderWatcher(source_folder, debounce, stale=stale)
+    print(f"👀 Наблюдение за {source_folder} (режим {mode}, книг в индексе: "
+          f"{len(watcher.seen) + watcher.catch_up}). Остановка - Ctrl+C.")
+    if watcher.catch_up:
+        print(f"↩️ Изменены без наблюдения, будут сконвертированы: {watcher.catch_up}")
+    try:
+        while True:
+            batch = watcher.poll()
+            if batch:
+                print(f"📥 Новые или изменённые книги: {len(batch)}")
+                for path in batch:
+                    print(f"➡️ {path}")
+                service.submit_files(source_folder, batch, mode, output=output)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\n⏹ Остановка наблюдения...")
+    finally:
+        service.stop()
+        watcher.index.save()
+    return EXIT_OK
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmark import write_workbook  # noqa: E402
+
+INVOICE_SHEETS = [("Invoice", "visible", "A1:H40"), ("Specification", "visible", "A1:J60"),
+                  ("Calc", "hidden", None)]
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Индексы, журналы и логи утилита пишет в текущую папку - в тестах это tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_invoices(tmp_path):
+    """Создаёт книги invoice N.xlsx в tmp_path/source и возвращает эту папку."""
+    source = tmp_path / "source"
+
+    def make(*numbers, folder=""):
+        target = source / folder
+        target.mkdir(parents=True, exist_ok=True)
+        for number in numbers:
+            write_workbook(str(target / f"invoice {number}.xlsx"), INVOICE_SHEETS)
+        return str(source)
+
+    return make
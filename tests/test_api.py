@@ -0,0 +1,108 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+import ExcelToPdf as etp
+from etp_api import Converter
+
+CUSTOM = {"profiles": {"packing": {"suffix": " packing", "sheets": [{"name": "Specification"}]}}}
+
+
+class TrackedBackend(etp.StubBackend):
+    """Запоминает запуски и закрытия движков и профили, видимые при конвертации."""
+
+    def __init__(self, log, latency=0.02):
+        super().__init__(latency=latency, jitter=0)
+        self.log = log
+        self.closed = False
+        log["created"].append(self)
+
+    def close(self):
+        self.closed = True
+
+    def convert(self, file_path, outputs, plan=None):
+        self.log["profiles"].append(sorted(etp.active_profiles()))
+        return super().convert(file_path, outputs, plan)
+
+
+@pytest.fixture
+def log():
+    return {"created": [], "profiles": []}
+
+
+def test_engines_are_reused_between_calls(make_invoices, log):
+    source = make_invoices(1, 2, 3)
+    with Converter(workers=2, backend_factory=lambda: TrackedBackend(log)) as converter:
+        first = list(converter.convert_range(source, "1-3", "1"))
+        second = list(converter.convert_range(source, [1, 2], "invoice"))
+
+    assert sorted(os.path.basename(r.job.file_path) for r in first) == \
+        ["invoice 1.xlsx", "invoice 2.xlsx", "invoice 3.xlsx"]
+    assert all(r.ok for r in first + second) and len(second) == 2
+    assert 1 <= len(log["created"]) <= 2
+    assert all(backend.closed for backend in log["created"])
+
+
+def test_breaking_out_stops_new_files(make_invoices, log):
+    source = make_invoices(*range(1, 11))
+    with Converter(workers=1, backend_factory=lambda: TrackedBackend(log)) as converter:
+        for _ in converter.convert_range(source, "1-10", "1"):
+            break
+    assert len(log["profiles"]) < 10
+    assert all(backend.closed for backend in log["created"])
+
+
+def test_close_after_abandoned_async_iteration_closes_engines(make_invoices, log):
+    source = make_invoices(*range(1, 9))
+    converter = Converter(workers=2, backend_factory=lambda: TrackedBackend(log, latency=0.1))
+
+    async def abandon():
+        async for result in converter.aconvert_range(source, "1-8", "1"):
+            assert result.ok
+            break
+        # Генератор ещё не закрыт: его закроет только завершение цикла событий
+        converter.close()
+        await asyncio.sleep(0.3)
+
+    asyncio.run(abandon())
+
+    assert log["created"] and all(backend.closed for backend in log["created"])
+    assert converter._idle == []
+    assert not [t for t in threading.enumerate() if t.name.startswith("converter")]
+
+
+def test_close_waits_for_running_conversion(make_invoices, log):
+    source = make_invoices(*range(1, 9))
+    converter = Converter(workers=2, backend_factory=lambda: TrackedBackend(log, latency=0.1))
+    results = converter.convert_range(source, "1-8", "1")
+    next(results)
+
+    converter.close()
+
+    assert all(backend.closed for backend in log["created"])
+    with pytest.raises(RuntimeError):
+        next(converter.convert_range(source, "1-8", "1"))
+
+
+def test_profiles_are_per_converter(make_invoices, log):
+    source = make_invoices(1)
+    before = dict(etp.PROFILES)
+    factory = lambda: etp.ManagedBackend(lambda: TrackedBackend(log), timeout=10)
+
+    with Converter(CUSTOM, backend_factory=factory) as custom, \
+            Converter(backend_factory=factory) as plain:
+        [result] = custom.convert_range(source, "1", "packing,1")
+        assert result.ok
+        assert [os.path.basename(p) for p in result.job.pdf_paths] == \
+            ["invoice 1 packing.pdf", "invoice 1 spec.pdf"]
+        with pytest.raises(ValueError):
+            list(plain.convert_range(source, "1", "packing"))
+
+    # Движок в потоке ManagedBackend видит профили своего конвертера
+    assert "packing" in log["profiles"][0]
+    assert etp.PROFILES == before
+    with pytest.raises(ValueError):
+        etp.parse_modes("packing")
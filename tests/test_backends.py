@@ -0,0 +1,87 @@
+import stat
+import sys
+import zipfile
+
+import pytest
+
+import ExcelToPdf as etp
+from benchmark import write_workbook
+
+SHEETS = [("Invoice", "visible", "A1:H40"), ("O'Spec", "visible", "A1:J60"), ("Calc", "hidden", None)]
+
+# soffice-имитация: вместо PDF кладёт в --outdir копию полученной книги,
+# чтобы тест видел, какие листы и области печати дошли до LibreOffice
+FAKE_SOFFICE = f"""#!{sys.executable}
+import os, shutil, sys
+args = sys.argv[1:]
+outdir, src = args[args.index("--outdir") + 1], args[-1]
+fmt = args[args.index("--convert-to") + 1]
+shutil.copyfile(src, os.path.join(outdir, os.path.splitext(os.path.basename(src))[0] + "." + fmt))
+"""
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = str(tmp_path / "invoice 1.xlsx")
+    write_workbook(path, SHEETS)
+    return path
+
+
+def test_export_copy_shows_only_selected_sheets(workbook, tmp_path):
+    copy = str(tmp_path / "copy.xlsx")
+    etp.xlsx_write_export_copy(workbook, copy, [2, 3], {2: "A1:J60", 3: "b2:c3, 'X'!A1"})
+
+    assert [(s["name"], s["state"]) for s in etp.xlsx_list_sheets(copy)] == \
+        [("Invoice", "hidden"), ("O'Spec", "visible"), ("Calc", "visible")]
+    assert [(n["local_sheet"], n["refers_to"]) for n in etp.xlsx_defined_names(copy)] == \
+        [(1, "'O''Spec'!$A$1:$J$60"), (2, "'Calc'!$B$2:$C$3,'X'!A1")]
+
+    # Остальные части книги копируются без изменений
+    with zipfile.ZipFile(workbook) as src, zipfile.ZipFile(copy) as dst:
+        assert src.namelist() == dst.namelist()
+        for name in src.namelist():
+            if name != "xl/workbook.xml":
+                assert src.read(name) == dst.read(name)
+
+
+def test_export_copy_replaces_only_selected_print_areas(workbook, tmp_path):
+    first, second = str(tmp_path / "first.xlsx"), str(tmp_path / "second.xlsx")
+    etp.xlsx_write_export_copy(workbook, first, [1, 2], {1: "A1:B2", 2: "A1:C3"})
+    etp.xlsx_write_export_copy(first, second, [1], {1: "D4:E5"})
+
+    assert sorted((n["local_sheet"], n["refers_to"]) for n in etp.xlsx_defined_names(second)) == \
+        [(0, "'Invoice'!$D$4:$E$5"), (1, "'O''Spec'!$A$1:$C$3")]
+
+
+def test_backend_factory_selects_engine():
+    assert isinstance(etp.create_backend_factory({"backend": "stub", "engine": False})(),
+                      etp.StubBackend)
+    managed = etp.create_backend_factory({"backend": "stub", "engine": {"timeout": 5}})()
+    assert isinstance(managed, etp.ManagedBackend) and managed.timeout == 5
+    with pytest.raises(ValueError):
+        etp.create_backend_factory({"backend": "excel2000"})
+
+
+def test_libreoffice_backend_exports_selected_sheets(workbook, tmp_path, monkeypatch):
+    soffice = tmp_path / "bin" / "soffice"
+    soffice.parent.mkdir()
+    soffice.write_text(FAKE_SOFFICE)
+    soffice.chmod(soffice.stat().st_mode | stat.S_IEXEC)
+    # Без unoserver в PATH каждый экспорт - отдельный вызов soffice
+    monkeypatch.setenv("PATH", str(soffice.parent))
+    backend = etp.LibreOfficeBackend(soffice=str(soffice))
+    backend.start()
+    try:
+        pdf_path = str(tmp_path / "invoice 1.pdf")
+        info = backend.convert(workbook, [("1", pdf_path)])
+    finally:
+        backend.close()
+
+    assert info["print_areas"] == {"Invoice": "A1:H40", "O'Spec": "A1:J60"}
+    assert [s["state"] for s in etp.xlsx_list_sheets(pdf_path)] == ["visible", "visible", "hidden"]
+    assert backend.workdir is None
+
+
+def test_libreoffice_backend_requires_soffice(tmp_path):
+    with pytest.raises(etp.ConversionError):
+        etp.LibreOfficeBackend(soffice=str(tmp_path / "missing")).start()
@@ -0,0 +1,95 @@
+import os
+import shutil
+
+import ExcelToPdf as etp
+from benchmark import write_workbook
+
+
+def job(index, path, *modes):
+    stem = os.path.splitext(path)[0]
+    return etp.ConversionJob(index, path, [(mode, f"{stem} {mode}.pdf") for mode in modes])
+
+
+def test_identical_books_are_converted_once(make_invoices):
+    source = make_invoices(1, 2, folder="a")
+    os.makedirs(os.path.join(source, "b"))
+    shutil.copyfile(os.path.join(source, "a", "invoice 1.xlsx"), os.path.join(source, "b", "invoice 1.xlsx"))
+    write_workbook(os.path.join(source, "a", "invoice 2.xlsx"), [("Other", "visible", "A1:B2")])
+    jobs = [job(0, os.path.join(source, "a", "invoice 1.xlsx"), "1"),
+            job(1, os.path.join(source, "a", "invoice 2.xlsx"), "1"),
+            job(2, os.path.join(source, "b", "invoice 1.xlsx"), "1", "2")]
+
+    unique, copies, conflicts = etp.dedupe_jobs(jobs)
+
+    assert [j.file_path for j in unique] == [jobs[0].file_path, jobs[1].file_path]
+    assert [j.index for j in unique] == [0, 1]
+    assert copies == {0: [jobs[2]]}
+    # Профиль, нужный только копии, рисуется в её PDF
+    assert unique[0].outputs == jobs[0].outputs + [jobs[2].outputs[1]]
+    assert conflicts == {}
+
+
+def test_same_number_with_different_content_is_a_conflict(make_invoices):
+    source = make_invoices(1, folder="a")
+    os.makedirs(os.path.join(source, "b"))
+    write_workbook(os.path.join(source, "b", "invoice 1.xlsx"), [("Other", "visible", None)])
+    jobs = [job(0, os.path.join(source, "a", "invoice 1.xlsx"), "1"),
+            job(1, os.path.join(source, "b", "invoice 1.xlsx"), "1")]
+
+    unique, copies, conflicts = etp.dedupe_jobs(jobs)
+
+    assert len(unique) == 2 and copies == {}
+    assert conflicts == {1: [jobs[0].file_path, jobs[1].file_path]}
+
+
+def test_failed_original_fails_its_copies(tmp_path):
+    original, copy = job(0, str(tmp_path / "a.xlsx"), "1"), job(1, str(tmp_path / "b.xlsx"), "1")
+    failed = etp.ConversionResult(original, False, "сбой", category="locked", attempts=3)
+
+    result = etp.copy_result(failed, copy)
+
+    assert not result.ok and result.error == "сбой" and result.category == "locked"
+    assert result.copy_of == original.file_path
+
+
+def run_batch(source, dedup, converted):
+    class Recording(etp.StubBackend):
+        def convert(self, file_path, outputs, plan=None):
+            converted.append(file_path)
+            return super().convert(file_path, outputs, plan)
+
+    return etp.process_excel_files(
+        source, etp.parse_range("1"), "1", cost_model=False, dedup=dedup,
+        backend_factory=lambda: Recording(latency=0, jitter=0))
+
+
+def test_copies_get_linked_pdfs(make_invoices):
+    source = make_invoices(1, folder="a")
+    os.makedirs(os.path.join(source, "b"))
+    shutil.copyfile(os.path.join(source, "a", "invoice 1.xlsx"), os.path.join(source, "b", "invoice 1.xlsx"))
+    converted = []
+
+    summary = run_batch(source, "link", converted)
+
+    assert len(converted) == 1 and summary.converted == 2
+    first, second = (os.path.join(source, folder, "invoice 1.pdf") for folder in ("a", "b"))
+    assert os.path.samefile(first, second)
+
+
+def test_copy_mode_writes_separate_files(make_invoices):
+    source = make_invoices(1, folder="a")
+    os.makedirs(os.path.join(source, "b"))
+    shutil.copyfile(os.path.join(source, "a", "invoice 1.xlsx"), os.path.join(source, "b", "invoice 1.xlsx"))
+
+    run_batch(source, "copy", [])
+
+    first, second = (os.path.join(source, folder, "invoice 1.pdf") for folder in ("a", "b"))
+    assert not os.path.samefile(first, second)
+    with open(first, "rb") as f1, open(second, "rb") as f2:
+        assert f1.read() == f2.read()
+
+
+def test_dedup_settings():
+    assert etp.dedup_settings({}) == "link"
+    assert etp.dedup_settings({"dedup": "copy"}) == "copy"
+    assert etp.dedup_settings({"dedup": False}) is None
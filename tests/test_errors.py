@@ -0,0 +1,128 @@
+import errno
+import os
+
+import pytest
+
+import ExcelToPdf as etp
+
+
+class ComError(Exception):
+    """Похожа на pywintypes.com_error: (hresult, текст, excepinfo, argerror)."""
+
+    def __init__(self, hresult, text="", scode=None):
+        excepinfo = (0, "Microsoft Excel", text, None, 0, scode) if scode is not None else None
+        super().__init__(hresult, text, excepinfo, None)
+
+
+def network_error(code, text="сеть"):
+    return OSError(code, text)
+
+
+@pytest.mark.parametrize("exc, category", [
+    (etp.EngineTimeout("Excel не ответил за 120 с"), "timeout"),
+    (TimeoutError("timed out"), "network"),
+    (network_error(errno.ETIMEDOUT), "network"),
+    (network_error(errno.ECONNRESET), "network"),
+    (network_error(errno.EHOSTUNREACH), "network"),
+    (PermissionError(errno.EACCES, "нет доступа"), "locked"),
+    (ComError(-2147352567, "Exception occurred", scode=-2147418111), "busy"),
+    (ComError(-2147418111, "Call was rejected by callee."), "busy"),
+    (ComError(-2147023174, "RPC server is unavailable"), "engine"),
+    (etp.ConversionError("'invoice 1.xlsx' is locked for editing"), "locked"),
+    (etp.MissingSheetsError("нет листа Invoice"), "sheets"),
+    (etp.InvalidWorkbookError("не zip"), "invalid"),
+    (etp.ConversionError("что-то ещё"), "other"),
+    (FileNotFoundError(errno.ENOENT, "нет файла"), "other"),
+])
+def test_classify_error(exc, category):
+    assert etp.classify_error(exc) == category
+
+
+def test_retry_policy_limits_attempts_and_categories():
+    policy = etp.RetryPolicy(retries=2, backoff=1.0, max_delay=3.0)
+    assert policy.should_retry("network", 0) and policy.should_retry("locked", 1)
+    assert not policy.should_retry("network", 2)
+    assert not policy.should_retry("sheets", 0)
+    for attempt in range(6):
+        assert 0.5 * min(3.0, 2 ** attempt) <= policy.delay(attempt) <= min(3.0, 2 ** attempt)
+
+
+def test_retry_settings_leave_engine_failures_to_the_watchdog():
+    assert set(etp.retry_settings({}).categories) == {"locked", "busy", "network"}
+    assert "timeout" in etp.retry_settings({"engine": False}).categories
+    policy = etp.retry_settings({"retry": {"retries": 0, "categories": ["network"]}})
+    assert policy.categories == ("network",) and not policy.should_retry("network", 0)
+
+
+class FlakyBackend(etp.StubBackend):
+    """Первые failures вызовов падают с ошибкой error."""
+
+    def __init__(self, error, failures):
+        super().__init__(latency=0, jitter=0)
+        self.error = error
+        self.failures = failures
+
+    def convert(self, file_path, outputs, plan=None):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        return super().convert(file_path, outputs, plan)
+
+
+def make_job(tmp_path):
+    source = tmp_path / "invoice 1.xlsx"
+    source.write_bytes(b"x")
+    return etp.ConversionJob(0, str(source), [("1", str(tmp_path / "invoice 1.pdf"))])
+
+
+def test_network_timeout_is_retried(tmp_path):
+    job = make_job(tmp_path)
+    backend = FlakyBackend(network_error(errno.ETIMEDOUT, "Connection timed out"), failures=2)
+
+    result = etp.convert_job(backend, job, etp.RetryPolicy(retries=2, backoff=0))
+
+    assert result.ok and result.attempts == 3
+    assert os.path.exists(job.pdf_paths[0])
+
+
+def test_permanent_error_is_not_retried(tmp_path):
+    job = make_job(tmp_path)
+    backend = FlakyBackend(etp.MissingSheetsError("нет листа Invoice"), failures=1)
+
+    result = etp.convert_job(backend, job, etp.RetryPolicy(retries=2, backoff=0))
+
+    assert not result.ok and result.category == "sheets" and result.attempts == 1
+    assert not os.path.exists(job.pdf_paths[0])
+
+
+def test_retries_exhausted(tmp_path):
+    job = make_job(tmp_path)
+    backend = FlakyBackend(etp.ConversionError("Call was rejected by callee. (-2147418111)"), 5)
+
+    result = etp.convert_job(backend, job, etp.RetryPolicy(retries=2, backoff=0))
+
+    assert not result.ok and result.category == "busy" and result.attempts == 3
+
+
+def test_quarantine_after_repeated_failures(tmp_path):
+    job = make_job(tmp_path)
+    failed = etp.ConversionResult(job, False, "сбой", category="other")
+    quarantine = etp.Quarantine(str(tmp_path / "quarantine.json"), after=2)
+
+    quarantine.record(failed)
+    assert not quarantine.is_quarantined(job.file_path)
+    quarantine.record(failed)
+    assert quarantine.is_quarantined(job.file_path)
+
+    quarantine.save()
+    restored = etp.Quarantine(quarantine.path, after=2).load()
+    assert restored.is_quarantined(job.file_path)
+
+    # Изменённая книга получает новую попытку, успех снимает карантин
+    with open(job.file_path, "ab") as f:
+        f.write(b"y")
+    assert not restored.is_quarantined(job.file_path)
+    restored.record(failed)
+    assert not restored.is_quarantined(job.file_path)
+    restored.record(etp.ConversionResult(job, True))
+    assert restored.entries == {}
@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+
+import ExcelToPdf as etp
+
+
+def names(paths):
+    return [os.path.relpath(path).replace(os.sep, "/") for path in paths]
+
+
+def bump_mtime(path):
+    """Сдвигает mtime папки: изменения в тесте быстрее разрешения часов файловой системы."""
+    mtime = os.stat(path).st_mtime_ns + 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_invoice_number():
+    assert etp.invoice_number("invoice 3550.xlsx") == 3550
+    assert etp.invoice_number("INVOICE  12.XLSM") == 12
+    assert etp.invoice_number("invoice 7.xls") == 7
+    for name in ("invoice 1 copy.xlsx", "invoice 1.pdf", "proforma 1.xlsx", "invoice.xlsx"):
+        assert etp.invoice_number(name) is None
+
+
+def test_lookup_across_folders(make_invoices, tmp_path):
+    source = make_invoices(5, folder="2024/03")
+    make_invoices(1, 9, folder="2024/01")
+    make_invoices(5, folder="archive")
+    (tmp_path / "source" / "invoice 2 copy.xlsx").write_bytes(b"")
+
+    index = etp.InvoiceIndex(source).refresh()
+
+    assert index.sorted_numbers == [1, 5, 9]
+    assert names(index.lookup(etp.parse_range("1-5"))) == [
+        "source/2024/01/invoice 1.xlsx", "source/2024/03/invoice 5.xlsx", "source/archive/invoice 5.xlsx"]
+    assert names(index.lookup({9})) == ["source/2024/01/invoice 9.xlsx"]
+    assert index.lookup(etp.parse_range("10-")) == []
+
+
+def test_warm_refresh_reads_only_changed_folders(make_invoices):
+    source = make_invoices(1, folder="a")
+    make_invoices(2, folder="b")
+    etp.InvoiceIndex(source).refresh().save()
+    saved = os.stat(etp.INDEX_FILE).st_mtime_ns
+
+    warm = etp.InvoiceIndex(source).load().refresh()
+    warm.save()
+    assert warm.scanned == 0 and warm.cached == 3
+    assert os.stat(etp.INDEX_FILE).st_mtime_ns == saved
+
+    make_invoices(3, folder="b")
+    bump_mtime(os.path.join(source, "b"))
+    warm = etp.InvoiceIndex(source).load().refresh()
+    assert warm.changed == ["b"] and warm.sorted_numbers == [1, 2, 3]
+
+
+def test_new_and_removed_folders(make_invoices):
+    source = make_invoices(1, folder="a")
+    index = etp.InvoiceIndex(source).refresh()
+
+    make_invoices(2, folder="b/c")
+    bump_mtime(source)
+    index.refresh()
+    assert index.sorted_numbers == [1, 2] and sorted(index.changed) == [".", "b", "b/c"]
+
+    shutil.rmtree(os.path.join(source, "a"))
+    bump_mtime(source)
+    index.refresh()
+    assert index.sorted_numbers == [2] and "a" not in index.dirs
+
+
+def test_force_rescans_everything(make_invoices):
+    source = make_invoices(1, folder="a")
+    index = etp.InvoiceIndex(source).refresh()
+    assert index.refresh(force=True).scanned == 2
+
+
+def test_index_file_keeps_other_roots(make_invoices, tmp_path):
+    first = make_invoices(1)
+    second = tmp_path / "other"
+    second.mkdir()
+    etp.InvoiceIndex(first).refresh().save()
+    etp.InvoiceIndex(str(second)).refresh().save()
+
+    with open(etp.INDEX_FILE, encoding="utf-8") as f:
+        assert sorted(json.load(f)["roots"]) == sorted([first, str(second)])
+
+
+def test_find_invoice_files(make_invoices):
+    source = make_invoices(3550, 3551, 3560, folder="x")
+    assert names(etp.find_invoice_files(source, etp.parse_range("3550-3555,!3551"))) == \
+        ["source/x/invoice 3550.xlsx"]
+    assert names(etp.find_invoice_files(source, etp.parse_range("3560"), reindex=True)) == \
+        ["source/x/invoice 3560.xlsx"]
@@ -0,0 +1,73 @@
+import os
+
+import ExcelToPdf as etp
+
+
+class RecordingBackend(etp.StubBackend):
+    """Запоминает сконвертированные книги; книги из failing падают."""
+
+    def __init__(self, converted, failing=()):
+        super().__init__(latency=0, jitter=0)
+        self.converted = converted
+        self.failing = failing
+
+    def convert(self, file_path, outputs, plan=None):
+        name = os.path.basename(file_path)
+        if name in self.failing:
+            raise etp.ConversionError("сбой книги")
+        self.converted.append(name)
+        return super().convert(file_path, outputs, plan)
+
+
+def run_batch(source, converted, failing=(), resume=False):
+    return etp.process_excel_files(
+        source, etp.parse_range("1-3"), "1", resume=resume, cost_model=False, dedup=None,
+        backend_factory=lambda: RecordingBackend(converted, failing))
+
+
+def test_resume_converts_only_unfinished_books(make_invoices):
+    source = make_invoices(1, 2, 3)
+    first = []
+    summary = run_batch(source, first, failing=("invoice 2.xlsx",))
+    assert summary.failed == 1 and sorted(first) == ["invoice 1.xlsx", "invoice 3.xlsx"]
+
+    resumed = []
+    summary = run_batch(source, resumed, resume=True)
+    assert resumed == ["invoice 2.xlsx"]
+    assert summary.converted == 1 and summary.skipped == 2 and summary.failed == 0
+
+
+def test_resume_reconverts_changed_pdf_and_source(make_invoices):
+    source = make_invoices(1, 2, 3)
+    run_batch(source, [])
+
+    with open(os.path.join(source, "invoice 1.pdf"), "ab") as f:
+        f.write(b"%")
+    os.utime(os.path.join(source, "invoice 3.xlsx"), ns=(0, 0))
+
+    resumed = []
+    run_batch(source, resumed, resume=True)
+    assert sorted(resumed) == ["invoice 1.xlsx", "invoice 3.xlsx"]
+
+
+def test_batch_without_resume_starts_over(make_invoices):
+    source = make_invoices(1, 2, 3)
+    run_batch(source, [])
+
+    again = []
+    run_batch(source, again)
+    assert sorted(again) == ["invoice 1.xlsx", "invoice 2.xlsx", "invoice 3.xlsx"]
+
+
+def test_journal_skips_torn_last_line(tmp_path):
+    job = etp.ConversionJob(0, str(tmp_path / "invoice 1.xlsx"), [])
+    journal = etp.BatchJournal(str(tmp_path / "batch.jsonl")).open()
+    journal.record("queued", job)
+    journal.record("in_progress", job)
+    journal.close()
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"source": "ob')
+
+    restored = etp.BatchJournal(journal.path).load()
+    assert restored.states[os.path.abspath(job.file_path)]["state"] == "in_progress"
+    assert restored.completed == {}
@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+import ExcelToPdf as etp
+
+
+class Engines:
+    """Фабрика движков-заглушек: kinds задаёт поведение очередных движков."""
+
+    def __init__(self, *kinds, **options):
+        self.kinds = list(kinds)
+        self.options = options
+        self.created = []
+
+    def __call__(self):
+        kind = self.kinds.pop(0) if self.kinds else "ok"
+        backend = {"ok": etp.StubBackend, "hang": HangingBackend, "crash": CrashingBackend,
+                   "bad_file": BadFileBackend, "slow_start": SlowStartBackend}[kind](
+            latency=0, jitter=0, **self.options)
+        self.created.append(backend)
+        return backend
+
+
+class HangingBackend(etp.StubBackend):
+    def convert(self, file_path, outputs, plan=None):
+        self.hang_rate = 1.0
+        return super().convert(file_path, outputs, plan)
+
+
+class CrashingBackend(etp.StubBackend):
+    """Падает вместе с файлом: движок после ошибки не отвечает."""
+
+    def convert(self, file_path, outputs, plan=None):
+        self.kill()
+        raise etp.ConversionError("RPC server is unavailable")
+
+
+class BadFileBackend(etp.StubBackend):
+    def convert(self, file_path, outputs, plan=None):
+        raise etp.MissingSheetsError("нет листа Invoice")
+
+
+class SlowStartBackend(etp.StubBackend):
+    def start(self):
+        self._killed.wait(10)
+
+
+def outputs(tmp_path):
+    return [("1", str(tmp_path / "invoice 1.pdf"))]
+
+
+def test_hung_engine_is_killed_and_file_retried(tmp_path):
+    engines = Engines("hang")
+    managed = etp.ManagedBackend(engines, timeout=0.2, retries=1)
+    managed.start()
+    try:
+        started = time.monotonic()
+        managed.convert("invoice 1.xlsx", outputs(tmp_path))
+        assert time.monotonic() - started < 2
+    finally:
+        managed.close()
+
+    assert managed.attempts == 2 and len(engines.created) == 2
+    assert not engines.created[0].alive()
+
+
+def test_timeout_after_retries_is_reported(tmp_path):
+    engines = Engines("hang", "hang")
+    managed = etp.ManagedBackend(engines, timeout=0.1, retries=1)
+    job = etp.ConversionJob(0, "invoice 1.xlsx", outputs(tmp_path))
+
+    result = etp.convert_job(managed, job)
+    managed.close()
+
+    assert not result.ok and result.category == "timeout" and result.attempts == 2
+    assert all(not backend.alive() for backend in engines.created)
+
+
+def test_crashed_engine_is_replaced(tmp_path):
+    engines = Engines("crash")
+    managed = etp.ManagedBackend(engines, timeout=5, retries=1)
+    managed.start()
+    managed.convert("invoice 1.xlsx", outputs(tmp_path))
+    managed.close()
+    assert managed.attempts == 2 and len(engines.created) == 2
+
+
+def test_file_error_keeps_the_engine(tmp_path):
+    engines = Engines("bad_file")
+    managed = etp.ManagedBackend(engines, timeout=5, retries=1)
+    managed.start()
+    with pytest.raises(etp.MissingSheetsError):
+        managed.convert("invoice 1.xlsx", outputs(tmp_path))
+    assert managed.attempts == 1 and len(engines.created) == 1 and managed.engine is not None
+    managed.close()
+
+
+def test_recycle_after_files(tmp_path):
+    engines = Engines()
+    managed = etp.ManagedBackend(engines, timeout=5, recycle_after_files=2)
+    managed.start()
+    for _ in range(5):
+        managed.convert("invoice 1.xlsx", outputs(tmp_path))
+    managed.close()
+    assert len(engines.created) == 3
+
+
+def test_recycle_above_memory(tmp_path):
+    engines = Engines(leak_mb_per_file=30)
+    managed = etp.ManagedBackend(engines, timeout=5, recycle_above_mb=100)
+    managed.start()
+    for _ in range(4):
+        managed.convert("invoice 1.xlsx", outputs(tmp_path))
+    managed.close()
+    # 50 МБ + 30 на файл: порог достигается на втором файле каждого движка
+    assert len(engines.created) == 2
+
+
+def test_engine_start_timeout():
+    engines = Engines("slow_start")
+    managed = etp.ManagedBackend(engines, start_timeout=0.1)
+    with pytest.raises(etp.EngineTimeout):
+        managed.start()
+    assert managed.engine is None and not engines.created[0].alive()
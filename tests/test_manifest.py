@@ -0,0 +1,43 @@
+import collections
+import inspect
+import os
+
+import ExcelToPdf as etp
+
+
+def run_batch(source, workers=2):
+    return etp.process_excel_files(
+        source, etp.parse_range("1-4"), "1,2", workers=workers, incremental=True,
+        cost_model=False, dedup=None,
+        backend_factory=lambda: etp.StubBackend(latency=0, jitter=0))
+
+
+def test_sources_are_hashed_once_per_job_outside_the_result_lock(make_invoices, monkeypatch):
+    source = make_invoices(1, 2, 3, 4)
+    hashed = collections.Counter()
+    real_sha256 = etp.file_sha256
+
+    def tracking_sha256(path, *args, **kwargs):
+        # publish держит общий замок пула: хеширование там тормозит все воркеры
+        assert "publish" not in {frame.function for frame in inspect.stack()}
+        hashed[os.path.basename(path)] += 1
+        return real_sha256(path, *args, **kwargs)
+
+    monkeypatch.setattr(etp, "file_sha256", tracking_sha256)
+    summary = run_batch(source)
+
+    assert summary.converted == 4
+    assert {name: count for name, count in hashed.items() if name.endswith(".xlsx")} == \
+        {f"invoice {n}.xlsx": 1 for n in range(1, 5)}
+    manifest = etp.Manifest().load()
+    assert len(manifest.entries) == 8
+    for entry in manifest.entries.values():
+        assert entry["sha256"] == real_sha256(entry["source"])
+
+
+def test_up_to_date_outputs_are_skipped(make_invoices):
+    source = make_invoices(1, 2, 3, 4)
+    run_batch(source)
+
+    summary = run_batch(source)
+    assert summary.skipped == 4 and summary.converted == 0
@@ -0,0 +1,32 @@
+import json
+import os
+import sqlite3
+import threading
+
+import ExcelToPdf as etp
+from etp_queue import run_worker
+
+
+def test_menu_applies_output_dir_report_and_coordinator(make_invoices, tmp_path, monkeypatch):
+    source = make_invoices(1, 2)
+    queue_path = str(tmp_path / "jobs.db")
+    answers = iter(["1", source, "1-2", "0"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    args = etp.build_arg_parser().parse_args([
+        "--backend", "stub", "--output-dir", str(tmp_path / "out"),
+        "--report", str(tmp_path / "run {n}.json"), "--coordinator", queue_path])
+    worker = threading.Thread(
+        target=run_worker, args=(queue_path, lambda: etp.StubBackend(latency=0, jitter=0)),
+        kwargs={"idle_exit": 2, "poll": 0.05})
+    worker.start()
+    try:
+        etp.main(args)
+    finally:
+        worker.join()
+
+    assert sorted(os.listdir(tmp_path / "out")) == ["invoice 1.pdf", "invoice 2.pdf"]
+    with open(tmp_path / "run 1.json", encoding="utf-8") as f:
+        assert len(json.load(f)["files"]) == 2
+    # Книги сконвертировал воркер общей очереди, а не движок меню
+    with sqlite3.connect(queue_path) as db:
+        assert db.execute("SELECT COUNT(*) FROM jobs WHERE state = 'done'").fetchone()[0] >= 1
@@ -0,0 +1,80 @@
+import os
+from datetime import datetime
+
+import pytest
+
+import ExcelToPdf as etp
+
+
+def rel(paths, base):
+    return [(mode, os.path.relpath(path, base).replace(os.sep, "/")) for mode, path in paths]
+
+
+def test_pdf_goes_next_to_the_book(tmp_path):
+    source = str(tmp_path / "source")
+    router = etp.OutputRouter()
+    book = os.path.join(source, "2024", "invoice 7.xlsx")
+
+    assert rel(router.route(source, book, ["1"]), source) == [("1", "2024/invoice 7.pdf")]
+    assert rel(router.route(source, book, ["invoice", "2"]), source) == [
+        ("invoice", "2024/invoice 7 invoice.pdf"), ("2", "2024/invoice 7 weight.pdf")]
+
+
+def test_templates_under_root(tmp_path):
+    source, root = str(tmp_path / "source"), str(tmp_path / "pdf")
+    router = etp.OutputRouter(root=root, path="{year}/{shard}/{subdir}", name="INV-{number}{suffix}",
+                              shard_size=100)
+    book = os.path.join(source, "march", "invoice 3550.xlsx")
+
+    year = f"{datetime.now().year:04d}"
+    assert rel(router.route(source, book, ["1", "2"]), root) == [
+        ("1", f"{year}/3500-3599/march/INV-3550 spec.pdf"),
+        ("2", f"{year}/3500-3599/march/INV-3550 weight.pdf")]
+
+
+@pytest.mark.parametrize("collision, second", [
+    ("overwrite", [("1", "3550.pdf")]),
+    ("suffix", [("1", "3550 (2).pdf")]),
+    ("skip", []),
+])
+def test_collision_policies(tmp_path, collision, second):
+    source = str(tmp_path / "source")
+    router = etp.OutputRouter(root=str(tmp_path), path="", name="{number}", collision=collision)
+
+    first = router.route(source, os.path.join(source, "a", "invoice 3550.xlsx"), ["1"])
+    assert rel(first, tmp_path) == [("1", "3550.pdf")]
+    # Та же книга снова получает своё имя
+    assert router.route(source, os.path.join(source, "a", "invoice 3550.xlsx"), ["1"]) == first
+    assert rel(router.route(source, os.path.join(source, "b", "invoice 3550.xlsx"), ["1"]),
+               tmp_path) == second
+
+
+def test_collision_error_rejects_the_job(make_invoices, tmp_path):
+    make_invoices(1, folder="a")
+    source = make_invoices(1, folder="b")
+    router = etp.OutputRouter(root=str(tmp_path / "pdf"), path="", name="{number}", collision="error")
+
+    jobs = list(etp.iter_jobs(source, etp.parse_range("1"), "1", router=router))
+    assert [job.rejected is None for job in jobs] == [True, False]
+    assert isinstance(jobs[1].rejected, etp.ConversionError)
+
+
+@pytest.mark.parametrize("options", [{"name": "{yaer}"}, {"path": "{number:>"}, {"path": 5},
+                                     {"collision": "rename"}])
+def test_invalid_settings_are_rejected_up_front(options):
+    with pytest.raises(ValueError):
+        etp.OutputRouter(**options)
+
+
+def test_background_writers_deliver_pdfs(make_invoices, tmp_path):
+    source = make_invoices(1, 2, 3, folder="x")
+    root = tmp_path / "pdf"
+
+    summary = etp.process_excel_files(
+        source, etp.parse_range("1-3"), "1", workers=2, cost_model=False, dedup=None,
+        output={"root": str(root), "path": "{subdir}", "writers": 2},
+        backend_factory=lambda: etp.StubBackend(latency=0, jitter=0))
+
+    assert summary.converted == 3
+    assert sorted(os.listdir(root / "x")) == ["invoice 1.pdf", "invoice 2.pdf", "invoice 3.pdf"]
+    assert (root / "x" / "invoice 1.pdf").read_bytes().startswith(b"%PDF")
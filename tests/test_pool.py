@@ -0,0 +1,71 @@
+import os
+
+import ExcelToPdf as etp
+
+
+class SlowFirstBackend(etp.StubBackend):
+    """Первая книга конвертируется дольше остальных, последняя падает."""
+
+    def __init__(self, started):
+        super().__init__(latency=0, jitter=0)
+        self.started = started
+        started.append(self)
+
+    def convert(self, file_path, outputs, plan=None):
+        name = os.path.basename(file_path)
+        if name == "invoice 1.xlsx":
+            self.latency = 0.3
+        if name == "invoice 6.xlsx":
+            raise etp.ConversionError("сбой книги")
+        try:
+            return super().convert(file_path, outputs, plan)
+        finally:
+            self.latency = 0
+
+
+def make_jobs(source, tmp_path, numbers):
+    return [etp.ConversionJob(i, os.path.join(source, f"invoice {n}.xlsx"),
+                              [("1", str(tmp_path / f"invoice {n}.pdf"))])
+            for i, n in enumerate(numbers)]
+
+
+def test_results_are_published_in_job_order(tmp_path, make_invoices):
+    source = make_invoices(1, 2, 3, 4, 5, 6)
+    jobs = make_jobs(source, tmp_path, [1, 2, 3, 4, 5, 6])
+    started, published, completed = [], [], []
+
+    results = etp.run_conversion_pool(
+        jobs, lambda: SlowFirstBackend(started), workers=3,
+        on_result=lambda r: published.append(r.job.index),
+        on_complete=lambda r: completed.append(r.job.index))
+
+    assert [r.job.index for r in results] == published == [0, 1, 2, 3, 4, 5]
+    # on_complete не ждёт медленную первую книгу
+    assert completed[0] != 0 and sorted(completed) == published
+    assert [r.ok for r in results] == [True] * 5 + [False]
+    assert results[5].error == "сбой книги"
+    assert all(os.path.exists(p) for job in jobs[:5] for p in job.pdf_paths)
+    assert not os.path.exists(jobs[5].pdf_paths[0])
+
+
+def test_engines_are_not_started_for_more_workers_than_jobs(tmp_path, make_invoices):
+    source = make_invoices(2, 3)
+    started = []
+
+    results = etp.run_conversion_pool(make_jobs(source, tmp_path, [2, 3]),
+                                      lambda: SlowFirstBackend(started), workers=8)
+
+    assert all(r.ok for r in results)
+    assert 1 <= len(started) <= 2
+
+
+def test_rejected_jobs_do_not_start_an_engine(tmp_path, make_invoices):
+    source = make_invoices(2)
+    jobs = make_jobs(source, tmp_path, [2])
+    jobs[0].rejected = etp.MissingSheetsError("нет листа Invoice")
+    started = []
+
+    [result] = etp.run_conversion_pool(jobs, lambda: SlowFirstBackend(started), workers=2)
+
+    assert not result.ok and result.error == "нет листа Invoice"
+    assert started == []
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+import ExcelToPdf as etp
+from benchmark import write_workbook
+
+SHEETS = [("Invoice", "visible", "A1:H40"), ("Specification", "visible", "A1:J60"),
+          ("Calc", "hidden", None)]
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = str(tmp_path / "invoice 1.xlsx")
+    write_workbook(path, SHEETS)
+    return path
+
+
+def test_plan_is_read_without_an_engine(workbook):
+    plan = etp.prescan_workbook(workbook, ["1"])
+
+    assert [(sheet.name, sheet.visible) for sheet in plan.sheets] == \
+        [("Invoice", True), ("Specification", True), ("Calc", False)]
+    assert sorted(value for value in plan.print_areas.values() if value) == ["A1:H40", "A1:J60"]
+
+
+def test_xls_is_left_to_the_engine(tmp_path):
+    path = tmp_path / "invoice 1.xls"
+    path.write_bytes(b"not a zip")
+    assert etp.prescan_workbook(str(path), ["1"]) is None
+
+
+def test_unusable_books_are_rejected(tmp_path):
+    missing = str(tmp_path / "invoice 1.xlsx")
+    write_workbook(missing, [("Invoice", "visible", "A1:H40")])
+    broken = tmp_path / "invoice 2.xlsx"
+    broken.write_bytes(b"PK broken")
+
+    with pytest.raises(etp.MissingSheetsError):
+        etp.prescan_workbook(missing, ["1"])
+    with pytest.raises(etp.InvalidWorkbookError):
+        etp.prescan_workbook(str(broken), ["1"])
+
+
+def test_cached_plan_skips_the_zip(workbook, tmp_path, monkeypatch):
+    cache = etp.PrescanCache(str(tmp_path / "cache.json"))
+    first = etp.prescan_workbook(workbook, ["1"], cache)
+    cache.save()
+
+    def no_zip(*args):
+        raise AssertionError("книга открыта повторно")
+
+    loaded = etp.PrescanCache(str(tmp_path / "cache.json")).load()
+    with monkeypatch.context() as m:
+        m.setattr(etp, "_XlsxWorkbook", no_zip)
+        assert etp.prescan_workbook(workbook, ["1"], loaded) == first
+
+    # Изменённая книга разбирается заново
+    write_workbook(workbook, [("Invoice", "visible", "A1:B2"), ("Specification", "visible", None)])
+    os.utime(workbook, ns=(0, 0))
+    plan = etp.prescan_workbook(workbook, ["1"], loaded)
+    assert "A1:B2" in plan.print_areas.values() and "A1:H40" not in plan.print_areas.values()
+
+
+class PlannedBackend(etp.StubBackend):
+    """Заглушка, которой нельзя читать метаданные: всё должно прийти из плана."""
+
+    def open_workbook(self, file_path):
+        return etp._XlsxWorkbook(file_path, file_path)
+
+    def list_sheets(self, wb):
+        raise AssertionError("листы прочитаны из открытой книги")
+
+    def read_cell(self, wb, sheet, address):
+        raise AssertionError("ячейка прочитана из открытой книги")
+
+    def get_print_area(self, wb, sheet):
+        return ""
+
+    def set_print_area(self, wb, sheet, area):
+        pass
+
+    def export_pdf(self, wb, sheets, pdf_path):
+        with open(pdf_path, "wb") as f:
+            f.write(etp.stub_pdf_bytes(pdf_path))
+
+    def close_workbook(self, wb):
+        pass
+
+
+def test_convert_uses_the_plan(workbook, tmp_path):
+    plan = etp.prescan_workbook(workbook, ["1"])
+    info = etp.convert_workbook(PlannedBackend(latency=0, jitter=0), workbook,
+                                [("1", str(tmp_path / "1.pdf"))], plan)
+    assert info["print_areas"] == {"Invoice": "A1:H40", "Specification": "A1:J60"}
+
+
+def test_rejected_book_never_reaches_the_engine(make_invoices):
+    source = make_invoices(1, 2)
+    with open(os.path.join(source, "invoice 2.xlsx"), "wb") as f:
+        f.write(b"PK broken")
+    converted = []
+
+    class Recording(etp.StubBackend):
+        def convert(self, file_path, outputs, plan=None):
+            converted.append((os.path.basename(file_path), plan is not None))
+            return super().convert(file_path, outputs, plan)
+
+    summary = etp.process_excel_files(
+        source, etp.parse_range("1-2"), "1", cost_model=False, dedup=None, prescan=True,
+        backend_factory=lambda: Recording(latency=0, jitter=0))
+
+    assert converted == [("invoice 1.xlsx", True)]
+    assert summary.converted == 1 and summary.failed == 1
+    assert os.path.exists(etp.PRESCAN_FILE)
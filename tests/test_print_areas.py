@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+import ExcelToPdf as etp
+
+PROFILES = etp.compile_profiles({"profiles": {
+    "asis": {"suffix": " asis", "sheets": [{"index": 1}, {"index": 2}], "print_area": None},
+}})
+
+
+class RecordingBackend(etp._XlsxReader, etp.Backend):
+    """Читает xlsx как LibreOfficeBackend и запоминает области печати листов при экспорте."""
+
+    def __init__(self, fail_set=()):
+        self.exports = {}
+        self.fail_set = fail_set
+
+    def open_workbook(self, file_path):
+        return etp._XlsxWorkbook(file_path, file_path)
+
+    def set_print_area(self, wb, sheet, area):
+        if area in self.fail_set:
+            raise etp.ConversionError("COM отказал")
+        super().set_print_area(wb, sheet, area)
+
+    def export_pdf(self, wb, sheets, pdf_path):
+        self.exports[os.path.basename(pdf_path)] = {
+            sheet.index: self.get_print_area(wb, sheet) for sheet in sheets}
+        with open(pdf_path, "wb") as f:
+            f.write(etp.stub_pdf_bytes(pdf_path))
+
+
+class ExcelLikeBackend(RecordingBackend):
+    """Области печати хранятся в листах, как в Excel: у листа 1 она задана в файле."""
+
+    def open_workbook(self, file_path):
+        wb = super().open_workbook(file_path)
+        wb.areas = {1: "$A$1:$C$3", 2: ""}
+        return wb
+
+    def get_print_area(self, wb, sheet):
+        return wb.areas[sheet.index]
+
+    def set_print_area(self, wb, sheet, area):
+        if area in self.fail_set:
+            raise etp.ConversionError("COM отказал")
+        wb.areas[sheet.index] = area
+
+
+@pytest.fixture
+def workbook(make_invoices):
+    return os.path.join(make_invoices(1), "invoice 1.xlsx")
+
+
+def convert(backend, workbook, tmp_path, modes):
+    outputs = [(mode, str(tmp_path / f"{mode}.pdf")) for mode in modes]
+    with etp.use_profiles(PROFILES):
+        return etp.convert_workbook(backend, workbook, outputs)
+
+
+@pytest.mark.parametrize("backend_cls", [RecordingBackend, ExcelLikeBackend])
+def test_profile_output_does_not_depend_on_other_profiles(backend_cls, workbook, tmp_path):
+    alone = backend_cls()
+    convert(alone, workbook, tmp_path, ["asis"])
+    together = backend_cls()
+    info = convert(together, workbook, tmp_path, ["1", "asis", "1"])
+
+    assert together.exports["asis.pdf"] == alone.exports["asis.pdf"]
+    assert together.exports["1.pdf"] == {1: "A1:H40", 2: "A1:J60"}
+    assert info["print_areas"] == {"Invoice": "A1:H40", "Specification": "A1:J60"}
+    assert info["warnings"] == []
+
+
+def test_excel_original_area_is_restored(workbook, tmp_path):
+    backend = ExcelLikeBackend()
+    convert(backend, workbook, tmp_path, ["2", "asis"])
+    assert backend.exports["asis.pdf"] == {1: "$A$1:$C$3", 2: ""}
+
+
+def test_print_area_failures_become_warnings(workbook, tmp_path):
+    backend = RecordingBackend(fail_set=("A1:J60",))
+    profiles = etp.compile_profiles({"profiles": {
+        "broken": {"sheets": [{"index": 1, "print_area": {"named": "Нет такого"}}, {"index": 2}]},
+    }})
+
+    with etp.use_profiles(profiles):
+        info = etp.convert_workbook(backend, workbook, [("broken", str(tmp_path / "b.pdf"))])
+
+    assert backend.exports["b.pdf"] == {1: None, 2: None}
+    assert info["warnings"] == ["Specification: не задана область печати A1:J60: COM отказал"]
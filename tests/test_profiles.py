@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+import ExcelToPdf as etp
+from benchmark import write_workbook
+
+SHEETS = [("Invoice", "visible", "A1:H40"), ("Specification", "visible", "A1:J60"),
+          ("Weight certificate (LI)", "hidden", None), ("Weight certificate (Y)", "visible", "A1:F20"),
+          ("Calc", "hidden", None)]
+
+
+class CountingBackend(etp._XlsxReader, etp.Backend):
+    """Читает xlsx без Excel, считает открытия книги и запоминает листы каждого PDF."""
+
+    def __init__(self):
+        self.opened = 0
+        self.exports = {}
+
+    def open_workbook(self, file_path):
+        self.opened += 1
+        return etp._XlsxWorkbook(file_path, file_path)
+
+    def export_pdf(self, wb, sheets, pdf_path):
+        self.exports[os.path.basename(pdf_path)] = [sheet.name for sheet in sheets]
+        with open(pdf_path, "wb") as f:
+            f.write(etp.stub_pdf_bytes(pdf_path))
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = str(tmp_path / "invoice 1.xlsx")
+    write_workbook(path, SHEETS)
+    return path
+
+
+def test_all_profiles_from_one_open(workbook, tmp_path):
+    backend = CountingBackend()
+    outputs = [(mode, str(tmp_path / f"{mode}.pdf")) for mode in ("invoice", "1", "2")]
+
+    info = etp.convert_workbook(backend, workbook, outputs)
+
+    assert backend.opened == 1
+    assert backend.exports == {
+        "invoice.pdf": ["Invoice"],
+        "1.pdf": ["Invoice", "Specification"],
+        "2.pdf": ["Invoice", "Specification", "Weight certificate (Y)"],
+    }
+    assert info["print_areas"]["Weight certificate (Y)"] == "A1:F20"
+
+
+def test_required_sheet_is_missing(tmp_path):
+    path = str(tmp_path / "invoice 1.xlsx")
+    write_workbook(path, [("Invoice", "visible", "A1:H40")])
+
+    with pytest.raises(etp.MissingSheetsError):
+        etp.convert_workbook(CountingBackend(), path, [("1", str(tmp_path / "1.pdf"))])
+
+
+def test_parse_modes():
+    assert etp.parse_modes("2, 1,2") == ["2", "1"]
+    assert etp.parse_modes(["invoice", 1]) == ["invoice", "1"]
+    for mode in ("", " , ", "9", "1,customs"):
+        with pytest.raises(ValueError):
+            etp.parse_modes(mode)
+
+
+def test_profile_suffixes_only_with_several_profiles(make_invoices):
+    source = make_invoices(1)
+
+    [single] = etp.iter_jobs(source, etp.parse_range("1"), "2")
+    [several] = etp.iter_jobs(source, etp.parse_range("1"), "invoice,1")
+
+    assert [os.path.basename(p) for p in single.pdf_paths] == ["invoice 1.pdf"]
+    assert [os.path.basename(p) for p in several.pdf_paths] == \
+        ["invoice 1 invoice.pdf", "invoice 1 spec.pdf"]
+
+
+def test_custom_profile_from_config(workbook, tmp_path):
+    profiles = etp.compile_profiles({"profiles": {
+        "1": {"suffix": "_full"},
+        "customs": {"suffix": " customs",
+                    "sheets": [{"regex": "^Weight", "visible": True}, {"index": 1}]},
+    }})
+    backend = CountingBackend()
+
+    with etp.use_profiles(profiles):
+        assert profiles["1"].suffix == "_full"
+        etp.convert_workbook(backend, workbook, [("customs", str(tmp_path / "c.pdf"))])
+
+    assert backend.exports["c.pdf"] == ["Invoice", "Weight certificate (Y)"]
+
+
+@pytest.mark.parametrize("spec", [{"sheets": []}, {"sheets": [{"index": 1, "name": "x"}]},
+                                  {"sheets": [{"index": 1}], "order": "random"},
+                                  {"sheets": [{"index": 1}], "print_area": [{"cell": "R1", "x": 1}]}])
+def test_invalid_profiles_are_rejected(spec):
+    with pytest.raises(ValueError):
+        etp.compile_profiles({"profiles": {"bad": spec}})
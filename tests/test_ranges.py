@@ -0,0 +1,88 @@
+import random
+import time
+
+import pytest
+
+import ExcelToPdf as etp
+
+INF = float("inf")
+
+
+def random_spec(rnd):
+    """Случайная строка диапазона и её элементы (начало, конец, шаг, исключение)."""
+    items = []
+    for _ in range(rnd.randint(1, 6)):
+        start = rnd.randint(0, 120)
+        kind = rnd.choice(["single", "range", "open", "stepped"])
+        end = {"single": start, "open": INF}.get(kind, start + rnd.randint(0, 60))
+        step = rnd.randint(2, 5) if kind == "stepped" else 1
+        items.append((start, end, step, rnd.random() < 0.35))
+
+    def fmt(start, end, step, exclude):
+        text = str(start) if start == end and step == 1 else \
+            f"{start}-" if end == INF else f"{start}-{end}"
+        return ("!" if exclude else "") + text + (f"/{step}" if step != 1 else "")
+
+    return ",".join(fmt(*item) for item in items), items
+
+
+def brute_force(items, limit):
+    def matches(number, start, end, step):
+        return start <= number <= end and (number - start) % step == 0
+
+    return {n for n in range(limit)
+            if any(matches(n, s, e, st) for s, e, st, ex in items if not ex)
+            and not any(matches(n, s, e, st) for s, e, st, ex in items if ex)}
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_interval_set_matches_brute_force(seed):
+    rnd = random.Random(seed)
+    spec, items = random_spec(rnd)
+    # За последним числом спецификации множество периодично (шаги до 5)
+    limit = 120 + 60 + 2 * 60
+    expected = brute_force(items, limit)
+    numbers = etp.parse_range(spec)
+
+    assert {n for n in range(limit) if n in numbers} == expected, spec
+    assert bool(numbers) == bool(expected), spec
+    if numbers.is_finite():
+        assert list(numbers) == sorted(expected), spec
+    else:
+        with pytest.raises(ValueError):
+            list(numbers)
+
+    existing = sorted(rnd.sample(range(limit), 150))
+    assert numbers.filter_sorted(existing) == sorted(expected.intersection(existing)), spec
+
+    reparsed = etp.parse_range(str(numbers))
+    assert {n for n in range(limit) if n in reparsed} == expected, spec
+
+
+@pytest.mark.parametrize("spec", ["abc", "5-3", "1-10/0", "!", "", " , "])
+def test_invalid_parts_are_skipped(spec):
+    assert not etp.parse_range(spec)
+
+
+def test_invalid_part_does_not_drop_valid_ones():
+    assert list(etp.parse_range("3550-3552, x, 3560, 3570-3560")) == [3550, 3551, 3552, 3560]
+
+
+@pytest.mark.parametrize("spec, first", [
+    ("1-/2,!1-/2", None),
+    ("1-200000000/2,!1-200000000/2", None),
+    ("1-,!1-/2,!2-/2", None),
+    ("1-/6,!1-/2,!3-/3", None),
+    ("1-,!1-", None),
+    ("1-,!1-/2,!2-/4", 4),
+    ("5-/10,!1-/4", 15),
+    ("1-200000000,!1-199999999", 200000000),
+    ("3-/1000003,!3-/7,!3-/11", 1000006),
+])
+def test_emptiness_is_computed_without_walking_the_range(spec, first):
+    started = time.perf_counter()
+    numbers = etp.parse_range(spec)
+
+    assert bool(numbers) == (first is not None)
+    assert numbers._next(0) == first
+    assert time.perf_counter() - started < 1.0
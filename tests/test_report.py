@@ -0,0 +1,87 @@
+import csv
+import json
+import os
+import time
+
+import pytest
+
+import ExcelToPdf as etp
+
+
+def test_nested_stage_time_is_exclusive():
+    with etp.collect_stages() as timings:
+        with etp.stage("export"):
+            time.sleep(0.02)
+            with etp.stage("select"):
+                time.sleep(0.05)
+    assert timings["select"] >= 0.05
+    assert 0.02 <= timings["export"] < timings["select"]
+
+
+def test_stage_outside_collection_is_ignored():
+    with etp.stage("export"):
+        pass
+
+
+def test_failure_keeps_partial_timings():
+    with pytest.raises(etp.ConversionError) as error:
+        with etp.collect_stages():
+            with etp.stage("open"):
+                pass
+            raise etp.ConversionError("сбой")
+    assert set(error.value.timings) == {"open"}
+
+
+@pytest.mark.parametrize("values, q, expected", [
+    ([], 50, 0.0), ([3.0], 99, 3.0), ([1, 2, 3, 4], 50, 2), ([1, 2, 3, 4], 90, 4), ([5, 1, 3], 0, 1),
+])
+def test_percentile(values, q, expected):
+    assert etp.percentile(values, q) == expected
+
+
+def test_timings_come_back_through_the_watchdog(tmp_path):
+    managed = etp.ManagedBackend(lambda: etp.StubBackend(latency=0.01, jitter=0), timeout=5)
+    job = etp.ConversionJob(0, "invoice 1.xlsx", [("1", str(tmp_path / "invoice 1.pdf"))])
+    result = etp.convert_job(managed, job)
+    managed.close()
+    assert result.ok and result.timings["export"] >= 0.01
+
+
+class FailingSecond(etp.StubBackend):
+    def convert(self, file_path, outputs, plan=None):
+        if os.path.basename(file_path) == "invoice 2.xlsx":
+            raise etp.MissingSheetsError("нет листа Invoice")
+        return super().convert(file_path, outputs, plan)
+
+
+def run_batch(source, report_path):
+    return etp.process_excel_files(
+        source, etp.parse_range("1-3"), "1", report_path=report_path, cost_model=False, dedup=None,
+        backend_factory=lambda: FailingSecond(latency=0.01, jitter=0))
+
+
+def test_json_report(make_invoices, tmp_path):
+    source = make_invoices(1, 2, 3)
+    run_batch(source, str(tmp_path / "run.json"))
+
+    with open(tmp_path / "run.json", encoding="utf-8") as f:
+        report = json.load(f)
+    summary, files = report["summary"], report["files"]
+
+    assert summary["files"] == 3 and summary["failed"] == 1
+    assert summary["causes"] == {"sheets": {"count": 1, "files": [os.path.join(source, "invoice 2.xlsx")]}}
+    assert summary["stages"]["export"]["p50"] >= 0.01
+    ok = [f for f in files if f["ok"]]
+    assert len(ok) == 2 and all(f["pdf_size"] > 0 and f["source_size"] > 0 for f in ok)
+
+
+def test_csv_report(make_invoices, tmp_path):
+    source = make_invoices(1, 2, 3)
+    run_batch(source, str(tmp_path / "run.csv"))
+
+    with open(tmp_path / "run.csv", encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f, delimiter=";"))
+    assert [os.path.basename(row["file"]) for row in rows] == \
+        ["invoice 1.xlsx", "invoice 2.xlsx", "invoice 3.xlsx"]
+    assert [row["ok"] for row in rows] == ["1", "0", "1"]
+    assert rows[1]["category"] == "sheets" and float(rows[0]["export"]) >= 0.01
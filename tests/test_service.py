@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import ExcelToPdf as etp
+from etp_service import ConversionService, make_http_handler
+
+
+def stub_factory():
+    return etp.StubBackend(latency=0.01, jitter=0)
+
+
+@pytest.fixture
+def service():
+    service = ConversionService(stub_factory, workers=2)
+    service.start()
+    yield service
+    service.stop()
+
+
+@pytest.fixture
+def api(service):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_http_handler(service))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def request(method, path, body=None):
+        data = body if isinstance(body, bytes) or body is None else json.dumps(body).encode("utf-8")
+        req = urllib.request.Request(f"http://127.0.0.1:{server.server_port}{path}",
+                                     data=data, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+def wait_finished(get_status, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        record = get_status()
+        if record["status"] in ("done", "failed"):
+            return record
+        time.sleep(0.02)
+    raise AssertionError("задание не завершилось")
+
+
+def test_submitted_job_is_converted(service, make_invoices, tmp_path):
+    source = make_invoices(1, 2, 3)
+
+    record = service.submit(source, "1-2", "1,2", output_dir=str(tmp_path / "out"))
+    assert record["matched"] == 2 and len(record["files"]) == 2
+
+    record = wait_finished(lambda: service.status(record["id"]))
+    assert record["status"] == "done"
+    pdfs = [pdf for entry in record["files"] for pdf in entry["pdf"]]
+    assert len(pdfs) == 4 and all(os.path.exists(pdf) for pdf in pdfs)
+    assert service.health()["workers"] == 2
+
+
+def test_submit_rejects_missing_folder(service, tmp_path):
+    with pytest.raises(ValueError):
+        service.submit(str(tmp_path / "missing"), "1-2", "1")
+
+
+def test_http_api(api, make_invoices):
+    source = make_invoices(1, 2)
+
+    status, record = api("POST", "/jobs", {"source": source, "range": "1-2", "mode": "1"})
+    assert status == 202
+
+    record = wait_finished(lambda: api("GET", f"/jobs/{record['id']}")[1])
+    assert record["status"] == "done"
+    assert [entry["status"] for entry in record["files"]] == ["done", "done"]
+
+    status, jobs = api("GET", "/jobs")
+    assert status == 200 and [job["id"] for job in jobs] == [record["id"]]
+    assert api("GET", "/health")[1]["workers"] == 2
+    assert api("GET", "/jobs/404")[0] == 404
+
+
+@pytest.mark.parametrize("body", [b"[1]", b"{not json", {"source": "/no/such/folder", "range": "1"},
+                                  {"source": ".", "range": "abc"}, {"range": "1", "mode": "9"}])
+def test_http_api_rejects_bad_requests(api, body):
+    status, payload = api("POST", "/jobs", body)
+    assert status == 400 and payload["error"]
+
+
+class GatedBackend(etp.StubBackend):
+    """Движок запускается, только когда открыт gate; с fail запуск падает."""
+
+    def __init__(self, gate, fail=False):
+        super().__init__(latency=0, jitter=0)
+        self.gate = gate
+        self.fail = fail
+
+    def start(self):
+        self.gate.wait(10)
+        if self.fail:
+            raise etp.ConversionError("Excel не запускается")
+        super().start()
+
+
+def test_jobs_are_accepted_while_engines_start(make_invoices):
+    gate = threading.Event()
+    service = ConversionService(lambda: GatedBackend(gate), workers=2)
+    service.start()
+    try:
+        assert service.accepting()
+        assert service.health()["workers"] == 0 and service.health()["starting"] == 2
+        record = service.submit(make_invoices(1, 2), "1-2", "1")
+        assert record["status"] == "queued"
+
+        gate.set()
+        assert wait_finished(lambda: service.status(record["id"]))["status"] == "done"
+        assert service.health()["workers"] == 2 and service.health()["starting"] == 0
+    finally:
+        gate.set()
+        service.stop()
+
+
+def test_submissions_are_refused_when_no_engine_starts(make_invoices):
+    gate = threading.Event()
+    gate.set()
+    service = ConversionService(lambda: GatedBackend(gate, fail=True), workers=2)
+    service.start()
+    for thread in service._threads:
+        thread.join(10)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_http_handler(service))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        assert not service.accepting()
+        url = f"http://127.0.0.1:{server.server_port}"
+        with pytest.raises(urllib.error.HTTPError) as health:
+            urllib.request.urlopen(f"{url}/health", timeout=10)
+        assert health.value.code == 503
+        body = json.dumps({"source": make_invoices(1), "range": "1", "mode": "1"}).encode("utf-8")
+        with pytest.raises(urllib.error.HTTPError) as post:
+            urllib.request.urlopen(urllib.request.Request(f"{url}/jobs", data=body), timeout=10)
+        assert post.value.code == 503
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.stop()
+
+
+def test_finished_jobs_are_evicted_above_the_cap(make_invoices):
+    source = make_invoices(1)
+    service = ConversionService(stub_factory, max_jobs=2)
+    service.start()
+    try:
+        ids = []
+        for _ in range(3):
+            record = service.submit(source, "1", "1")
+            wait_finished(lambda: service.status(record["id"]))
+            ids.append(record["id"])
+        assert [job["id"] for job in service.list_jobs()] == ids[1:]
+        assert service.status(ids[0]) is None
+    finally:
+        service.stop()
+
+
+def test_finished_jobs_expire(make_invoices):
+    source = make_invoices(1)
+    service = ConversionService(stub_factory, job_ttl=0.05)
+    service.start()
+    try:
+        record = service.submit(source, "1", "1")
+        wait_finished(lambda: service.status(record["id"]))
+        assert service.status(record["id"]) is not None
+        time.sleep(0.1)
+        assert service.list_jobs() == [] and service.health()["jobs"] == 0
+    finally:
+        service.stop()
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+
+import ExcelToPdf as etp
+from etp_queue import SharedQueue, run_worker
+
+
+def stub_factory():
+    return etp.StubBackend(latency=0.01, jitter=0)
+
+
+def publish_one(queue, source, pdf_path):
+    job = etp.ConversionJob(0, os.path.join(source, "invoice 1.xlsx"), [("1", pdf_path)])
+    return queue.publish([job]), job
+
+
+def test_expired_lease_is_reclaimed(tmp_path, make_invoices):
+    source = make_invoices(1)
+    queue = SharedQueue(str(tmp_path / "jobs.db"))
+    batch_id, job = publish_one(queue, source, str(tmp_path / "invoice 1.pdf"))
+
+    job_id, _ = queue.claim("crashed", lease=0.05)
+    assert queue.claim("alive", lease=60) is None
+    time.sleep(0.1)
+    reclaimed = queue.claim("alive", lease=60)
+    assert reclaimed is not None and reclaimed[0] == job_id
+
+    # Результат воркера, потерявшего аренду, не записывается
+    queue.complete(job_id, "crashed", etp.ConversionResult(job, False, "поздно", 1.0))
+    assert queue.counts(batch_id) == {"leased": 1}
+    queue.complete(job_id, "alive", etp.ConversionResult(job, True, "", 1.0))
+
+    [result] = queue.wait(batch_id, [job], poll=0.05)
+    assert result.ok and result.attempts == 2
+
+
+def test_job_fails_after_max_attempts(tmp_path, make_invoices):
+    source = make_invoices(1)
+    queue = SharedQueue(str(tmp_path / "jobs.db"), max_attempts=2)
+    batch_id, job = publish_one(queue, source, str(tmp_path / "invoice 1.pdf"))
+
+    for worker in ("first", "second"):
+        assert queue.claim(worker, lease=0.01) is not None
+        time.sleep(0.05)
+    assert queue.claim("third", lease=60) is None
+
+    [result] = queue.wait(batch_id, [job], poll=0.05)
+    assert not result.ok and result.category == "engine"
+
+
+def test_worker_finishes_job_of_crashed_worker(tmp_path, make_invoices):
+    source = make_invoices(1)
+    queue_path = str(tmp_path / "jobs.db")
+    queue = SharedQueue(queue_path)
+    pdf_path = str(tmp_path / "out" / "invoice 1.pdf")
+    batch_id, job = publish_one(queue, source, pdf_path)
+    queue.claim("crashed", lease=0.05)
+    time.sleep(0.1)
+
+    counters = run_worker(queue_path, stub_factory, idle_exit=0.5, poll=0.05)
+
+    assert counters["done"] == 1 and counters["failed"] == 0
+    assert os.path.exists(pdf_path)
+    assert queue.counts(batch_id) == {"done": 1}
+
+
+def test_worker_creates_output_dirs(tmp_path, make_invoices):
+    source = make_invoices(1, 2, folder="2024")
+    queue_path = str(tmp_path / "jobs.db")
+    output_dir = tmp_path / "newout"
+    worker = threading.Thread(target=run_worker, args=(queue_path, stub_factory, 2),
+                              kwargs={"idle_exit": 5, "poll": 0.05})
+    worker.start()
+    try:
+        summary = etp.process_excel_files(
+            source, etp.parse_range("1-2"), "1", output_dir=str(output_dir),
+            shared_queue=SharedQueue(queue_path), cost_model=False, dedup=None)
+    finally:
+        worker.join()
+
+    assert summary.converted == 2 and summary.failed == 0
+    assert sorted(os.listdir(output_dir / "2024")) == ["invoice 1.pdf", "invoice 2.pdf"]
+
+
+class BrokenBackend(etp.StubBackend):
+    def start(self):
+        raise etp.ConversionError("Excel не запускается")
+
+
+def test_worker_without_engine_reports_failure(tmp_path, make_invoices, monkeypatch):
+    source = make_invoices(1)
+    queue_path = str(tmp_path / "jobs.db")
+    queue = SharedQueue(queue_path)
+    batch_id, _ = publish_one(queue, source, str(tmp_path / "invoice 1.pdf"))
+
+    counters = run_worker(queue_path, BrokenBackend, workers=2, idle_exit=0.2, poll=0.05)
+    assert counters["engine_errors"] == 2 and counters["engines"] == 0
+    # Задание вернулось в очередь для других воркеров
+    assert queue.counts(batch_id) == {"queued": 1}
+
+    monkeypatch.setattr(etp, "create_backend_factory", lambda config: BrokenBackend)
+    args = etp.build_arg_parser().parse_args(["--worker", queue_path, "--idle-exit", "1"])
+    assert etp.run_batch(args) == etp.EXIT_CRITICAL
@@ -0,0 +1,104 @@
+import os
+import time
+
+import pytest
+
+import ExcelToPdf as etp
+from benchmark import write_workbook
+from etp_watch import FolderWatcher
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    """Пути, у которых FolderWatcher сравнивал mtime и размер."""
+    calls = []
+    signature = FolderWatcher._signature
+
+    def tracking(path):
+        calls.append(os.path.basename(path))
+        return signature(path)
+
+    monkeypatch.setattr(FolderWatcher, "_signature", staticmethod(tracking))
+    return calls
+
+
+def touch_dir(path, ns):
+    """Сдвигает mtime папки: в тестах изменения идут быстрее разрешения часов файловой системы."""
+    os.utime(path, ns=(ns, ns))
+
+
+def test_existing_books_are_not_converted(make_invoices):
+    watcher = FolderWatcher(make_invoices(1, 2), debounce=0)
+    assert watcher.poll() == []
+
+
+def test_new_book_is_ready_after_debounce(make_invoices):
+    source = make_invoices(1)
+    watcher = FolderWatcher(source, debounce=0)
+    make_invoices(2)
+    touch_dir(source, 10 ** 18)
+
+    assert watcher.poll() == [os.path.join(source, "invoice 2.xlsx")]
+    assert watcher.poll() == []
+
+
+def test_incomplete_book_waits(make_invoices):
+    source = make_invoices(1)
+    watcher = FolderWatcher(source, debounce=0.05)
+    path = os.path.join(source, "invoice 2.xlsx")
+    with open(path, "wb") as f:
+        f.write(b"PK\x03\x04 partial")
+    touch_dir(source, 10 ** 18)
+
+    assert watcher.poll() == []
+    time.sleep(0.1)
+    assert watcher.poll() == [] and path in watcher.pending
+
+    make_invoices(2)
+    assert watcher.poll() == []
+    time.sleep(0.1)
+    assert watcher.poll() == [path]
+
+
+def test_only_changed_folders_are_statted(make_invoices, stats):
+    make_invoices(*range(1, 21), folder="old")
+    source = make_invoices(100, folder="new")
+    watcher = FolderWatcher(source, debounce=0)
+    make_invoices(101, folder="new")
+    path = os.path.join(source, "new", "invoice 101.xlsx")
+    touch_dir(os.path.dirname(path), 10 ** 18)
+    stats.clear()
+
+    assert watcher.poll() == [path]
+    assert sorted(set(stats)) == ["invoice 100.xlsx", "invoice 101.xlsx"]
+
+    stats.clear()
+    assert watcher.poll() == [] and stats == []
+
+
+def test_overwrite_in_place_is_found_by_full_rescan(make_invoices):
+    source = make_invoices(1, 2)
+    watcher = FolderWatcher(source, debounce=0, rescan=3600)
+    path = os.path.join(source, "invoice 2.xlsx")
+    mtime = os.stat(source).st_mtime_ns
+    write_workbook(path, [("Invoice", "visible", "A1:H40"), ("Extra", "visible", None)])
+    touch_dir(source, mtime)
+
+    assert watcher.poll() == []
+    watcher.rescan = 0
+    assert watcher.poll() == [path]
+
+
+def test_stale_books_are_caught_up(make_invoices):
+    source = make_invoices(1, 2)
+    stale = os.path.join(source, "invoice 2.xlsx")
+    watcher = FolderWatcher(source, debounce=0, stale=lambda path: path == stale, rescan=0)
+
+    assert watcher.catch_up == 1
+    assert watcher.poll() == [stale]
+
+
+def test_index_keeps_paths_in_one_form(make_invoices):
+    source = make_invoices(1, folder="a")
+    watcher = FolderWatcher(source, debounce=0)
+    assert watcher._dir_files("a") == etp.InvoiceIndex(source).refresh().paths()